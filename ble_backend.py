@@ -0,0 +1,63 @@
+import os
+
+BACKEND_ENVIRONMENT_VARIABLE = "TREADMILL_BLE_BACKEND"
+
+_backend = None
+
+
+def use(backend) -> None:
+    """Route scanners and clients through `backend` (e.g. a fake_ble.FakeBackend); None restores bleak."""
+    global _backend
+    _backend = backend
+
+
+def _selected():
+    global _backend
+    if _backend is None and os.environ.get(BACKEND_ENVIRONMENT_VARIABLE) == "fake":
+        import fake_ble
+        _backend = fake_ble.FakeBackend.default()
+    return _backend
+
+
+def scanner_class():
+    backend = _selected()
+    if backend is not None:
+        return backend.scanner_factory
+    from bleak import BleakScanner
+    return BleakScanner
+
+
+def client_class():
+    backend = _selected()
+    if backend is not None:
+        return backend.client_factory
+    from bleak import BleakClient
+    return BleakClient
+
+
+def scanner(*args, **kwargs):
+    return scanner_class()(*args, **kwargs)
+
+
+def client(*args, **kwargs):
+    return client_class()(*args, **kwargs)
+
+
+def device_not_found_error():
+    """
+    bleak's BleakDeviceNotFoundError, imported on first use.
+
+    Callers write `except ble_backend.device_not_found_error():`, which is
+    only evaluated once an exception is already propagating.
+    """
+    from bleak.exc import BleakDeviceNotFoundError
+    return BleakDeviceNotFoundError
+
+
+def link_errors():
+    """
+    Exceptions a GATT read or write raises when the link fails: bleak's
+    BleakError and OSError, as a tuple for `except ble_backend.link_errors():`.
+    """
+    from bleak.exc import BleakError
+    return BleakError, OSError
@@ -1,10 +1,9 @@
-import asyncio
-from bleak import BleakScanner
 from textual import on
 from textual.app import ComposeResult
 from textual.containers import Horizontal, Container
 from textual.screen import ModalScreen
 from textual.widgets import RadioSet, Label, Button, RadioButton
+from discovery import DiscoveredDevice, DiscoveryService
 
 
 class BluetoothDevicePicker(ModalScreen):
@@ -12,11 +11,12 @@ class BluetoothDevicePicker(ModalScreen):
     def __init__(self, uuid_filter: str = None):
         super().__init__()
         self.uuid_filter = uuid_filter
+        self.discovered_devices = []
+        self.device_indexes = {}  # Address to radio button index
+        self.discovery = DiscoveryService([uuid_filter] if uuid_filter else None, on_new=self.device_discovered)
 
     uuid_filter: str
     selected_device_index: int = None
-    scanner: BleakScanner = None
-    discovered_devices = []
 
     def compose(self) -> ComposeResult:
         with Container():
@@ -26,26 +26,28 @@ class BluetoothDevicePicker(ModalScreen):
                 yield Button.success("Yes", id="yes")
                 yield Button.error("No", id="no")
 
-    async def on_mount(self) -> None:
-
-        def callback(device, advertising_data):
-            if device.address not in [d.address for d in self.discovered_devices]:
-                self.discovered_devices.append(device)
-                radio_button = RadioButton(device.name)
-                self.query_one(RadioSet).mount(radio_button)
-                if len(self.discovered_devices) == 1:
-                    radio_button.value = True
-            pass
+    def device_discovered(self, entry: DiscoveredDevice) -> None:
+        index = self.device_indexes.get(entry.address)
+        if index is not None:
+            # Evicted and seen again: keep the existing button
+            self.discovered_devices[index] = entry.device
+            return
+        self.device_indexes[entry.address] = len(self.discovered_devices)
+        self.discovered_devices.append(entry.device)
+        radio_button = RadioButton(entry.name or entry.address)
+        self.query_one(RadioSet).mount(radio_button)
+        if len(self.discovered_devices) == 1:
+            radio_button.value = True
 
-        self.scanner = BleakScanner(callback, [self.uuid_filter])
-        await self.scanner.start()
+    async def on_mount(self) -> None:
+        await self.discovery.start()
 
     def on_radio_set_changed(self, event: RadioSet.Changed) -> None:
         self.selected_device_index = event.radio_set.pressed_index
 
     @on(Button.Pressed)
     async def on_button_pressed(self, event: Button.Pressed) -> None:
-        await self.scanner.stop()
+        await self.discovery.stop()
         if event.button.id == "yes" and self.selected_device_index is not None:
             self.dismiss(self.discovered_devices[self.selected_device_index])
         else:
@@ -0,0 +1,40 @@
+import string
+
+from bt_uuids import normalize_uuid_str
+
+SERVICE_UUID = "180a"
+BATTERY_SERVICE_UUID = "180f"
+BATTERY_LEVEL_CHARACTERISTIC_UUID = "2a19"
+CHARACTERISTIC_UUIDS = {
+    "Manufacturer Name": "2a29",
+    "Model Number": "2a24",
+    "Serial Number": "2a25",
+    "Hardware Revision": "2a27",
+    "Firmware Revision": "2a26",
+    "Software Revision": "2a28",
+    "System ID": "2a23",
+}
+
+
+def service_uuid():
+    return normalize_uuid_str(SERVICE_UUID)
+
+
+def battery_service_uuid():
+    return normalize_uuid_str(BATTERY_SERVICE_UUID)
+
+
+def battery_level_uuid():
+    return normalize_uuid_str(BATTERY_LEVEL_CHARACTERISTIC_UUID)
+
+
+def parse_string(data):
+    return ''.join(filter(lambda x: x in string.printable, bytes(data).decode('utf-8', errors='replace')))
+
+
+def parse_system_id(data):
+    return '-'.join(f"{byte:02x}" for byte in data)
+
+
+def parse_battery_level(data):
+    return int(data[0])
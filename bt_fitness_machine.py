@@ -0,0 +1,410 @@
+import operator
+import struct
+from typing import NamedTuple, Optional, Sequence
+
+from bt_uuids import normalize_uuid_str
+
+SERVICE_UUID = "1826"
+FEATURE_CHARACTERISTIC_UUID = "2acc"
+TREADMILL_DATA_CHARACTERISTIC_UUID = "2acd"
+TRAINING_STATUS_CHARACTERISTIC_UUID = "2ad3"
+SUPPORTED_SPEED_RANGE_CHARACTERISTIC_UUID = "2ad4"
+SUPPORTED_INCLINATION_RANGE_CHARACTERISTIC_UUID = "2ad5"
+CONTROL_POINT_CHARACTERISTIC_UUID = "2ad9"
+STATUS_CHARACTERISTIC_UUID = "2ada"
+
+# Fitness Machine Features (first 32 bits of 0x2ACC)
+FEATURE_AVERAGE_SPEED = 1 << 0
+FEATURE_CADENCE = 1 << 1
+FEATURE_TOTAL_DISTANCE = 1 << 2
+FEATURE_INCLINATION = 1 << 3
+FEATURE_ELEVATION_GAIN = 1 << 4
+FEATURE_PACE = 1 << 5
+FEATURE_STEP_COUNT = 1 << 6
+FEATURE_RESISTANCE_LEVEL = 1 << 7
+FEATURE_STRIDE_COUNT = 1 << 8
+FEATURE_EXPENDED_ENERGY = 1 << 9
+FEATURE_HEART_RATE = 1 << 10
+FEATURE_METABOLIC_EQUIVALENT = 1 << 11
+FEATURE_ELAPSED_TIME = 1 << 12
+FEATURE_REMAINING_TIME = 1 << 13
+FEATURE_POWER_MEASUREMENT = 1 << 14
+FEATURE_FORCE_ON_BELT_AND_POWER_OUTPUT = 1 << 15
+
+# Treadmill Data (0x2ACD) flags
+FLAG_MORE_DATA = 1 << 0
+FLAG_AVERAGE_SPEED = 1 << 1
+FLAG_TOTAL_DISTANCE = 1 << 2
+FLAG_INCLINATION = 1 << 3
+FLAG_ELEVATION_GAIN = 1 << 4
+FLAG_INSTANTANEOUS_PACE = 1 << 5
+FLAG_AVERAGE_PACE = 1 << 6
+FLAG_EXPENDED_ENERGY = 1 << 7
+FLAG_HEART_RATE = 1 << 8
+FLAG_METABOLIC_EQUIVALENT = 1 << 9
+FLAG_ELAPSED_TIME = 1 << 10
+FLAG_REMAINING_TIME = 1 << 11
+FLAG_FORCE_ON_BELT_AND_POWER_OUTPUT = 1 << 12
+FLAGS_MASK = (1 << 13) - 1
+
+# Treadmill Data fields in wire order: (flag, feature, ((field, struct code, scale), ...)).
+# Instantaneous Speed is present when More Data is *cleared*, hence flag 0 below.
+_TREADMILL_FIELDS = (
+    (0, 0, (("instantaneous_speed_kmh", "H", 0.01),)),
+    (FLAG_AVERAGE_SPEED, FEATURE_AVERAGE_SPEED, (("average_speed_kmh", "H", 0.01),)),
+    (FLAG_TOTAL_DISTANCE, FEATURE_TOTAL_DISTANCE, (("total_distance_m", "3s", 1),)),
+    (FLAG_INCLINATION, FEATURE_INCLINATION, (("inclination_pct", "h", 0.1),
+                                             ("ramp_angle_deg", "h", 0.1))),
+    (FLAG_ELEVATION_GAIN, FEATURE_ELEVATION_GAIN, (("positive_elevation_gain_m", "H", 0.1),
+                                                   ("negative_elevation_gain_m", "H", 0.1))),
+    (FLAG_INSTANTANEOUS_PACE, FEATURE_PACE, (("instantaneous_pace_km_min", "B", 0.1),)),
+    (FLAG_AVERAGE_PACE, FEATURE_PACE, (("average_pace_km_min", "B", 0.1),)),
+    (FLAG_EXPENDED_ENERGY, FEATURE_EXPENDED_ENERGY, (("total_energy_kcal", "H", 1),
+                                                     ("energy_per_hour_kcal", "H", 1),
+                                                     ("energy_per_minute_kcal", "B", 1))),
+    (FLAG_HEART_RATE, FEATURE_HEART_RATE, (("heart_rate", "B", 1),)),
+    (FLAG_METABOLIC_EQUIVALENT, FEATURE_METABOLIC_EQUIVALENT, (("metabolic_equivalent", "B", 0.1),)),
+    (FLAG_ELAPSED_TIME, FEATURE_ELAPSED_TIME, (("elapsed_time_s", "H", 1),)),
+    (FLAG_REMAINING_TIME, FEATURE_REMAINING_TIME, (("remaining_time_s", "H", 1),)),
+    (FLAG_FORCE_ON_BELT_AND_POWER_OUTPUT, FEATURE_FORCE_ON_BELT_AND_POWER_OUTPUT, (("force_on_belt_n", "h", 1),
+                                                                                 ("power_output_w", "h", 1))),
+)
+
+TRAINING_STATUS = {
+    0x00: "Other",
+    0x01: "Idle",
+    0x02: "Warming Up",
+    0x03: "Low Intensity Interval",
+    0x04: "High Intensity Interval",
+    0x05: "Recovery Interval",
+    0x06: "Isometric",
+    0x07: "Heart Rate Control",
+    0x08: "Fitness Test",
+    0x09: "Speed Outside of Control Region - Low",
+    0x0A: "Speed Outside of Control Region - High",
+    0x0B: "Cool Down",
+    0x0C: "Watt Control",
+    0x0D: "Manual Mode (Quick Start)",
+    0x0E: "Pre-Workout",
+    0x0F: "Post-Workout",
+}
+
+# Machine Status op code -> (name, parameter struct, parameter scale)
+MACHINE_STATUS = {
+    0x01: ("Reset", None, 1),
+    0x02: ("Stopped or Paused by User", struct.Struct("<B"), 1),
+    0x03: ("Stopped by Safety Key", None, 1),
+    0x04: ("Started or Resumed by User", None, 1),
+    0x05: ("Target Speed Changed", struct.Struct("<H"), 0.01),
+    0x06: ("Target Incline Changed", struct.Struct("<h"), 0.1),
+    0x07: ("Target Resistance Level Changed", struct.Struct("<B"), 0.1),
+    0x08: ("Target Power Changed", struct.Struct("<h"), 1),
+    0x09: ("Target Heart Rate Changed", struct.Struct("<B"), 1),
+    0x0A: ("Targeted Expended Energy Changed", struct.Struct("<H"), 1),
+    0x0B: ("Targeted Number of Steps Changed", struct.Struct("<H"), 1),
+    0x0C: ("Targeted Number of Strides Changed", struct.Struct("<H"), 1),
+    0x0D: ("Targeted Distance Changed", struct.Struct("<HB"), 1),  # uint24
+    0x0E: ("Targeted Training Time Changed", struct.Struct("<H"), 1),
+    0xFF: ("Control Permission Lost", None, 1),
+}
+
+
+# Fitness Machine Control Point (0x2AD9) op codes
+CONTROL_REQUEST_CONTROL = 0x00
+CONTROL_RESET = 0x01
+CONTROL_SET_TARGET_SPEED = 0x02
+CONTROL_SET_TARGET_INCLINATION = 0x03
+CONTROL_START_OR_RESUME = 0x07
+CONTROL_STOP_OR_PAUSE = 0x08
+CONTROL_RESPONSE_CODE = 0x80
+
+STOP = 0x01
+PAUSE = 0x02
+
+# Control Point result code -> name
+CONTROL_RESULTS = {
+    0x01: "Success",
+    0x02: "Op Code not supported",
+    0x03: "Invalid Parameter",
+    0x04: "Operation Failed",
+    0x05: "Control Not Permitted",
+}
+RESULT_SUCCESS = 0x01
+RESULT_CONTROL_NOT_PERMITTED = 0x05
+
+
+class TreadmillData(NamedTuple):
+    """Decoded Treadmill Data fields; absent fields are None.
+
+    The same tuple holds NumPy columns (NaN where absent) when returned by
+    TreadmillDataDecoder.decode_many().
+    """
+    flags: int
+    instantaneous_speed_kmh: Optional[float] = None
+    average_speed_kmh: Optional[float] = None
+    total_distance_m: Optional[int] = None
+    inclination_pct: Optional[float] = None
+    ramp_angle_deg: Optional[float] = None
+    positive_elevation_gain_m: Optional[float] = None
+    negative_elevation_gain_m: Optional[float] = None
+    instantaneous_pace_km_min: Optional[float] = None
+    average_pace_km_min: Optional[float] = None
+    total_energy_kcal: Optional[int] = None
+    energy_per_hour_kcal: Optional[int] = None
+    energy_per_minute_kcal: Optional[int] = None
+    heart_rate: Optional[int] = None
+    metabolic_equivalent: Optional[float] = None
+    elapsed_time_s: Optional[int] = None
+    remaining_time_s: Optional[int] = None
+    force_on_belt_n: Optional[int] = None
+    power_output_w: Optional[int] = None
+
+
+class TrainingStatus(NamedTuple):
+    status: int
+    name: str
+    text: Optional[str]
+
+
+class MachineStatus(NamedTuple):
+    op_code: int
+    name: str
+    value: Optional[float]
+
+
+class ControlPointResponse(NamedTuple):
+    request_op_code: int
+    result: int
+    name: str
+
+
+class SupportedRange(NamedTuple):
+    minimum: float
+    maximum: float
+    increment: float
+
+
+_FIELD_INDEX = {name: index for index, name in enumerate(TreadmillData._fields)}
+_FIELD_COUNT = len(TreadmillData._fields)
+
+
+class _Layout:
+    """Precompiled struct and field plan for one Treadmill Data flags value."""
+    __slots__ = ("struct", "scales", "select", "wide")
+
+    def __init__(self, flags):
+        fmt = "<H"
+        scales = [1]
+        sources = {"flags": 0}
+        wide = []
+        for flag, _, fields in _TREADMILL_FIELDS:
+            present = not flags & FLAG_MORE_DATA if flag == 0 else flags & flag
+            if not present:
+                continue
+            for name, code, scale in fields:
+                if code == "3s":
+                    wide.append(_FIELD_INDEX[name])
+                sources[name] = len(scales)
+                fmt += code
+                scales.append(scale)
+        self.struct = struct.Struct(fmt)
+        self.scales = tuple(scales)
+        # Absent fields pick the filler appended after the unpacked values.
+        self.select = operator.itemgetter(*(sources.get(name, len(scales)) for name in TreadmillData._fields))
+        self.wide = tuple(wide)
+
+    def decode(self, data, filler=None):
+        values = self.select((*map(operator.mul, self.struct.unpack_from(data), self.scales), filler))
+        if self.wide:
+            values = list(values)
+            for target in self.wide:
+                values[target] = int.from_bytes(values[target], byteorder='little')
+        return values
+
+
+def service_uuid():
+    return normalize_uuid_str(SERVICE_UUID)
+
+
+def feature_uuid():
+    return normalize_uuid_str(FEATURE_CHARACTERISTIC_UUID)
+
+
+def treadmill_data_uuid():
+    return normalize_uuid_str(TREADMILL_DATA_CHARACTERISTIC_UUID)
+
+
+def training_status_uuid():
+    return normalize_uuid_str(TRAINING_STATUS_CHARACTERISTIC_UUID)
+
+
+def supported_speed_range_uuid():
+    return normalize_uuid_str(SUPPORTED_SPEED_RANGE_CHARACTERISTIC_UUID)
+
+
+def supported_inclination_range_uuid():
+    return normalize_uuid_str(SUPPORTED_INCLINATION_RANGE_CHARACTERISTIC_UUID)
+
+
+def control_point_uuid():
+    return normalize_uuid_str(CONTROL_POINT_CHARACTERISTIC_UUID)
+
+
+def status_uuid():
+    return normalize_uuid_str(STATUS_CHARACTERISTIC_UUID)
+
+
+def parse_feature(data):
+    """Return the (machine features, target setting features) bitmaps."""
+    if len(data) < 8:
+        raise ValueError("Invalid Fitness Machine Feature data length.")
+    return struct.unpack_from("<II", data)
+
+
+def expected_flags(machine_features):
+    """Treadmill Data flags a machine with the given features is expected to send."""
+    flags = 0
+    for flag, feature, _ in _TREADMILL_FIELDS:
+        if flag and machine_features & feature:
+            flags |= flag
+    return flags
+
+
+class TreadmillDataDecoder:
+    """
+    Decoder for Treadmill Data notifications of one machine.
+
+    The Fitness Machine Feature bitmap is read once; layouts for the flags the
+    machine advertises (with and without More Data) are compiled up front and
+    any other flags value is compiled on first sight and cached, so each packet
+    costs one dict lookup, one struct unpack and a fixed field plan.
+    """
+
+    def __init__(self, machine_features: int = 0):
+        self.machine_features = machine_features
+        self.layouts = {}
+        flags = expected_flags(machine_features)
+        self.layout(flags)
+        self.layout(flags | FLAG_MORE_DATA)
+
+    @classmethod
+    def from_feature_data(cls, data):
+        return cls(parse_feature(data)[0])
+
+    def layout(self, flags):
+        layout = self.layouts.get(flags)
+        if layout is None:
+            layout = self.layouts[flags] = _Layout(flags)
+        return layout
+
+    def decode(self, data) -> TreadmillData:
+        if len(data) < 2:
+            raise ValueError("Invalid Treadmill Data length.")
+        flags = (data[0] | (data[1] << 8)) & FLAGS_MASK
+        layout = self.layouts.get(flags) or self.layout(flags)
+        if len(data) < layout.struct.size:
+            raise ValueError("Treadmill Data flags announce more fields than the data contains.")
+        return TreadmillData._make(layout.decode(data))
+
+    def decode_many(self, packets: Sequence[bytes]) -> TreadmillData:
+        """Decode a recorded stream into a TreadmillData of NumPy columns."""
+        import numpy as np
+
+        columns = np.empty((len(packets), _FIELD_COUNT))
+        nan = float("nan")
+        for i, data in enumerate(packets):
+            if len(data) < 2:
+                raise ValueError("Invalid Treadmill Data length.")
+            flags = (data[0] | (data[1] << 8)) & FLAGS_MASK
+            layout = self.layouts.get(flags) or self.layout(flags)
+            if len(data) < layout.struct.size:
+                raise ValueError("Treadmill Data flags announce more fields than the data contains.")
+            columns[i] = layout.decode(data, nan)
+        return TreadmillData._make(columns.T)
+
+
+def parse_training_status(data) -> TrainingStatus:
+    if len(data) < 2:
+        raise ValueError("Invalid Training Status data length.")
+    status = data[1]
+    text = bytes(data[2:]).decode('utf-8', errors='replace') if data[0] & 0x01 and len(data) > 2 else None
+    return TrainingStatus(status, TRAINING_STATUS.get(status, "Reserved"), text)
+
+
+def parse_machine_status(data) -> MachineStatus:
+    if len(data) < 1:
+        raise ValueError("Invalid Fitness Machine Status data length.")
+    op_code = data[0]
+    name, parameter, scale = MACHINE_STATUS.get(op_code, ("Reserved", None, 1))
+    value = None
+    if parameter is not None:
+        if len(data) < 1 + parameter.size:
+            raise ValueError(f"{name} status is missing its parameter.")
+        fields = parameter.unpack_from(data, 1)
+        # uint24 parameters are unpacked as "<HB"
+        raw = fields[0] if len(fields) == 1 else fields[0] | fields[1] << 16
+        value = raw * scale
+    return MachineStatus(op_code, name, value)
+
+
+def parse_supported_speed_range(data) -> SupportedRange:
+    if len(data) < 6:
+        raise ValueError("Invalid Supported Speed Range data length.")
+    minimum, maximum, increment = struct.unpack_from("<HHH", data)
+    return SupportedRange(minimum * 0.01, maximum * 0.01, increment * 0.01)
+
+
+def parse_supported_inclination_range(data) -> SupportedRange:
+    if len(data) < 6:
+        raise ValueError("Invalid Supported Inclination Range data length.")
+    minimum, maximum, increment = struct.unpack_from("<hhH", data)
+    return SupportedRange(minimum * 0.1, maximum * 0.1, increment * 0.1)
+
+
+def encode_request_control() -> bytes:
+    return bytes((CONTROL_REQUEST_CONTROL,))
+
+
+def encode_reset() -> bytes:
+    return bytes((CONTROL_RESET,))
+
+
+def encode_set_target_speed(speed_kmh: float) -> bytes:
+    return struct.pack("<BH", CONTROL_SET_TARGET_SPEED, round(speed_kmh * 100))
+
+
+def encode_set_target_inclination(inclination_pct: float) -> bytes:
+    return struct.pack("<Bh", CONTROL_SET_TARGET_INCLINATION, round(inclination_pct * 10))
+
+
+def encode_start_or_resume() -> bytes:
+    return bytes((CONTROL_START_OR_RESUME,))
+
+
+def encode_stop_or_pause(parameter: int = STOP) -> bytes:
+    return bytes((CONTROL_STOP_OR_PAUSE, parameter))
+
+
+def parse_control_point_response(data) -> ControlPointResponse:
+    if len(data) < 3 or data[0] != CONTROL_RESPONSE_CODE:
+        raise ValueError("Invalid Fitness Machine Control Point response.")
+    return ControlPointResponse(data[1], data[2], CONTROL_RESULTS.get(data[2], "Reserved"))
+
+
+if __name__ == "__main__":
+    import timeit
+
+    all_features = FEATURE_TOTAL_DISTANCE | FEATURE_INCLINATION | FEATURE_ELEVATION_GAIN | FEATURE_PACE \
+        | FEATURE_EXPENDED_ENERGY | FEATURE_HEART_RATE | FEATURE_ELAPSED_TIME | FEATURE_AVERAGE_SPEED
+    decoder = TreadmillDataDecoder(all_features)
+    minimal = struct.pack("<HH", 0, 1050)
+    full_flags = expected_flags(all_features)
+    full = struct.pack("<HHH3shhHHBBHHBBH", full_flags, 1050, 980, (1234).to_bytes(3, 'little'), 15, 8,
+                       120, 0, 57, 61, 240, 600, 10, 142, 900)
+
+    for label, packet in (("speed only", minimal), ("all supported fields", full)):
+        per_packet = timeit.timeit(lambda: decoder.decode(packet), number=100_000) / 100_000
+        print(f"decode ({label}): {per_packet * 1e6:.2f} us/packet")
+    stream = [minimal, full] * 50_000
+    batch = timeit.timeit(lambda: decoder.decode_many(stream), number=1)
+    print(f"decode_many: {batch * 1e6 / len(stream):.2f} us/packet over {len(stream)} packets")
@@ -1,8 +1,41 @@
-from bleak.uuids import normalize_uuid_str
+from typing import NamedTuple, Optional, Sequence
+
+from bt_uuids import normalize_uuid_str
 
 SERVICE_UUID = "180d"
 MEASUREMENT_CHARACTERISTIC_UUID = "2a37"
 
+# Heart Rate Measurement (0x2A37) flags
+FLAG_HR_UINT16 = 0x01
+FLAG_SENSOR_CONTACT_DETECTED = 0x02
+FLAG_SENSOR_CONTACT_SUPPORTED = 0x04
+FLAG_ENERGY_EXPENDED_PRESENT = 0x08
+FLAG_RR_INTERVAL_PRESENT = 0x10
+
+RR_INTERVAL_RESOLUTION_MS = 1000 / 1024
+
+
+class HeartRateMeasurement(NamedTuple):
+    """A single decoded Heart Rate Measurement notification."""
+    hr: int
+    sensor_contact: Optional[bool]
+    energy_expended: Optional[int]
+    rr_intervals: tuple
+
+
+class HeartRateBatch(NamedTuple):
+    """Columnar result of decoding many notifications at once.
+
+    `hr`, `energy` and `timestamps` have one entry per notification; `energy`
+    is -1 where the field was absent. `rr_ms` is flattened across all
+    notifications and `rr_index` holds the notification index of each interval.
+    """
+    hr: "numpy.ndarray"
+    energy: "numpy.ndarray"
+    timestamps: "numpy.ndarray"
+    rr_ms: "numpy.ndarray"
+    rr_index: "numpy.ndarray"
+
 
 def service_uuid():
     return normalize_uuid_str(SERVICE_UUID)
@@ -12,5 +45,145 @@ def measurement_uuid():
     return normalize_uuid_str(MEASUREMENT_CHARACTERISTIC_UUID)
 
 
+def parse_hr_measurement(data):
+    """
+    Parse the Heart Rate Measurement data following its flags byte.
+
+    Args:
+        data (bytes): Byte array containing the HR measurement data.
+
+    Returns:
+        HeartRateMeasurement: Decoded fields, RR intervals in milliseconds.
+    """
+    length = len(data)
+    if length < 2:
+        raise ValueError("Invalid HR Measurement data length.")
+
+    flags = data[0]
+    if flags & FLAG_HR_UINT16:
+        if length < 3:
+            raise ValueError("HR format flag is set to uint16, but data is incomplete.")
+        hr = data[1] | (data[2] << 8)
+        offset = 3
+    else:
+        hr = data[1]
+        offset = 2
+
+    sensor_contact = bool(flags & FLAG_SENSOR_CONTACT_DETECTED) if flags & FLAG_SENSOR_CONTACT_SUPPORTED else None
+
+    energy_expended = None
+    if flags & FLAG_ENERGY_EXPENDED_PRESENT:
+        if length < offset + 2:
+            raise ValueError("Energy expended flag is set, but data is incomplete.")
+        energy_expended = data[offset] | (data[offset + 1] << 8)
+        offset += 2
+
+    rr_intervals = ()
+    if flags & FLAG_RR_INTERVAL_PRESENT:
+        rr_intervals = tuple((data[i] | (data[i + 1] << 8)) * RR_INTERVAL_RESOLUTION_MS
+                             for i in range(offset, length - 1, 2))
+
+    return HeartRateMeasurement(hr, sensor_contact, energy_expended, rr_intervals)
+
+
 def parse_hr_data(data):
-    return int(data[1])
\ No newline at end of file
+    """
+    Parse only the heart rate of a Heart Rate Measurement, with the same length checks as parse_hr_measurement.
+
+    Args:
+        data (bytes): Byte array containing the HR measurement data.
+
+    Returns:
+        int: Heart rate in bpm.
+    """
+    length = len(data)
+    if length < 2:
+        raise ValueError("Invalid HR Measurement data length.")
+    if data[0] & FLAG_HR_UINT16:
+        if length < 3:
+            raise ValueError("HR format flag is set to uint16, but data is incomplete.")
+        return data[1] | (data[2] << 8)
+    return int(data[1])
+
+
+def decode_hr_batch(packets: Sequence[bytes], timestamps=None, lengths=None) -> HeartRateBatch:
+    """
+    Decode many Heart Rate Measurement notifications into NumPy columns.
+
+    Args:
+        packets: A sequence of raw notifications, or one contiguous buffer
+            holding back-to-back notifications when `lengths` is given.
+        timestamps: Optional per-notification timestamps (seconds).
+        lengths: Optional per-notification byte lengths for a contiguous buffer.
+
+    Returns:
+        HeartRateBatch: Columnar decoded fields.
+    """
+    import numpy as np
+
+    if lengths is None:
+        lengths = np.fromiter((len(p) for p in packets), dtype=np.int64, count=len(packets))
+        buffer = np.frombuffer(b"".join(packets), dtype=np.uint8)
+    else:
+        lengths = np.asarray(lengths, dtype=np.int64)
+        buffer = np.frombuffer(packets, dtype=np.uint8)
+
+    count = len(lengths)
+    if timestamps is None:
+        timestamps = np.arange(count, dtype=np.float64)
+    else:
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+    if count == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return HeartRateBatch(np.empty(0, dtype=np.uint16), np.empty(0, dtype=np.int32), timestamps,
+                              empty, np.empty(0, dtype=np.int64))
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    if np.any(lengths < 2):
+        raise ValueError("Invalid HR Measurement data length.")
+
+    # Pad so that optional-field reads past a short packet stay in bounds; they are masked out below.
+    padded = np.concatenate((buffer, np.zeros(4, dtype=np.uint8))).astype(np.uint16)
+    flags = padded[starts]
+
+    wide = (flags & FLAG_HR_UINT16) != 0
+    if np.any(wide & (lengths < 3)):
+        raise ValueError("HR format flag is set to uint16, but data is incomplete.")
+    hr = np.where(wide, padded[starts + 1] | (padded[starts + 2] << 8), padded[starts + 1]).astype(np.uint16)
+
+    energy_offsets = starts + 2 + wide
+    has_energy = (flags & FLAG_ENERGY_EXPENDED_PRESENT) != 0
+    if np.any(has_energy & (energy_offsets + 2 > ends)):
+        raise ValueError("Energy expended flag is set, but data is incomplete.")
+    energy = np.where(has_energy,
+                      (padded[energy_offsets] | (padded[energy_offsets + 1] << 8)).astype(np.int32),
+                      np.int32(-1))
+
+    rr_offsets = energy_offsets + 2 * has_energy
+    has_rr = (flags & FLAG_RR_INTERVAL_PRESENT) != 0
+    rr_counts = np.where(has_rr, (ends - rr_offsets) // 2, 0)
+    rr_index = np.repeat(np.arange(count, dtype=np.int64), rr_counts)
+    rr_starts = np.repeat(rr_offsets, rr_counts)
+    rr_position = np.arange(len(rr_index), dtype=np.int64) - np.repeat(np.cumsum(rr_counts) - rr_counts, rr_counts)
+    rr_bytes = rr_starts + 2 * rr_position
+    rr_ms = (padded[rr_bytes] | (padded[rr_bytes + 1] << 8)) * RR_INTERVAL_RESOLUTION_MS
+
+    return HeartRateBatch(hr, energy, timestamps, rr_ms, rr_index)
+
+
+if __name__ == "__main__":
+    import random
+    import timeit
+
+    random.seed(0)
+    samples = []
+    for _ in range(100_000):
+        rr = [random.randint(600, 1100) for _ in range(random.randint(0, 3))]
+        flags = FLAG_SENSOR_CONTACT_SUPPORTED | FLAG_SENSOR_CONTACT_DETECTED | (FLAG_RR_INTERVAL_PRESENT if rr else 0)
+        samples.append(bytes([flags, random.randint(60, 190)]) + b"".join(v.to_bytes(2, "little") for v in rr))
+
+    loop = timeit.timeit(lambda: [parse_hr_measurement(p) for p in samples], number=3) / 3
+    batch = timeit.timeit(lambda: decode_hr_batch(samples), number=3) / 3
+    print(f"per-call loop: {loop * 1e3:8.1f} ms for {len(samples)} notifications")
+    print(f"batch decode:  {batch * 1e3:8.1f} ms for {len(samples)} notifications ({loop / batch:.1f}x)")
@@ -1,8 +1,177 @@
+import struct
+from math import nan
+from typing import NamedTuple, Sequence
+
+from bt_uuids import normalize_uuid_str
+
 SERVICE_UUID = "1814"
 FEATURE_CHARACTERISTIC_UUID = "2a54"
 MEASUREMENT_CHARACTERISTIC_UUID = "2a53"
 
 
+def service_uuid():
+    return normalize_uuid_str(SERVICE_UUID)
+
+
+def measurement_uuid():
+    return normalize_uuid_str(MEASUREMENT_CHARACTERISTIC_UUID)
+
+
+# RSC Measurement (0x2A53) flags
+FLAG_STRIDE_LENGTH_PRESENT = 0x01
+FLAG_TOTAL_DISTANCE_PRESENT = 0x02
+FLAG_RUNNING = 0x04
+FLAGS_MASK = 0x07
+
+STOPPED_PACE_MIN_PER_KM = 50
+
+
+def _layout(flags):
+    fmt = "<BHB"
+    if flags & FLAG_STRIDE_LENGTH_PRESENT:
+        fmt += "H"
+    if flags & FLAG_TOTAL_DISTANCE_PRESENT:
+        fmt += "I"
+    return struct.Struct(fmt)
+
+
+# One precompiled layout per possible flags value
+_LAYOUTS = tuple(_layout(flags) for flags in range(FLAGS_MASK + 1))
+
+
+def speed_kmh(speed_m_per_s):
+    return speed_m_per_s * 3.6
+
+
+def pace_min_per_km(speed_m_per_s):
+    return 1 / (speed_m_per_s * 3.6 / 60) if speed_m_per_s > 0 else STOPPED_PACE_MIN_PER_KM
+
+
+class RSCMeasurement:
+    """A decoded RSC measurement; derived fields are computed on access."""
+    __slots__ = ("speed_m_per_s", "cadence", "running", "stride_length_m", "total_distance_m")
+
+    def __init__(self, speed_m_per_s, cadence, running, stride_length_m=None, total_distance_m=None):
+        self.speed_m_per_s = speed_m_per_s
+        self.cadence = cadence
+        self.running = running
+        self.stride_length_m = stride_length_m
+        self.total_distance_m = total_distance_m
+
+    @property
+    def speed_kmh(self):
+        return speed_kmh(self.speed_m_per_s)
+
+    @property
+    def pace(self):
+        return pace_min_per_km(self.speed_m_per_s)
+
+    @property
+    def total_distance_km(self):
+        return self.total_distance_m / 1000 if self.total_distance_m is not None else None
+
+    @property
+    def running_status(self):
+        return "running" if self.running else "walking"
+
+    def __repr__(self):
+        return (f"RSCMeasurement(speed_m_per_s={self.speed_m_per_s}, cadence={self.cadence}, "
+                f"running={self.running}, stride_length_m={self.stride_length_m}, "
+                f"total_distance_m={self.total_distance_m})")
+
+
+class RSCColumns(NamedTuple):
+    """Columnar RSC measurements; absent optional fields are NaN."""
+    speed_m_per_s: "numpy.ndarray"
+    cadence: "numpy.ndarray"
+    stride_length_m: "numpy.ndarray"
+    total_distance_m: "numpy.ndarray"
+    running: "numpy.ndarray"
+
+    @classmethod
+    def allocate(cls, capacity):
+        import numpy as np
+        return cls(np.zeros(capacity), np.zeros(capacity, dtype=np.uint8), np.full(capacity, np.nan),
+                   np.full(capacity, np.nan), np.zeros(capacity, dtype=bool))
+
+    @property
+    def speed_kmh(self):
+        return self.speed_m_per_s * 3.6
+
+    @property
+    def pace(self):
+        import numpy as np
+        with np.errstate(divide="ignore"):
+            return np.where(self.speed_m_per_s > 0, 60 / (self.speed_m_per_s * 3.6), STOPPED_PACE_MIN_PER_KM)
+
+
+def _incomplete(flags, length):
+    if length < 4:
+        return ValueError("Invalid RSC Measurement data length.")
+    if flags & FLAG_STRIDE_LENGTH_PRESENT and length < 6:
+        return ValueError("Stride length flag is set, but data is incomplete.")
+    return ValueError("Total distance flag is set, but data is incomplete.")
+
+
+def decode_rsc_measurement(data):
+    """
+    Decode the RSC measurement data using the precompiled layout for its flags.
+
+    Args:
+        data (bytes): Byte array containing the RSC measurement data.
+
+    Returns:
+        RSCMeasurement: Decoded measurement.
+    """
+    if len(data) < 4:
+        raise ValueError("Invalid RSC Measurement data length.")
+    flags = data[0] & FLAGS_MASK
+    layout = _LAYOUTS[flags]
+    if len(data) < layout.size:
+        raise _incomplete(flags, len(data))
+
+    fields = layout.unpack_from(data)
+    stride_length_m = fields[3] * 0.01 if flags & FLAG_STRIDE_LENGTH_PRESENT else None
+    total_distance_m = fields[-1] * 0.1 if flags & FLAG_TOTAL_DISTANCE_PRESENT else None
+    return RSCMeasurement(fields[1] / 256, fields[2], flags & FLAG_RUNNING != 0, stride_length_m, total_distance_m)
+
+
+def decode_many(packets: Sequence[bytes], out: RSCColumns = None) -> RSCColumns:
+    """
+    Decode many RSC measurements into preallocated columns.
+
+    Args:
+        packets: Raw RSC measurement notifications.
+        out: Columns to fill from index 0; allocated when not given.
+
+    Returns:
+        RSCColumns: The filled columns.
+    """
+    if out is None:
+        out = RSCColumns.allocate(len(packets))
+    elif len(out.speed_m_per_s) < len(packets):
+        raise ValueError("Output columns are too small for the given packets.")
+
+    speed, cadence, stride, distance, running = out
+    layouts = _LAYOUTS
+    for i, data in enumerate(packets):
+        length = len(data)
+        if length < 4:
+            raise ValueError("Invalid RSC Measurement data length.")
+        flags = data[0] & FLAGS_MASK
+        layout = layouts[flags]
+        if length < layout.size:
+            raise _incomplete(flags, length)
+        fields = layout.unpack_from(data)
+        speed[i] = fields[1] / 256
+        cadence[i] = fields[2]
+        running[i] = flags & FLAG_RUNNING
+        # Reused columns hold the previous batch, so absent fields are cleared
+        stride[i] = fields[3] * 0.01 if flags & FLAG_STRIDE_LENGTH_PRESENT else nan
+        distance[i] = fields[-1] * 0.1 if flags & FLAG_TOTAL_DISTANCE_PRESENT else nan
+    return out
+
+
 def parse_rsc_measurement(data):
     """
     Parse the RSC (Running Speed and Cadence) measurement data.
@@ -12,6 +181,9 @@ def parse_rsc_measurement(data):
 
     Returns:
         dict: Parsed RSC measurement fields.
+
+    Prefer decode_rsc_measurement() in the notification path; it avoids
+    building a dict and only derives km/h and pace when they are read.
     """
     # Ensure data is at least 4 bytes (minimum RSC packet length)
     if len(data) < 4:
@@ -55,7 +227,7 @@ def parse_rsc_measurement(data):
     # Parse optional total distance
     if total_distance_present:
         if len(data) >= offset + 4:
-            total_distance_m = int.from_bytes(data[offset:offset + 4], byteorder='little') * 0.01  # Convert to meters
+            total_distance_m = int.from_bytes(data[offset:offset + 4], byteorder='little') * 0.1  # 0.1 m units
             total_distance_km = total_distance_m / 1000  # Convert to kilometers
             result["total_distance_m"] = total_distance_m
             result["total_distance_km"] = total_distance_km
@@ -63,3 +235,19 @@ def parse_rsc_measurement(data):
             raise ValueError("Total distance flag is set, but data is incomplete.")
 
     return result
+
+
+if __name__ == "__main__":
+    import timeit
+
+    samples = [bytes([FLAG_RUNNING | FLAG_STRIDE_LENGTH_PRESENT | FLAG_TOTAL_DISTANCE_PRESENT])
+               + (700 + i % 300).to_bytes(2, "little") + bytes([160])
+               + (120).to_bytes(2, "little") + (i * 30).to_bytes(4, "little") for i in range(100_000)]
+
+    legacy = timeit.timeit(lambda: [parse_rsc_measurement(p) for p in samples], number=3) / 3
+    record = timeit.timeit(lambda: [decode_rsc_measurement(p) for p in samples], number=3) / 3
+    columns = RSCColumns.allocate(len(samples))
+    batch = timeit.timeit(lambda: decode_many(samples, columns), number=3) / 3
+    print(f"parse_rsc_measurement:  {legacy * 1e3:8.1f} ms for {len(samples)} notifications")
+    print(f"decode_rsc_measurement: {record * 1e3:8.1f} ms ({legacy / record:.1f}x)")
+    print(f"decode_many:            {batch * 1e3:8.1f} ms ({legacy / batch:.1f}x)")
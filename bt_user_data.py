@@ -1,4 +1,4 @@
-from bleak.uuids import normalize_uuid_str
+from bt_uuids import normalize_uuid_str
 
 SERVICE_UUID = "181c"
 AGE_CHARACTERISTIC_UUID = "2a80"
@@ -0,0 +1,21 @@
+from functools import lru_cache
+from uuid import UUID
+
+# Bluetooth Base UUID: 16- and 32-bit SIG UUIDs are expanded into it
+BASE_UUID_SUFFIX = "-0000-1000-8000-00805f9b34fb"
+
+
+@lru_cache(maxsize=None)
+def normalize_uuid_str(uuid: str) -> str:
+    """
+    Same result as bleak.uuids.normalize_uuid_str, without importing bleak.
+
+    Decoders and replay only need UUID strings, and importing bleak costs
+    more than everything else they load; results are cached because handlers
+    look UUIDs up on every notification.
+    """
+    if len(uuid) == 4:
+        uuid = f"0000{uuid}{BASE_UUID_SUFFIX}"
+    elif len(uuid) == 8:
+        uuid = f"{uuid}{BASE_UUID_SUFFIX}"
+    return str(UUID(uuid))
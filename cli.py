@@ -0,0 +1,102 @@
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+from typing import NamedTuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Command(NamedTuple):
+    path: str  # Script or module file, relative to this directory
+    function: str  # Called with the remaining arguments
+    help: str
+
+
+# Nothing a command needs is imported until that command runs, so starting
+# `replay` never loads bleak or textual and `hr` never loads textual.
+COMMANDS = {
+    "app": Command("fitness-app.py", "cli", "Textual dashboard: heart rate, HRV, zones and calories"),
+    "hr": Command("hr-monitor.py", "cli", "Show heart rate from any BLE HR monitor"),
+    "polar": Command("polar.py", "cli", "Print heart rate, RR intervals and RMSSD from a Polar H10"),
+    "treadmill": Command("treadmill.py", "cli", "Show speed, cadence and incline; drive workouts"),
+    "record": Command("recorder.py", "record_cli", "Record raw notifications to a log"),
+    "replay": Command("recorder.py", "replay_cli", "Replay a notification log through the decoders"),
+    "gym": Command("gym.py", "cli", "Run a floor of devices across worker processes"),
+    "serve": Command("telemetry_server.py", "cli", "Run the sensor pipeline headless and serve samples"),
+    "sessions": Command("session_store.py", "cli", "Recent sessions, weekly totals and personal bests"),
+    "fuse": Command("fusion.py", "cli", "Align a session's channels onto one timebase as CSV"),
+}
+
+
+def load(command: Command):
+    """Import the module behind a command; hyphenated scripts are loaded from their file."""
+    name = os.path.splitext(command.path)[0]
+    if name.isidentifier():
+        return importlib.import_module(name)
+    name = name.replace("-", "_")
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, command.path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def import_time_us(stderr: str) -> dict:
+    """Cumulative -X importtime microseconds per top-level import."""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            totals[name.strip()] = int(cumulative)
+    return totals
+
+
+def measure_startup(repeats: int = 5) -> None:
+    """Cold-start each command (`cli.py COMMAND --help`) under -X importtime in fresh interpreters."""
+    import subprocess
+    import time
+
+    for name in COMMANDS:
+        best_wall, best_imports = None, None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, "-X", "importtime", __file__, name, "--help"],
+                                    capture_output=True, text=True, cwd=HERE)
+            wall = time.perf_counter() - started
+            imports = import_time_us(result.stderr)
+            if best_wall is None or wall < best_wall:
+                best_wall, best_imports = wall, imports
+        heaviest = sorted(best_imports.items(), key=lambda item: -item[1])[:3]
+        print(f"{name:<10} {best_wall * 1000:6.0f} ms wall, {sum(best_imports.values()) / 1000:6.0f} ms imports  "
+              + ", ".join(f"{module} {us / 1000:.0f} ms" for module, us in heaviest))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Treadmill and heart rate tools.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<10} {command.help}" for name, command in COMMANDS.items())
+               + "\n\nRun a command with --help for its options; --startup times every command's cold start.")
+    parser.add_argument("command", nargs="?", choices=COMMANDS, metavar="COMMAND")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    parser.add_argument("--startup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.startup:
+        measure_startup()
+        return
+    if args.command is None:
+        parser.print_help()
+        return
+    command = COMMANDS[args.command]
+    sys.argv[0] = f"{os.path.basename(sys.argv[0])} {args.command}"  # For the command's own usage line
+    getattr(load(command), command.function)(args.arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import asyncio
+import random
+import time
+from enum import Enum
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from bleak import BleakClient
+
+import ble_backend
+
+DEFAULT_BACKOFF_BASE = 0.25
+DEFAULT_BACKOFF_CAP = 10.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+
+class LinkState(Enum):
+    IDLE = "idle"
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+    CLOSED = "closed"
+
+
+class SensorLink:
+    """
+    One BLE device session that stays connected until closed.
+
+    The link waits on bleak's disconnected callback instead of polling, then
+    reconnects with jittered exponential backoff (the first retry is
+    immediate) and resubscribes every notification.
+
+    Args:
+        name: Link name, e.g. "hr" or "treadmill".
+        device: BLEDevice or address to connect to.
+        notifications: Characteristic UUID -> handler(sender, data).
+        on_connect: Optional coroutine run with the client after every
+            (re)connect, once notifications are started.
+        on_state: Optional callback invoked with the link on every state change.
+    """
+
+    def __init__(self, name: str, device, notifications: Dict[str, Callable],
+                 on_connect: Callable[["BleakClient"], Awaitable] = None,
+                 on_state: Callable[["SensorLink"], None] = None,
+                 client_factory=ble_backend.client,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT):
+        self.name = name
+        self.device = device
+        self.notifications = notifications
+        self.on_connect = on_connect
+        self.on_state = on_state
+        self.client_factory = client_factory
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.connect_timeout = connect_timeout
+        self.state = LinkState.IDLE
+        self.client: Optional["BleakClient"] = None
+        self.connects = 0
+        self.reconnects = 0
+        self.last_error: Optional[Exception] = None
+        # Seconds from a dropped link to resubscribed / to the first notification
+        self.reconnect_latency: Optional[float] = None
+        self.time_to_data: Optional[float] = None
+        self.connected = asyncio.Event()
+        self._disconnected = asyncio.Event()
+        self._dropped_at: Optional[float] = None
+        self._awaiting_data = False
+        self._closing = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def address(self) -> str:
+        return getattr(self.device, "address", self.device)
+
+    def _set_state(self, state: LinkState) -> None:
+        self.state = state
+        if self.on_state is not None:
+            self.on_state(self)
+
+    def _on_disconnect(self, client) -> None:
+        self._disconnected.set()
+
+    def _wrap(self, handler):
+        def notification_handler(sender, data):
+            if self._awaiting_data:
+                self._awaiting_data = False
+                if self._dropped_at is not None:
+                    self.time_to_data = time.monotonic() - self._dropped_at
+            handler(sender, data)
+        return notification_handler
+
+    async def _connect(self) -> None:
+        self._disconnected.clear()
+        client = self.client_factory(self.device, disconnected_callback=self._on_disconnect,
+                                     timeout=self.connect_timeout)
+        self.client = client
+        await client.connect()
+        self._awaiting_data = True
+        await asyncio.gather(*(client.start_notify(uuid, self._wrap(handler))
+                               for uuid, handler in self.notifications.items()))
+        self.connects += 1
+        if self._dropped_at is not None:
+            self.reconnect_latency = time.monotonic() - self._dropped_at
+        self._set_state(LinkState.CONNECTED)
+        self.connected.set()
+        if self.on_connect is not None:
+            await self.on_connect(client)
+
+    async def run(self) -> None:
+        attempt = 0
+        self._set_state(LinkState.CONNECTING)
+        while not self._closing:
+            try:
+                await self._connect()
+                attempt = 0
+                await self._disconnected.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = e
+            finally:
+                self.connected.clear()
+            if self._closing:
+                break
+            if self.state is LinkState.CONNECTED:
+                self._dropped_at = time.monotonic()
+                self.reconnects += 1
+            self._set_state(LinkState.RECONNECTING)
+            await self._disconnect_client()
+            if attempt:
+                await asyncio.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+            attempt += 1
+
+    async def _disconnect_client(self) -> None:
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        self._closing = True
+        self._disconnected.set()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self._disconnect_client()
+        self._set_state(LinkState.CLOSED)
+
+
+class ConnectionManager:
+    """Runs any number of SensorLinks concurrently, one task per link."""
+
+    def __init__(self):
+        self.links: Dict[str, SensorLink] = {}
+
+    def add(self, link: SensorLink) -> SensorLink:
+        if link.name in self.links:
+            raise ValueError(f"A link named {link.name!r} is already managed.")
+        self.links[link.name] = link
+        link.task = asyncio.create_task(link.run(), name=f"link-{link.name}")
+        return link
+
+    async def wait_connected(self, timeout: float = None) -> bool:
+        """Wait until every link has connected; all links connect concurrently."""
+        waits = [asyncio.create_task(link.connected.wait()) for link in self.links.values()]
+        if not waits:
+            return True
+        done, pending = await asyncio.wait(waits, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return not pending
+
+    async def remove(self, name: str) -> None:
+        link = self.links.pop(name, None)
+        if link is not None:
+            await link.close()
+
+    async def close(self) -> None:
+        await asyncio.gather(*(self.remove(name) for name in list(self.links)))
+
+    def states(self) -> Dict[str, LinkState]:
+        return {name: link.state for name, link in self.links.items()}
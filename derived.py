@@ -0,0 +1,246 @@
+import math
+from bisect import bisect_right
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import fusion
+import telemetry
+from bt_running_speed_cadence import STOPPED_PACE_MIN_PER_KM
+
+PROFILE = "profile"
+
+PACE = "pace"
+HR_ZONES = "hr_zones"
+HR_ZONE = "hr_zone"
+CALORIES = "calories"
+TRIMP = "trimp"
+INTEGRATED_DISTANCE = "integrated_distance"
+HR_PER_KMH = "hr_per_kmh"
+
+# Zone boundaries as fractions of maximum heart rate: 60/70/80/90%
+HR_ZONE_FRACTIONS = (0.6, 0.7, 0.8, 0.9)
+# Samples further apart than this (dropped link, paused sensor) are not integrated
+MAX_INTEGRATION_GAP_S = telemetry.MAX_ZONE_GAP_S
+
+
+class UserProfile(NamedTuple):
+    age: int = 35
+    weight_kg: float = 75.0
+    gender: str = "Male"
+    resting_hr: int = 60
+
+    @property
+    def max_hr(self) -> int:
+        return 220 - self.age
+
+    @classmethod
+    def from_metadata(cls, values: Dict[str, Any]) -> "UserProfile":
+        """Profile from gatt_metadata User Data values, keeping defaults for anything unread."""
+        default = cls()
+        return cls(values.get("Age") or default.age, values.get("Weight") or default.weight_kg,
+                   values.get("Gender") or default.gender)
+
+
+class Node:
+    __slots__ = ("name", "inputs", "compute", "value", "version", "seen", "subscribers", "notified")
+
+    def __init__(self, name: str, inputs: Sequence[str], compute: Callable):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.compute = compute
+        self.value = None
+        self.version = 0
+        self.seen = None
+        self.subscribers: List[Callable[[Any], None]] = []
+        self.notified = 0
+
+
+class Integral:
+    """
+    Incremental integral over a channel's samples.
+
+    Each evaluation only walks the samples appended since the previous one.
+    A node nobody reads can fall more than a ring's capacity behind, in which
+    case the overwritten samples are skipped.
+    """
+
+    def __init__(self, rate: Callable[..., float]):
+        self.rate = rate
+        self.total = 0.0
+        self.cursor = 0
+        self.last_timestamp = None
+        self.last_value = None
+
+    def __call__(self, channel: telemetry.Channel, *args) -> float:
+        count = channel.count
+        cursor = max(self.cursor, count - channel.capacity)
+        timestamps, values, capacity = channel.timestamps, channel.values, channel.capacity
+        rate = self.rate
+        last_timestamp, last_value = self.last_timestamp, self.last_value
+        total = self.total
+        for index in range(cursor, count):
+            timestamp = timestamps[index % capacity]
+            value = values[index % capacity]
+            if last_timestamp is not None:
+                elapsed = timestamp - last_timestamp
+                if 0 < elapsed <= MAX_INTEGRATION_GAP_S:
+                    total += rate(last_value, value, *args) * elapsed
+            last_timestamp, last_value = timestamp, value
+        self.total, self.cursor = total, count
+        self.last_timestamp, self.last_value = last_timestamp, last_value
+        return total
+
+
+class MetricGraph:
+    """
+    Derived metrics as a lazy dependency graph over telemetry channels and the user profile.
+
+    A node is computed only when something reads it, through get() or a
+    subscription flushed by refresh(), and only when the version of one of its
+    inputs (a channel's sample count, the profile, another node's value) has
+    changed since it was last computed. refresh() walks the subscribed nodes
+    only, so metrics no widget or exporter shows cost nothing.
+    """
+
+    def __init__(self, store: telemetry.TelemetryStore, profile: UserProfile = None):
+        self.store = store
+        self.profile = profile or UserProfile()
+        self.profile_version = 1
+        self.nodes: Dict[str, Node] = {}
+        self.computations = 0
+
+    def node(self, name: str, inputs: Sequence[str], compute: Callable) -> None:
+        """Add a node; compute receives a Channel, the UserProfile or a node value per input."""
+        if name in self.nodes or name in self.store.channels or name == PROFILE:
+            raise ValueError(f"A source or metric named {name!r} already exists.")
+        self.nodes[name] = Node(name, inputs, compute)
+
+    def set_profile(self, profile: UserProfile) -> None:
+        if profile != self.profile:
+            self.profile = profile
+            self.profile_version += 1
+
+    def _source(self, name: str):
+        """Current (value, version) of a channel, the profile or a node."""
+        if name == PROFILE:
+            return self.profile, self.profile_version
+        channel = self.store.channels.get(name)
+        if channel is not None:
+            return channel, channel.count
+        node = self.nodes[name]
+        self._evaluate(node)
+        return node.value, node.version
+
+    def _evaluate(self, node: Node) -> None:
+        sources = [self._source(name) for name in node.inputs]
+        versions = tuple(version for _, version in sources)
+        if versions == node.seen:
+            return
+        node.seen = versions
+        value = node.compute(*(value for value, _ in sources))
+        self.computations += 1
+        if value != node.value:
+            node.value = value
+            node.version += 1
+
+    def get(self, name: str):
+        node = self.nodes[name]
+        self._evaluate(node)
+        return node.value
+
+    def subscribe(self, name: str, callback: Callable[[Any], None]) -> None:
+        self.nodes[name].subscribers.append(callback)
+
+    def unsubscribe(self, name: str, callback: Callable[[Any], None]) -> None:
+        self.nodes[name].subscribers.remove(callback)
+
+    def refresh(self) -> None:
+        """Recompute subscribed nodes whose inputs changed and notify on new values."""
+        for node in self.nodes.values():
+            if not node.subscribers:
+                continue
+            self._evaluate(node)
+            if node.version != node.notified:
+                node.notified = node.version
+                for callback in node.subscribers:
+                    callback(node.value)
+
+
+def pace(speed: telemetry.Channel) -> Optional[float]:
+    """Minutes per km from the latest speed in km/h."""
+    speed_kmh = speed.latest
+    if speed_kmh is None:
+        return None
+    return 60 / speed_kmh if speed_kmh > 0 else STOPPED_PACE_MIN_PER_KM
+
+
+def hr_zones(profile: UserProfile) -> tuple:
+    return tuple(round(fraction * profile.max_hr) for fraction in HR_ZONE_FRACTIONS)
+
+
+def hr_zone(hr: telemetry.Channel, zones: tuple) -> Optional[int]:
+    """Zone of the latest heart rate: 0 below the first boundary, up to len(zones)."""
+    return bisect_right(zones, hr.latest) if hr.count else None
+
+
+def keytel_kcal_per_second(previous_hr: float, hr: float, profile: UserProfile) -> float:
+    """Energy expenditure from heart rate (Keytel et al., 2005), in kcal/s."""
+    if profile.gender == "Female":
+        kj_per_min = -20.4022 + 0.4472 * hr - 0.1263 * profile.weight_kg + 0.074 * profile.age
+    else:
+        kj_per_min = -55.0969 + 0.6309 * hr + 0.1988 * profile.weight_kg + 0.2017 * profile.age
+    return max(kj_per_min, 0.0) / 4.184 / 60
+
+
+def banister_trimp_per_second(previous_hr: float, hr: float, profile: UserProfile) -> float:
+    """Banister training impulse accumulated per second at heart rate `hr`."""
+    reserve = (hr - profile.resting_hr) / (profile.max_hr - profile.resting_hr)
+    if reserve <= 0:
+        return 0.0
+    if profile.gender == "Female":
+        return reserve * 0.86 * math.exp(1.67 * reserve) / 60
+    return reserve * 0.64 * math.exp(1.92 * reserve) / 60
+
+
+def trapezoid_km_per_second(previous_speed: float, speed: float) -> float:
+    """Distance per second from the mean of two speeds in km/h."""
+    return (previous_speed + speed) / 2 / 3600
+
+
+def metric_graph(store: telemetry.TelemetryStore, profile: UserProfile = None) -> MetricGraph:
+    """The standard graph: pace, HR zones, calories, TRIMP, distance from integrated speed and HR per km/h."""
+    graph = MetricGraph(store, profile)
+    graph.node(PACE, (telemetry.SPEED,), pace)
+    graph.node(HR_ZONES, (PROFILE,), hr_zones)
+    graph.node(HR_ZONE, (telemetry.HR, HR_ZONES), hr_zone)
+    graph.node(CALORIES, (telemetry.HR, PROFILE), Integral(keytel_kcal_per_second))
+    graph.node(TRIMP, (telemetry.HR, PROFILE), Integral(banister_trimp_per_second))
+    graph.node(INTEGRATED_DISTANCE, (telemetry.SPEED,), Integral(trapezoid_km_per_second))
+    graph.node(HR_PER_KMH, (telemetry.HR, telemetry.SPEED), fusion.HeartRatePerSpeed())
+    return graph
+
+
+if __name__ == "__main__":
+    import timeit
+
+    # A 10 Hz treadmill session with a 4 Hz UI: only displayed metrics are computed, once per frame
+    store = telemetry.TelemetryStore()
+    graph = metric_graph(store, UserProfile(age=40, weight_kg=70))
+    shown = {}
+    for name in (PACE, INTEGRATED_DISTANCE, CALORIES):
+        graph.subscribe(name, lambda value, name=name: shown.__setitem__(name, value))
+
+    samples = 0
+
+    def session():
+        global samples
+        for frame in range(4 * 600):
+            for i in range(samples, samples + 3):
+                store.append(telemetry.SPEED, 10 + (i % 50) / 50, i / 10)
+                store.append(telemetry.HR, 140 + (i % 30), i / 10)
+            samples += 3
+            graph.refresh()
+
+    elapsed = timeit.timeit(session, number=1)
+    print(f"{samples} samples, {graph.computations} node computations in {elapsed * 1000:.0f} ms")
+    print(f"pace {shown[PACE]:.2f} min/km, distance {shown[INTEGRATED_DISTANCE]:.3f} km, "
+          f"{shown[CALORIES]:.0f} kcal; TRIMP {graph.get(TRIMP):.1f} computed only when read")
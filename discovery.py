@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import ble_backend
+
+DEFAULT_RSSI_SMOOTHING = 0.3
+DEFAULT_MAX_AGE = 30.0
+KNOWN_DEVICES_PATH = os.path.join(os.path.expanduser("~"), ".treadmill-app", "known_devices.json")
+
+
+class DiscoveredDevice:
+    """A device seen while scanning, with exponentially smoothed RSSI."""
+    __slots__ = ("device", "rssi", "first_seen", "last_seen", "index")
+
+    def __init__(self, device, rssi, now, index):
+        self.device = device
+        self.rssi = rssi
+        self.first_seen = now
+        self.last_seen = now
+        self.index = index
+
+    @property
+    def address(self):
+        return self.device.address
+
+    @property
+    def name(self):
+        return self.device.name
+
+
+class DiscoveryService:
+    """
+    One BLE scanner shared by every picker and CLI.
+
+    Advertisements are deduplicated through a dict keyed by address, so each
+    callback is O(1) regardless of how many devices are around. Devices not
+    heard from for `max_age` seconds are evicted.
+
+    Args:
+        service_uuids: Service UUIDs to filter on, or None for all devices.
+        on_new: Called with the DiscoveredDevice the first time it is seen.
+        match: Optional predicate on the BLEDevice; non-matching devices are ignored.
+    """
+
+    def __init__(self, service_uuids: Iterable[str] = None,
+                 on_new: Callable[[DiscoveredDevice], None] = None,
+                 match: Callable[[object], bool] = None,
+                 rssi_smoothing: float = DEFAULT_RSSI_SMOOTHING, max_age: float = DEFAULT_MAX_AGE,
+                 scanner_factory=ble_backend.scanner, clock=time.monotonic):
+        self.service_uuids = list(service_uuids) if service_uuids else None
+        self.on_new = on_new
+        self.match = match
+        self.rssi_smoothing = rssi_smoothing
+        self.max_age = max_age
+        self.scanner_factory = scanner_factory
+        self.clock = clock
+        self.devices: Dict[str, DiscoveredDevice] = {}
+        self.seen = 0
+        self.scanner = None
+        self._next_eviction = 0.0
+        self._found = asyncio.Event()
+
+    def detection_callback(self, device, advertisement_data) -> None:
+        now = self.clock()
+        entry = self.devices.get(device.address)
+        if entry is not None:
+            entry.device = device
+            entry.rssi += self.rssi_smoothing * (advertisement_data.rssi - entry.rssi)
+            entry.last_seen = now
+        elif self.match is None or self.match(device):
+            entry = self.devices[device.address] = DiscoveredDevice(device, advertisement_data.rssi, now, self.seen)
+            self.seen += 1
+            self._found.set()
+            if self.on_new is not None:
+                self.on_new(entry)
+        if now >= self._next_eviction:
+            self.evict(now)
+
+    def evict(self, now: float = None) -> None:
+        now = self.clock() if now is None else now
+        oldest = now - self.max_age
+        for address in [address for address, entry in self.devices.items() if entry.last_seen < oldest]:
+            del self.devices[address]
+        if not self.devices:
+            self._found.clear()
+        self._next_eviction = now + self.max_age / 4
+
+    def nearest(self) -> List[DiscoveredDevice]:
+        return sorted(self.devices.values(), key=lambda entry: entry.rssi, reverse=True)
+
+    async def start(self) -> None:
+        self.scanner = self.scanner_factory(self.detection_callback, self.service_uuids)
+        await self.scanner.start()
+
+    async def stop(self) -> None:
+        if self.scanner is not None:
+            await self.scanner.stop()
+            self.scanner = None
+
+    async def find(self, timeout: float = None) -> Optional[DiscoveredDevice]:
+        """Scan until the first matching device is seen and return it."""
+        if not self.devices:
+            started = self.scanner is None
+            if started:
+                await self.start()
+            try:
+                await asyncio.wait_for(self._found.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                if started:
+                    await self.stop()
+        if not self.devices:
+            return None
+        return min(self.devices.values(), key=lambda entry: entry.index)
+
+
+class KnownDevice(NamedTuple):
+    address: str
+    name: Optional[str]
+    last_connected: float
+
+
+class KnownDeviceCache:
+    """Last device used per service UUID, persisted as JSON so the next session can skip scanning."""
+
+    def __init__(self, path: str = KNOWN_DEVICES_PATH):
+        self.path = path
+        self.entries: Dict[str, KnownDevice] = {}
+        try:
+            with open(path) as file:
+                self.entries = {uuid: KnownDevice(**entry) for uuid, entry in json.load(file).items()}
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def last(self, service_uuid: str) -> Optional[KnownDevice]:
+        return self.entries.get(service_uuid)
+
+    def remember(self, service_uuid: str, device) -> None:
+        self.entries[service_uuid] = KnownDevice(device.address, device.name, time.time())
+        self._save()
+
+    def forget(self, service_uuid: str) -> None:
+        if self.entries.pop(service_uuid, None) is not None:
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({uuid: entry._asdict() for uuid, entry in self.entries.items()}, file, indent=2)
+        os.replace(temporary, self.path)
+
+
+async def find_device(service_uuid: str, known_devices: KnownDeviceCache,
+                      on_new: Callable[[DiscoveredDevice], None] = None, match: Callable[[object], bool] = None,
+                      key: str = None):
+    """
+    Return the last device used for `service_uuid` (or `key`), or scan for one.
+
+    A cached KnownDevice only carries the address and name; pass
+    connect_target(device) to BleakClient. A scanned device is remembered.
+    With `match`, the scan is not filtered by service UUID.
+    """
+    key = key or service_uuid
+    known = known_devices.last(key)
+    if known is not None:
+        return known
+    discovery = DiscoveryService([service_uuid] if match is None else None, on_new=on_new, match=match)
+    device = (await discovery.find()).device
+    known_devices.remember(key, device)
+    return device
+
+
+def connect_target(device):
+    """Address for a cached KnownDevice, the BLEDevice itself otherwise."""
+    return device.address if isinstance(device, KnownDevice) else device
+
+
+if __name__ == "__main__":
+    import timeit
+    from types import SimpleNamespace
+
+    # Busy gym: 500 advertisers, each advertising repeatedly
+    advertisers = [SimpleNamespace(address=f"AA:BB:CC:00:{i // 256:02X}:{i % 256:02X}", name=f"Device {i}")
+                   for i in range(500)]
+    advertisement = SimpleNamespace(rssi=-60)
+    stream = advertisers * 20
+
+    def list_dedupe():
+        discovered = []
+        for device in stream:
+            if device.address not in [d.address for d in discovered]:
+                discovered.append(device)
+
+    def service_dedupe():
+        service = DiscoveryService()
+        for device in stream:
+            service.detection_callback(device, advertisement)
+
+    legacy = timeit.timeit(list_dedupe, number=1)
+    indexed = timeit.timeit(service_dedupe, number=1)
+    print(f"list rebuild per callback: {legacy / len(stream) * 1e6:8.2f} us/advertisement")
+    print(f"DiscoveryService:          {indexed / len(stream) * 1e6:8.2f} us/advertisement")
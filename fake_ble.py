@@ -0,0 +1,529 @@
+import asyncio
+import math
+import random
+import struct
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional
+
+from bt_uuids import normalize_uuid_str
+
+import bt_device_information
+import bt_fitness_machine
+import bt_heart_rate
+import bt_running_speed_cadence
+import bt_user_data
+
+SERVICE_DESCRIPTIONS = {
+    bt_heart_rate.SERVICE_UUID: "Heart Rate",
+    bt_running_speed_cadence.SERVICE_UUID: "Running Speed and Cadence",
+    bt_fitness_machine.SERVICE_UUID: "Fitness Machine",
+    bt_user_data.SERVICE_UUID: "User Data",
+    bt_device_information.SERVICE_UUID: "Device Information",
+    bt_device_information.BATTERY_SERVICE_UUID: "Battery Service",
+}
+
+
+def encode_hr_measurement(hr: int, rr_intervals_ms: Iterable[float] = (), energy_kj: int = None) -> bytes:
+    """Spec-correct Heart Rate Measurement (0x2A37) payload."""
+    flags = bt_heart_rate.FLAG_SENSOR_CONTACT_SUPPORTED | bt_heart_rate.FLAG_SENSOR_CONTACT_DETECTED
+    body = bytearray()
+    if hr > 0xFF:
+        flags |= bt_heart_rate.FLAG_HR_UINT16
+        body += struct.pack("<H", hr)
+    else:
+        body.append(hr)
+    if energy_kj is not None:
+        flags |= bt_heart_rate.FLAG_ENERGY_EXPENDED_PRESENT
+        body += struct.pack("<H", energy_kj)
+    rr_intervals_ms = tuple(rr_intervals_ms)
+    if rr_intervals_ms:
+        flags |= bt_heart_rate.FLAG_RR_INTERVAL_PRESENT
+        for rr in rr_intervals_ms:
+            body += struct.pack("<H", round(rr / bt_heart_rate.RR_INTERVAL_RESOLUTION_MS))
+    return bytes([flags]) + bytes(body)
+
+
+def encode_rsc_measurement(speed_m_per_s: float, cadence: int, stride_length_m: float = None,
+                           total_distance_m: float = None, running: bool = True) -> bytes:
+    """Spec-correct RSC Measurement (0x2A53) payload."""
+    flags = bt_running_speed_cadence.FLAG_RUNNING if running else 0
+    body = struct.pack("<HB", round(speed_m_per_s * 256), cadence)
+    if stride_length_m is not None:
+        flags |= bt_running_speed_cadence.FLAG_STRIDE_LENGTH_PRESENT
+        body += struct.pack("<H", round(stride_length_m * 100))
+    if total_distance_m is not None:
+        flags |= bt_running_speed_cadence.FLAG_TOTAL_DISTANCE_PRESENT
+        body += struct.pack("<I", round(total_distance_m * 10))
+    return bytes([flags]) + body
+
+
+def encode_treadmill_data(speed_kmh: float, total_distance_m: int, inclination_pct: float,
+                          positive_elevation_gain_m: float, elapsed_time_s: int) -> bytes:
+    """Spec-correct Treadmill Data (0x2ACD) payload."""
+    flags = bt_fitness_machine.FLAG_TOTAL_DISTANCE | bt_fitness_machine.FLAG_INCLINATION \
+        | bt_fitness_machine.FLAG_ELEVATION_GAIN | bt_fitness_machine.FLAG_ELAPSED_TIME
+    return struct.pack("<HH3shhHHH", flags, round(speed_kmh * 100), int(total_distance_m).to_bytes(3, 'little'),
+                       round(inclination_pct * 10), round(inclination_pct * 10),
+                       round(positive_elevation_gain_m * 10), 0, elapsed_time_s)
+
+
+class FakeDevice(SimpleNamespace):
+    """Stands in for bleak's BLEDevice."""
+
+
+class FakeCharacteristic:
+    def __init__(self, uuid: str, description: str = ""):
+        self.uuid = normalize_uuid_str(uuid)
+        self.description = description
+
+    def __str__(self):
+        return self.uuid
+
+
+class FakeService:
+    def __init__(self, uuid: str, characteristics: Iterable[str]):
+        self.uuid = normalize_uuid_str(uuid)
+        self.description = SERVICE_DESCRIPTIONS.get(uuid, "Unknown")
+        self.characteristics = [FakeCharacteristic(characteristic) for characteristic in characteristics]
+
+
+class FakeServiceCollection:
+    def __init__(self, services: Iterable[FakeService]):
+        self.services = list(services)
+        self.characteristics = {characteristic.uuid: characteristic
+                                for service in self.services for characteristic in service.characteristics}
+
+    def __iter__(self):
+        return iter(self.services)
+
+    def get_characteristic(self, uuid):
+        return self.characteristics.get(normalize_uuid_str(str(uuid)))
+
+
+class SimulatedPeripheral:
+    """
+    A simulated sensor: advertised services, readable values and notifying characteristics.
+
+    Args:
+        rate: Notifications per second per notifying characteristic.
+        drop_after: Seconds after each connect at which the link drops, or None.
+        malformed_rate: Fraction of notifications truncated to one byte.
+        indication_loss: Fraction of write responses (indications) never delivered.
+        seed: Seed for the peripheral's own random generator.
+    """
+    kind = "peripheral"
+    services: Dict[str, Iterable[str]] = {}
+
+    def __init__(self, address: str, name: str = None, rate: float = 1.0, drop_after: float = None,
+                 malformed_rate: float = 0.0, indication_loss: float = 0.0, rssi: int = -60, seed: int = 0):
+        self.address = address
+        self.name = name or f"{self.kind} {address[-5:]}"
+        self.rate = rate
+        self.drop_after = drop_after
+        self.malformed_rate = malformed_rate
+        self.indication_loss = indication_loss
+        self.rssi = rssi
+        self.random = random.Random(seed)
+        self.device = FakeDevice(address=address, name=self.name, details=None)
+        self.service_collection = FakeServiceCollection(FakeService(uuid, characteristics)
+                                                        for uuid, characteristics in self.services.items())
+        self.values: Dict[str, bytes] = {
+            bt_device_information.battery_level_uuid(): bytes([self.random.randint(20, 100)]),
+            normalize_uuid_str(bt_device_information.CHARACTERISTIC_UUIDS["Manufacturer Name"]): b"Simulated",
+            normalize_uuid_str(bt_device_information.CHARACTERISTIC_UUIDS["Model Number"]): self.kind.encode(),
+        }
+
+    @property
+    def advertised_uuids(self) -> List[str]:
+        return [normalize_uuid_str(uuid) for uuid in self.services
+                if uuid not in (bt_device_information.SERVICE_UUID, bt_device_information.BATTERY_SERVICE_UUID)]
+
+    def notifying(self) -> Dict[str, Callable[[float], bytes]]:
+        """Notifying characteristic UUID -> payload generator taking seconds since connect."""
+        return {}
+
+    def write(self, uuid: str, data: bytes) -> Optional[bytes]:
+        """Handle a write; returns the indication to send back on the same characteristic, if any."""
+        return None
+
+    def payload(self, uuid: str, elapsed: float) -> bytes:
+        data = self.notifying()[uuid](elapsed)
+        if self.malformed_rate and self.random.random() < self.malformed_rate:
+            return data[:1]
+        return data
+
+
+class HeartRateStrap(SimulatedPeripheral):
+    kind = "HR Strap"
+    services = {
+        bt_heart_rate.SERVICE_UUID: (bt_heart_rate.MEASUREMENT_CHARACTERISTIC_UUID,),
+        bt_device_information.SERVICE_UUID: tuple(bt_device_information.CHARACTERISTIC_UUIDS.values())[:2],
+        bt_device_information.BATTERY_SERVICE_UUID: (bt_device_information.BATTERY_LEVEL_CHARACTERISTIC_UUID,),
+    }
+
+    def measurement(self, elapsed):
+        hr = round(130 + 25 * math.sin(elapsed / 60) + self.random.uniform(-2, 2))
+        return encode_hr_measurement(hr, [60000 / hr + self.random.uniform(-15, 15)])
+
+    def notifying(self):
+        return {bt_heart_rate.measurement_uuid(): self.measurement}
+
+
+class RSCPod(SimulatedPeripheral):
+    kind = "RSC Pod"
+    services = {
+        bt_running_speed_cadence.SERVICE_UUID: (bt_running_speed_cadence.MEASUREMENT_CHARACTERISTIC_UUID,
+                                                bt_running_speed_cadence.FEATURE_CHARACTERISTIC_UUID),
+        bt_device_information.BATTERY_SERVICE_UUID: (bt_device_information.BATTERY_LEVEL_CHARACTERISTIC_UUID,),
+    }
+
+    def speed(self, elapsed):
+        return 2.5 + 0.5 * math.sin(elapsed / 120)
+
+    def measurement(self, elapsed):
+        speed = self.speed(elapsed)
+        distance = 2.5 * elapsed - 60 * math.cos(elapsed / 120) + 60
+        return encode_rsc_measurement(speed, 160 + self.random.randint(-3, 3), 1.1, distance)
+
+    def notifying(self):
+        return {bt_running_speed_cadence.measurement_uuid(): self.measurement}
+
+
+class FTMSTreadmill(RSCPod):
+    kind = "Treadmill"
+    features = bt_fitness_machine.FEATURE_TOTAL_DISTANCE | bt_fitness_machine.FEATURE_INCLINATION \
+        | bt_fitness_machine.FEATURE_ELEVATION_GAIN | bt_fitness_machine.FEATURE_ELAPSED_TIME
+    services = {
+        bt_fitness_machine.SERVICE_UUID: (bt_fitness_machine.FEATURE_CHARACTERISTIC_UUID,
+                                          bt_fitness_machine.TREADMILL_DATA_CHARACTERISTIC_UUID,
+                                          bt_fitness_machine.TRAINING_STATUS_CHARACTERISTIC_UUID,
+                                          bt_fitness_machine.SUPPORTED_SPEED_RANGE_CHARACTERISTIC_UUID,
+                                          bt_fitness_machine.SUPPORTED_INCLINATION_RANGE_CHARACTERISTIC_UUID,
+                                          bt_fitness_machine.CONTROL_POINT_CHARACTERISTIC_UUID,
+                                          bt_fitness_machine.STATUS_CHARACTERISTIC_UUID),
+        bt_running_speed_cadence.SERVICE_UUID: (bt_running_speed_cadence.MEASUREMENT_CHARACTERISTIC_UUID,),
+        bt_user_data.SERVICE_UUID: (bt_user_data.AGE_CHARACTERISTIC_UUID, bt_user_data.GENDER_CHARACTERISTIC_UUID,
+                                    bt_user_data.WEIGHT_CHARACTERISTIC_UUID),
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values.update({
+            bt_fitness_machine.feature_uuid(): struct.pack("<II", self.features, 0),
+            bt_fitness_machine.supported_speed_range_uuid(): struct.pack("<HHH", 100, 2000, 10),
+            bt_fitness_machine.supported_inclination_range_uuid(): struct.pack("<hhH", 0, 150, 5),
+            bt_user_data.age_uuid(): bytes([35]),
+            bt_user_data.gender_uuid(): b"\x00",
+            bt_user_data.weight_uuid(): struct.pack("<H", 75 * 200),
+        })
+        self.controlled = False
+        self.running = True
+        self.target_speed_kmh = None
+        self.target_inclination_pct = None
+
+    def speed(self, elapsed):
+        if not self.running:
+            return 0.0
+        if self.target_speed_kmh is not None:
+            return self.target_speed_kmh / 3.6
+        return super().speed(elapsed)
+
+    def write(self, uuid, data):
+        if uuid != bt_fitness_machine.control_point_uuid() or not data:
+            return None
+        op_code = data[0]
+        result = bt_fitness_machine.RESULT_SUCCESS
+        if op_code == bt_fitness_machine.CONTROL_REQUEST_CONTROL:
+            self.controlled = True
+        elif not self.controlled:
+            result = bt_fitness_machine.RESULT_CONTROL_NOT_PERMITTED
+        elif op_code == bt_fitness_machine.CONTROL_RESET:
+            self.controlled = False
+            self.target_speed_kmh = self.target_inclination_pct = None
+        elif op_code == bt_fitness_machine.CONTROL_SET_TARGET_SPEED and len(data) >= 3:
+            self.target_speed_kmh = struct.unpack_from("<H", data, 1)[0] / 100
+        elif op_code == bt_fitness_machine.CONTROL_SET_TARGET_INCLINATION and len(data) >= 3:
+            self.target_inclination_pct = struct.unpack_from("<h", data, 1)[0] / 10
+        elif op_code == bt_fitness_machine.CONTROL_START_OR_RESUME:
+            self.running = True
+        elif op_code == bt_fitness_machine.CONTROL_STOP_OR_PAUSE:
+            self.running = False
+        else:
+            result = 0x02 if op_code in (0x04, 0x05, 0x06) or op_code > 0x08 else 0x03
+        return bytes((bt_fitness_machine.CONTROL_RESPONSE_CODE, op_code, result))
+
+    def treadmill_data(self, elapsed):
+        incline = 2.0 + 2.0 * math.sin(elapsed / 300) if self.target_inclination_pct is None \
+            else self.target_inclination_pct
+        distance = 2.5 * elapsed - 60 * math.cos(elapsed / 120) + 60
+        return encode_treadmill_data(self.speed(elapsed) * 3.6, int(distance), round(incline, 1),
+                                     distance * incline / 100, int(elapsed))
+
+    def notifying(self):
+        return {bt_running_speed_cadence.measurement_uuid(): self.measurement,
+                bt_fitness_machine.treadmill_data_uuid(): self.treadmill_data}
+
+
+class FakeClient:
+    """The subset of BleakClient the app uses, backed by a SimulatedPeripheral."""
+
+    def __init__(self, address_or_device, disconnected_callback=None, timeout: float = 10.0, *,
+                 backend: "FakeBackend"):
+        self.address = getattr(address_or_device, "address", address_or_device)
+        self.disconnected_callback = disconnected_callback
+        self.timeout = timeout
+        self.backend = backend
+        self.peripheral: Optional[SimulatedPeripheral] = None
+        self.is_connected = False
+        self.notify_tasks: Dict[str, asyncio.Task] = {}
+        self.indication_callbacks: Dict[str, Callable] = {}
+        self.handler_errors = 0
+        self.connected_at = 0.0
+
+    @property
+    def services(self) -> FakeServiceCollection:
+        return self.peripheral.service_collection
+
+    async def connect(self) -> bool:
+        peripheral = self.backend.peripherals.get(self.address)
+        await asyncio.sleep(self.backend.connect_latency)
+        if peripheral is None:
+            from bleak.exc import BleakDeviceNotFoundError
+            raise BleakDeviceNotFoundError(self.address, f"Device with address {self.address} was not found.")
+        self.peripheral = peripheral
+        self.is_connected = True
+        self.connected_at = time.monotonic()
+        return True
+
+    async def disconnect(self) -> bool:
+        self._stop_tasks()
+        self.is_connected = False
+        return True
+
+    async def read_gatt_char(self, characteristic) -> bytearray:
+        await asyncio.sleep(self.backend.read_latency)
+        uuid = normalize_uuid_str(str(getattr(characteristic, "uuid", characteristic)))
+        return bytearray(self.peripheral.values.get(uuid, b""))
+
+    async def write_gatt_char(self, characteristic, data, response: bool = None) -> None:
+        await asyncio.sleep(self.backend.read_latency)
+        uuid = normalize_uuid_str(str(getattr(characteristic, "uuid", characteristic)))
+        peripheral = self.peripheral
+        indication = peripheral.write(uuid, bytes(data))
+        callback = self.indication_callbacks.get(uuid)
+        if indication is None or callback is None:
+            return
+        if peripheral.indication_loss and peripheral.random.random() < peripheral.indication_loss:
+            return
+        asyncio.get_running_loop().call_later(self.backend.read_latency, callback, uuid, bytearray(indication))
+
+    async def start_notify(self, characteristic, callback) -> None:
+        uuid = normalize_uuid_str(str(getattr(characteristic, "uuid", characteristic)))
+        if uuid in self.peripheral.notifying():
+            self.notify_tasks[uuid] = asyncio.create_task(self._notify(uuid, callback))
+        else:
+            self.indication_callbacks[uuid] = callback
+
+    async def stop_notify(self, characteristic) -> None:
+        uuid = normalize_uuid_str(str(getattr(characteristic, "uuid", characteristic)))
+        self.indication_callbacks.pop(uuid, None)
+        task = self.notify_tasks.pop(uuid, None)
+        if task is not None:
+            task.cancel()
+
+    async def _notify(self, uuid, callback) -> None:
+        peripheral = self.peripheral
+        interval = 1 / peripheral.rate
+        started = time.monotonic()
+        tick = 0
+        stats = self.backend.stats
+        while True:
+            tick += 1
+            due = started + tick * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            now = time.monotonic()
+            if peripheral.drop_after is not None and now - self.connected_at >= peripheral.drop_after:
+                self._drop()
+                return
+            stats.record(now - due)
+            try:
+                callback(uuid, bytearray(peripheral.payload(uuid, now - started)))
+            except Exception:
+                # bleak logs exceptions raised by notification callbacks and keeps going
+                self.handler_errors += 1
+
+    def _stop_tasks(self) -> None:
+        current = asyncio.current_task()
+        for task in self.notify_tasks.values():
+            if task is not current:
+                task.cancel()
+        self.notify_tasks.clear()
+
+    def _drop(self) -> None:
+        self._stop_tasks()
+        self.is_connected = False
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+
+class FakeScanner:
+    """The subset of BleakScanner the app uses: a detection callback and a service UUID filter."""
+
+    def __init__(self, detection_callback=None, service_uuids=None, *, backend: "FakeBackend"):
+        self.detection_callback = detection_callback
+        self.service_uuids = {normalize_uuid_str(uuid) for uuid in service_uuids} if service_uuids else None
+        self.backend = backend
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._advertise())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _advertise(self) -> None:
+        rng = self.backend.random
+        while True:
+            for peripheral in list(self.backend.peripherals.values()):
+                uuids = peripheral.advertised_uuids
+                if self.service_uuids is not None and self.service_uuids.isdisjoint(uuids):
+                    continue
+                advertisement = SimpleNamespace(rssi=peripheral.rssi + rng.randint(-6, 6), service_uuids=uuids,
+                                                local_name=peripheral.name)
+                result = self.detection_callback(peripheral.device, advertisement)
+                if asyncio.iscoroutine(result):
+                    await result
+            await asyncio.sleep(self.backend.advertising_interval)
+
+
+class DeliveryStats:
+    """Notification count and lateness against each notification's schedule."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def record(self, lateness: float) -> None:
+        self.count += 1
+        self.total_lateness += lateness
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+
+    @property
+    def mean_lateness(self) -> float:
+        return self.total_lateness / self.count if self.count else 0.0
+
+
+class FakeBackend:
+    """
+    A set of simulated peripherals plus scanner and client factories shaped like bleak's.
+
+    Install it with ble_backend.use(backend), or run any entry point with
+    TREADMILL_BLE_BACKEND=fake to get FakeBackend.default().
+    """
+
+    def __init__(self, peripherals: Iterable[SimulatedPeripheral] = (), seed: int = 0,
+                 advertising_interval: float = 0.1, connect_latency: float = 0.05, read_latency: float = 0.03):
+        self.peripherals: Dict[str, SimulatedPeripheral] = {}
+        self.random = random.Random(seed)
+        self.advertising_interval = advertising_interval
+        self.connect_latency = connect_latency
+        self.read_latency = read_latency
+        self.stats = DeliveryStats()
+        for peripheral in peripherals:
+            self.add(peripheral)
+
+    def add(self, peripheral: SimulatedPeripheral) -> SimulatedPeripheral:
+        self.peripherals[peripheral.address] = peripheral
+        return peripheral
+
+    def scanner_factory(self, detection_callback=None, service_uuids=None, **kwargs) -> FakeScanner:
+        return FakeScanner(detection_callback, service_uuids, backend=self)
+
+    def client_factory(self, address_or_device, disconnected_callback=None, timeout: float = 10.0,
+                       **kwargs) -> FakeClient:
+        return FakeClient(address_or_device, disconnected_callback, timeout, backend=self)
+
+    @classmethod
+    def default(cls) -> "FakeBackend":
+        return cls([HeartRateStrap("F0:00:00:00:00:01", "Polar H10 SIM0001", rate=1, seed=1),
+                    RSCPod("F0:00:00:00:00:02", "Sim Pod", rate=2, seed=2),
+                    FTMSTreadmill("F0:00:00:00:00:03", "Sim Treadmill", rate=4, seed=3)])
+
+    @classmethod
+    def gym(cls, straps: int, treadmills: int, rate: float, seed: int = 0, **kwargs) -> "FakeBackend":
+        backend = cls(seed=seed)
+        for i in range(straps):
+            backend.add(HeartRateStrap(f"F1:00:00:00:{i // 256:02X}:{i % 256:02X}", rate=rate, seed=seed + i, **kwargs))
+        for i in range(treadmills):
+            backend.add(FTMSTreadmill(f"F2:00:00:00:{i // 256:02X}:{i % 256:02X}", rate=rate,
+                                      seed=seed + straps + i, **kwargs))
+        return backend
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from connection_manager import ConnectionManager, SensorLink
+    from recorder import telemetry_handlers
+    from telemetry import TelemetryStore
+
+    parser = argparse.ArgumentParser(description="Load test the sensor pipeline against simulated devices.")
+    parser.add_argument("--straps", type=int, default=25)
+    parser.add_argument("--treadmills", type=int, default=25)
+    parser.add_argument("--rate", type=float, default=10, help="Notifications per second per characteristic")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--drop-after", type=float, default=None, help="Drop every link after this many seconds")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Fraction of truncated notifications")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    async def load_test():
+        backend = FakeBackend.gym(args.straps, args.treadmills, args.rate, seed=args.seed,
+                                  drop_after=args.drop_after, malformed_rate=args.malformed)
+        manager = ConnectionManager()
+        handled = 0
+        malformed = 0
+
+        def counting(handler):
+            def notification_handler(sender, data):
+                nonlocal handled, malformed
+                try:
+                    handler(sender, data)
+                    handled += 1
+                except ValueError:
+                    malformed += 1
+            return notification_handler
+
+        for address, peripheral in backend.peripherals.items():
+            handlers = telemetry_handlers(TelemetryStore(capacity=1024))
+            manager.add(SensorLink(address, peripheral.device,
+                                   {uuid: counting(handlers[uuid]) for uuid in peripheral.notifying()},
+                                   client_factory=backend.client_factory))
+        started = time.perf_counter()
+        await manager.wait_connected()
+        connected = time.perf_counter() - started
+        await asyncio.sleep(args.seconds)
+        elapsed = time.perf_counter() - started
+        reconnects = sum(link.reconnects for link in manager.links.values())
+        await manager.close()
+        print(f"{len(backend.peripherals)} devices connected in {connected:.2f} s")
+        print(f"{handled} notifications handled in {elapsed:.1f} s ({handled / elapsed:.0f}/s), "
+              f"{malformed} malformed, {reconnects} reconnects")
+        print(f"delivery lateness: mean {backend.stats.mean_lateness * 1000:.2f} ms, "
+              f"max {backend.stats.max_lateness * 1000:.2f} ms")
+
+    asyncio.run(load_test())
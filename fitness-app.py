@@ -1,30 +1,86 @@
+import argparse
 import asyncio
-from bleak import BleakClient, BLEDevice
-from textual import on, work
+import time
+from textual import on
 from textual.app import App, ComposeResult
-from textual.containers import HorizontalScroll
+from textual.containers import HorizontalScroll, Vertical
 from textual.reactive import reactive
 from textual.widgets import Button, Header, Footer, Log
-from textual.worker import Worker
 import bt_heart_rate
+import derived
+import instrumentation
+import recorder
+import telemetry
 from bluetooth_device_picker import BluetoothDevicePicker
+from connection_manager import ConnectionManager, LinkState, SensorLink
+from discovery import KnownDeviceCache, connect_target
 from heart_rate_tile import HeartRateTile
+from hrv import HRVStream
+from hrv_tile import HRVTile
+from session_store import DEFAULT_ATHLETE, SessionStore
+from stats_panel import StatsPanel
+from telemetry import TelemetryStore
+from telemetry_server import DEFAULT_SOCKET_PATH, TelemetryClient
+from trend_chart import TrendChart
+from ui_scheduler import UpdateScheduler
 
 
 class FitnessApp(App):
-    hr_worker: Worker = None
     hr: reactive[int] = reactive(0)
+    rmssd: reactive[int] = reactive(0)
+    hr_zone: reactive[int] = reactive(0)
+    calories: reactive[int] = reactive(0)
     CSS_PATH = "fitness-app.tcss"
+    UI_RATE = 10
     BINDINGS = [
-        ("h", "connect_hr('red')", "Connect HR")
+        ("h", "connect_hr", "Connect HR"),
+        ("r", "reconnect_hr", "Reconnect last HR"),
+        ("s", "toggle_stats", "Stats"),
+        ("t", "toggle_trend", "Trend: 5 min / session")
     ]
 
+    def __init__(self, attach: str = None, athlete: str = DEFAULT_ATHLETE):
+        super().__init__()
+        self.attach = attach
+        self.attached = None
+        self.athlete = athlete
+        self.sessions = SessionStore()
+        self.session = None
+        self.telemetry = TelemetryStore()
+        self.connections = ConnectionManager()
+        self.hr_log = None
+        self.known_devices = KnownDeviceCache()
+        self.ui = UpdateScheduler(self.UI_RATE, after_paint=self.call_after_refresh)
+        self.ui.subscribe("hr", self.set_hr)
+        self.ui.subscribe("rmssd", self.set_rmssd)
+        self.hrv = HRVStream()
+        self.metrics = derived.metric_graph(self.telemetry)
+        self.metrics.subscribe(derived.HR_ZONES, self.telemetry[telemetry.HR].set_zones)
+        self.metrics.subscribe(derived.HR_ZONE, self.set_hr_zone)
+        self.metrics.subscribe(derived.CALORIES, self.set_calories)
+        self.metrics.subscribe(derived.HR_PER_KMH, self.set_hr_per_kmh)
+        self.ui.before_flush(self.metrics.refresh)
+        self.stats = instrumentation.registry
+        self.parse_hr = self.stats.timed("hr.decode", bt_heart_rate.parse_hr_measurement)
+        self.loop_watch = None
+        self.trends = []
+        self.record_trends = self.stats.histogram("ui.trends").record
+        self.ui.before_flush(self.update_trends)
+        self.ui.before_flush(self.pull_session)
+
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
         yield Footer()
-        yield HorizontalScroll(HeartRateTile().data_bind(FitnessApp.hr),
+        yield HorizontalScroll(HeartRateTile(self.telemetry[telemetry.HR]).data_bind(
+                                   FitnessApp.hr, zone=FitnessApp.hr_zone, calories=FitnessApp.calories),
+                               HRVTile(self.hrv).data_bind(FitnessApp.rmssd),
                                Button("Connect HR", id="connect-hr", variant="success"),
                                Button("Disconnect HR", id="disconnect-hr", variant="error"))
+        with Vertical(id="trends"):
+            yield TrendChart(self.telemetry[telemetry.HR], "bpm", step=10)
+            yield TrendChart(self.telemetry[telemetry.SPEED], "km/h", step=1)
+            yield TrendChart(self.telemetry[telemetry.INCLINE], "%", step=1)
+        yield StatsPanel(self.stats)
         yield Log()
 
     @on(Button.Pressed, "#connect-hr")
@@ -33,48 +89,190 @@ class FitnessApp(App):
         self.push_screen(BluetoothDevicePicker(bt_heart_rate.service_uuid()), self.hr_device_selected)
 
     @on(Button.Pressed, "#disconnect-hr")
-    def disconnect_hr_pressed(self) -> None:
-        self.append_log("Cancelling HR worker...")
-        if self.hr_worker and self.hr_worker.is_running:
-            self.hr_worker.cancel()
-        self.hr = 0
+    async def disconnect_hr_pressed(self) -> None:
+        self.append_log("Disconnecting HR...")
+        await self.disconnect_hr()
 
-    async def hr_device_selected(self, device: BLEDevice) -> None:
+    async def hr_device_selected(self, device) -> None:
         if device is not None:
             self.append_log(f"Connecting to {device.name}...")
-            self.hr_worker = self.connect_hr(device)
+            self.known_devices.remember(bt_heart_rate.service_uuid(), device)
+            await self.disconnect_hr()
+            self.connect_hr(device)
         else:
             self.append_log("No device selected.")
 
     def append_log(self, message: str) -> None:
         self.query_one(Log).write_line(message)
 
+    def set_hr(self, hr: int) -> None:
+        self.hr = hr
+
+    def set_rmssd(self, rmssd: int) -> None:
+        self.rmssd = rmssd
+
+    def set_hr_zone(self, zone: int) -> None:
+        self.hr_zone = zone or 0
+
+    def set_calories(self, calories: float) -> None:
+        self.calories = round(calories)
+
+    def set_hr_per_kmh(self, ratio: float) -> None:
+        # Only with HR and speed both streaming, e.g. attached to a server running both sensors
+        self.sub_title = f"{ratio:g} bpm per km/h (1 min)" if ratio is not None else ""
+
+    def flush_ui(self) -> None:
+        with self.batch_update():
+            self.ui.flush()
+
+    def update_trends(self) -> None:
+        started = time.perf_counter_ns()
+        for chart in self.trends:
+            # Charts for channels that have no data yet (no treadmill) stay hidden
+            if not chart.display and chart.channel.count:
+                chart.display = True
+            chart.update_trend()
+        self.record_trends(time.perf_counter_ns() - started)
+
     def on_mount(self) -> None:
         self.append_log("Welcome to the Fitness App!")
+        self.trends = list(self.query(TrendChart))
+        self.set_interval(self.ui.interval, self.flush_ui)
+        self.loop_watch = asyncio.create_task(self.stats.watch_loop())
+        if self.attach is not None:
+            self.attached = asyncio.create_task(self.attach_telemetry(self.attach))
+
+    async def on_unmount(self) -> None:
+        if self.loop_watch is not None:
+            self.loop_watch.cancel()
+        if self.attached is not None:
+            self.attached.cancel()
+        for link in self.connections.links.values():
+            link.on_state = None
+        await self.connections.close()
+        if self.hr_log is not None:
+            self.hr_log.close()
+        self.end_session()
+        await asyncio.to_thread(self.sessions.sync)
+        self.sessions.close()
 
-    def on_unmount(self) -> None:
-        pass
+    def link_state_changed(self, link: SensorLink) -> None:
+        message = f"{link.name.upper()} {link.state.value}"
+        if link.state is LinkState.CONNECTED and link.reconnect_latency is not None:
+            message += f" (reconnected in {link.reconnect_latency:.2f} s)"
+        self.append_log(message)
 
-    @work(thread=False)
-    async def connect_hr(self, device) -> None:
+    def connect_hr(self, device) -> None:
         self.append_log("Subscribing for HR notifications...")
+        target = connect_target(device)
+
+        log = self.hr_log = recorder.session_recorder("hr")
+        self.start_session(device.address, "hr")
+        hrv = self.hrv
+        hrv.reset()
 
         def heart_rate_handler(sender, data):
-            self.hr = bt_heart_rate.parse_hr_data(data)
+            now = time.monotonic()
+            log.record(device.address, bt_heart_rate.measurement_uuid(), data, now)
+            measurement = self.parse_hr(data)
+            self.telemetry.append(telemetry.HR, measurement.hr, now)
+            self.telemetry.extend(telemetry.RR, measurement.rr_intervals, now)
+            self.ui.publish("hr", measurement.hr)
+            if measurement.rr_intervals:
+                hrv.extend(measurement.rr_intervals)
+                if hrv.rmssd is not None:
+                    self.ui.publish("rmssd", round(hrv.rmssd))
+
+        self.connections.add(SensorLink("hr", target, {bt_heart_rate.measurement_uuid(): self.stats.handler("hr", heart_rate_handler)},
+                                        on_state=self.link_state_changed))
 
-        async with BleakClient(device) as client:
-            await client.start_notify(bt_heart_rate.measurement_uuid(), heart_rate_handler)
-            while True:
-                await asyncio.sleep(1)
-                # TODO: Handle disconnection
-        self.append_log("Worker exit...")
+    async def attach_telemetry(self, path: str) -> None:
+        """Show samples served by a headless telemetry_server instead of connecting to the strap."""
+        client = TelemetryClient(path)
+        try:
+            await client.connect()
+        except (OSError, ValueError) as e:
+            self.append_log(f"Cannot attach to {path}: {e}")
+            return
+        self.append_log(f"Attached to telemetry server at {path}")
+        self.start_session(path, "attach")
+        hrv = self.hrv
+        hrv.reset()
+        try:
+            async for sample in client:
+                if sample.channel == telemetry.HR:
+                    self.telemetry.append(telemetry.HR, sample.value, sample.timestamp)
+                    self.ui.publish("hr", round(sample.value))
+                elif sample.channel == telemetry.RR:
+                    self.telemetry.append(telemetry.RR, sample.value, sample.timestamp)
+                    if hrv.add(sample.value) and hrv.rmssd is not None:
+                        self.ui.publish("rmssd", round(hrv.rmssd))
+                else:
+                    self.telemetry.append(sample.channel, sample.value, sample.timestamp)
+            self.append_log("Telemetry server closed the connection.")
+        finally:
+            await client.close()
+            self.end_session()
 
-    async def action_connect_hr(self) -> None:
+    def start_session(self, device: str, kind: str) -> None:
+        self.end_session()
+        self.session = self.sessions.start(device, kind, self.athlete, self.telemetry)
+
+    def pull_session(self) -> None:
+        if self.session is not None:
+            self.session.pull(self.telemetry)
+
+    def end_session(self) -> None:
+        """Write the last samples and queue the session's rollups (computed on the store's writer thread)."""
+        if self.session is not None:
+            self.session.pull(self.telemetry)
+            self.session.close(self.metrics.get(derived.HR_ZONES))
+            self.session = None
+
+    async def disconnect_hr(self) -> None:
+        await self.connections.remove("hr")
+        if self.hr_log is not None:
+            self.hr_log.close()
+            self.hr_log = None
+        self.end_session()
+        self.ui.publish("hr", 0)
+        self.ui.publish("rmssd", 0)
+
+    def action_connect_hr(self) -> None:
         """ Connect to HR Monitor """
-        self.append_log("Connecting to HR Monitor")
-        self.hr_worker = self.connect_hr()
+        self.connect_hr_pressed()
 
+    def action_toggle_stats(self) -> None:
+        """ Show or hide handler, decode, jitter and loop lag stats """
+        panel = self.query_one(StatsPanel)
+        panel.display = not panel.display
+        panel.refresh_stats()
 
-if __name__ == "__main__":
-    app = FitnessApp()
+    def action_toggle_trend(self) -> None:
+        """ Switch the trend charts between the last 5 minutes and the whole session """
+        for chart in self.trends:
+            chart.session = not chart.session
+
+    async def action_reconnect_hr(self) -> None:
+        """ Reconnect to the last HR Monitor by address, without scanning """
+        known = self.known_devices.last(bt_heart_rate.service_uuid())
+        if known is None:
+            self.connect_hr_pressed()
+            return
+        self.append_log(f"Reconnecting to {known.name}...")
+        await self.disconnect_hr()
+        self.connect_hr(known)
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Fitness App")
+    parser.add_argument("--attach", metavar="SOCKET", nargs="?", const=DEFAULT_SOCKET_PATH,
+                        help="Read samples from a running telemetry_server instead of connecting to sensors")
+    parser.add_argument("--athlete", default=DEFAULT_ATHLETE, help="Athlete the sessions are stored under")
+    args = parser.parse_args(argv)
+    app = FitnessApp(attach=args.attach, athlete=args.athlete)
     app.run()
+
+
+if __name__ == "__main__":
+    cli()
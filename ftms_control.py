@@ -0,0 +1,237 @@
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import ble_backend
+import bt_fitness_machine
+import instrumentation
+from ui_scheduler import LatencyStats
+
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_RETRIES = 2
+
+
+class ControlPointError(Exception):
+    """The machine answered a Control Point command with a result other than Success."""
+
+    def __init__(self, op_code: int, result: int):
+        super().__init__(f"Control Point op code 0x{op_code:02X} failed: "
+                         f"{bt_fitness_machine.CONTROL_RESULTS.get(result, 'Reserved')}")
+        self.op_code = op_code
+        self.result = result
+
+
+class ControlPointTimeout(ControlPointError):
+    """No response indication arrived for a Control Point command, even after retries."""
+
+    def __init__(self, op_code: int, attempts: int):
+        Exception.__init__(self, f"Control Point op code 0x{op_code:02X} got no response after {attempts} attempts")
+        self.op_code = op_code
+        self.result = None
+
+
+class ControlPoint:
+    """
+    Serialized, acknowledged commands over the FTMS Control Point.
+
+    The spec allows one outstanding procedure, so commands are sent one at a
+    time: each write waits for the Response Code indication, times out after
+    `timeout` seconds and is retried up to `retries` times. A command refused
+    with Control Not Permitted requests control once and is sent again.
+
+    Target speed and incline are coalesced: set_target_speed() and
+    set_target_incline() only record the newest value, and a single sender
+    task writes whatever is newest when the previous command has been
+    acknowledged, so a fast interval workout never builds a backlog.
+    Write-to-ack latency is kept in `latency` and in the "ftms.ack"
+    instrumentation histogram.
+
+    Args:
+        client: A connected BleakClient (or ble_backend client).
+        timeout: Seconds to wait for each response indication.
+        retries: Extra attempts after a timeout.
+    """
+
+    def __init__(self, client, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 stats: instrumentation.Instrumentation = instrumentation.registry):
+        self.client = client
+        self.timeout = timeout
+        self.retries = retries
+        self.lock = asyncio.Lock()
+        self.latency = LatencyStats()
+        self.ack_histogram = stats.histogram("ftms.ack")
+        self.targets: Dict[int, float] = {}
+        self.sent_targets: Dict[int, float] = {}
+        self.superseded = 0
+        self.timeouts = 0
+        self.last_error: Optional[Exception] = None
+        self.has_control = False
+        self._pending: Optional[tuple] = None
+        self._sender: Optional[asyncio.Task] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def start(self) -> None:
+        """Subscribe to Control Point indications; call once after connecting."""
+        await self.client.start_notify(bt_fitness_machine.control_point_uuid(), self._indication)
+
+    def _indication(self, sender, data) -> None:
+        try:
+            response = bt_fitness_machine.parse_control_point_response(data)
+        except ValueError:
+            return
+        pending = self._pending
+        # A late response to an attempt that already timed out is dropped here
+        if pending is not None and pending[0] == response.request_op_code and not pending[1].done():
+            pending[1].set_result(response.result)
+
+    async def _send(self, payload: bytes) -> None:
+        op_code = payload[0]
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            future = loop.create_future()
+            self._pending = (op_code, future)
+            started = time.perf_counter()
+            try:
+                await self.client.write_gatt_char(bt_fitness_machine.control_point_uuid(), payload, response=True)
+                result = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                continue
+            finally:
+                self._pending = None
+            latency = time.perf_counter() - started
+            self.latency.add(latency)
+            self.ack_histogram.record(int(latency * 1e9))
+            if result == bt_fitness_machine.RESULT_SUCCESS:
+                return
+            raise ControlPointError(op_code, result)
+        raise ControlPointTimeout(op_code, self.retries + 1)
+
+    async def execute(self, payload: bytes) -> None:
+        """Send one command and wait for its acknowledgement."""
+        async with self.lock:
+            try:
+                await self._send(payload)
+            except ControlPointError as e:
+                if e.result != bt_fitness_machine.RESULT_CONTROL_NOT_PERMITTED \
+                        or payload[0] == bt_fitness_machine.CONTROL_REQUEST_CONTROL:
+                    raise
+                self.has_control = False
+                await self._send(bt_fitness_machine.encode_request_control())
+                self.has_control = True
+                await self._send(payload)
+            if payload[0] == bt_fitness_machine.CONTROL_REQUEST_CONTROL:
+                self.has_control = True
+
+    async def request_control(self) -> None:
+        await self.execute(bt_fitness_machine.encode_request_control())
+
+    async def reset(self) -> None:
+        await self.execute(bt_fitness_machine.encode_reset())
+        self.has_control = False
+
+    async def start_or_resume(self) -> None:
+        await self.execute(bt_fitness_machine.encode_start_or_resume())
+
+    async def stop(self) -> None:
+        await self.execute(bt_fitness_machine.encode_stop_or_pause(bt_fitness_machine.STOP))
+
+    async def pause(self) -> None:
+        await self.execute(bt_fitness_machine.encode_stop_or_pause(bt_fitness_machine.PAUSE))
+
+    def set_target_speed(self, speed_kmh: float) -> None:
+        self._set_target(bt_fitness_machine.CONTROL_SET_TARGET_SPEED, speed_kmh)
+
+    def set_target_incline(self, inclination_pct: float) -> None:
+        self._set_target(bt_fitness_machine.CONTROL_SET_TARGET_INCLINATION, inclination_pct)
+
+    def _set_target(self, op_code: int, value: float) -> None:
+        if op_code in self.targets:
+            self.superseded += 1
+        self.targets[op_code] = value
+        self._idle.clear()
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send_targets())
+
+    async def _send_targets(self) -> None:
+        encoders = {bt_fitness_machine.CONTROL_SET_TARGET_SPEED: bt_fitness_machine.encode_set_target_speed,
+                    bt_fitness_machine.CONTROL_SET_TARGET_INCLINATION: bt_fitness_machine.encode_set_target_inclination}
+        try:
+            while self.targets:
+                op_code = next(iter(self.targets))
+                value = self.targets.pop(op_code)
+                if self.sent_targets.get(op_code) == value:
+                    continue
+                try:
+                    await self.execute(encoders[op_code](value))
+                    self.sent_targets[op_code] = value
+                except (ControlPointError, *ble_backend.link_errors()) as e:
+                    # A refused command or a failed write: keep going with the remaining targets
+                    self.last_error = e
+        finally:
+            self._idle.set()
+
+    async def settled(self) -> None:
+        """Wait until every pending target has been sent (or has failed)."""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        if self._sender is not None:
+            self._sender.cancel()
+        try:
+            await self.client.stop_notify(bt_fitness_machine.control_point_uuid())
+        except Exception:
+            pass
+
+
+class WorkoutStep(NamedTuple):
+    at: float  # Seconds from the start of the workout
+    speed_kmh: Optional[float] = None
+    inclination_pct: Optional[float] = None
+
+
+def intervals(work_kmh: float, rest_kmh: float, work_s: float, rest_s: float, repeats: int,
+              warmup_s: float = 0.0, warmup_kmh: float = None, inclination_pct: float = None) -> List[WorkoutStep]:
+    """An interval workout: optional warm-up, then `repeats` work/rest pairs."""
+    steps = []
+    at = 0.0
+    if warmup_s:
+        steps.append(WorkoutStep(0.0, warmup_kmh if warmup_kmh is not None else rest_kmh, inclination_pct))
+        at = warmup_s
+    for _ in range(repeats):
+        steps.append(WorkoutStep(at, work_kmh, inclination_pct))
+        steps.append(WorkoutStep(at + work_s, rest_kmh, inclination_pct))
+        at += work_s + rest_s
+    return steps
+
+
+def load_workout(path: str) -> List[WorkoutStep]:
+    """Steps from a JSON list like [{"at": 0, "speed_kmh": 8}, {"at": 60, "speed_kmh": 12, "inclination_pct": 1}]."""
+    with open(path) as file:
+        return sorted((WorkoutStep(**step) for step in json.load(file)), key=lambda step: step.at)
+
+
+async def run_workout(control: ControlPoint, steps: Iterable[WorkoutStep], clock: Callable[[], float] = time.monotonic,
+                      on_step: Callable[[WorkoutStep, float], None] = None, start: bool = True) -> None:
+    """
+    Drive the treadmill through `steps`, each scheduled against the monotonic
+    clock from the workout start so slow acknowledgements never push later
+    steps back. on_step receives each step and how late it was issued.
+    """
+    if start:
+        await control.request_control()
+        await control.start_or_resume()
+    started = clock()
+    for step in steps:
+        delay = started + step.at - clock()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if step.speed_kmh is not None:
+            control.set_target_speed(step.speed_kmh)
+        if step.inclination_pct is not None:
+            control.set_target_incline(step.inclination_pct)
+        if on_step is not None:
+            on_step(step, clock() - started - step.at)
+    await control.settled()
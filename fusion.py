@@ -0,0 +1,410 @@
+import math
+from collections import deque
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import telemetry
+
+HOLD = "hold"  # Last sample at or before the grid time
+LINEAR = "linear"  # Interpolated between the samples either side
+METHODS = (HOLD, LINEAR)
+# Step-like or event channels hold; continuous ones interpolate
+DEFAULT_METHODS = {telemetry.HR: HOLD, telemetry.RR: HOLD, telemetry.SPEED: LINEAR, telemetry.CADENCE: LINEAR,
+                   telemetry.DISTANCE: LINEAR, telemetry.INCLINE: HOLD}
+DEFAULT_STEP_S = 1.0
+# A sample older than this (hold) or a pair further apart (linear) is a dropout, not a value
+MAX_GAP_S = telemetry.MAX_ZONE_GAP_S
+# Below walking pace HR per km/h is dominated by the denominator
+MIN_SPEED_KMH = 3.0
+DEFAULT_EFFICIENCY_WINDOW_S = 60.0
+
+
+class Stream(NamedTuple):
+    name: str
+    method: str = HOLD
+    offset: float = 0.0  # Seconds added to this stream's timestamps to put them on the common clock
+    max_gap: float = MAX_GAP_S
+
+
+class Frame(NamedTuple):
+    """Channels resampled onto one timebase: a column per stream, NaN where a stream has no value."""
+    timestamps: "numpy.ndarray"
+    columns: Dict[str, "numpy.ndarray"]
+
+
+def default_streams(names: Sequence[str]) -> List[Stream]:
+    return [Stream(name, DEFAULT_METHODS.get(name, HOLD)) for name in names]
+
+
+def _check(streams: Sequence[Stream]) -> None:
+    for stream in streams:
+        if stream.method not in METHODS:
+            raise ValueError(f"Unknown resampling method {stream.method!r} for {stream.name}; use one of {METHODS}.")
+
+
+def resample(timestamps, values, grid, method: str = HOLD, max_gap: float = MAX_GAP_S):
+    """
+    Values of one sorted series at each grid time.
+
+    Args:
+        timestamps: Sample times in ascending order; ties keep the last sample.
+        values: Sample values.
+        grid: Times to sample at.
+        method: HOLD or LINEAR.
+        max_gap: Longest hold, or widest pair of samples to interpolate across.
+
+    Returns:
+        numpy.ndarray: One value per grid time, NaN where there is none.
+    """
+    import numpy as np
+
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(timestamps) == 0:
+        return np.full(len(grid), np.nan)
+    last = len(timestamps) - 1
+    before = np.searchsorted(timestamps, grid, side="right") - 1
+    held = before >= 0
+    previous = np.maximum(before, 0)
+    t0, v0 = timestamps[previous], values[previous]
+    if method == HOLD:
+        return np.where(held & (grid - t0 <= max_gap), v0, np.nan)
+    following = np.minimum(previous + 1, last)
+    t1, v1 = timestamps[following], values[following]
+    exact = held & (t0 == grid)
+    between = held & (before < last) & (t1 - t0 <= max_gap)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        interpolated = v0 + (v1 - v0) * (grid - t0) / (t1 - t0)
+    return np.where(exact, v0, np.where(between, interpolated, np.nan))
+
+
+def align(sources: Mapping[str, Tuple["numpy.ndarray", "numpy.ndarray"]], streams: Sequence[Stream] = None,
+          step: float = DEFAULT_STEP_S, start: float = None, end: float = None) -> Frame:
+    """
+    Join several (timestamps, values) series onto one grid of `step` seconds.
+
+    The grid sits on multiples of `step` and by default spans every stream
+    after its offset is applied, so columns are NaN where a device had not
+    connected yet or had dropped out.
+    """
+    import numpy as np
+
+    streams = default_streams(list(sources)) if streams is None else list(streams)
+    _check(streams)
+    series = {}
+    for stream in streams:
+        timestamps, values = sources.get(stream.name, ((), ()))
+        series[stream.name] = (np.asarray(timestamps, dtype=np.float64) + stream.offset,
+                               np.asarray(values, dtype=np.float64))
+    present = [timestamps for timestamps, _ in series.values() if len(timestamps)]
+    if start is None:
+        start = min((timestamps[0] for timestamps in present), default=0.0)
+    if end is None:
+        end = max((timestamps[-1] for timestamps in present), default=start - step)
+    first, last = math.ceil(start / step), math.floor(end / step)
+    grid = np.arange(first, max(last + 1, first), dtype=np.float64) * step
+    return Frame(grid, {stream.name: resample(*series[stream.name], grid, stream.method, stream.max_gap)
+                        for stream in streams})
+
+
+def channel_sources(store: telemetry.TelemetryStore, seconds: float = None) -> Dict[str, tuple]:
+    """(timestamps, values) of every channel holding samples, over the last `seconds` if given."""
+    return {name: channel.history(seconds) for name, channel in store.channels.items() if channel.count}
+
+
+def session_sources(sessions, session_id: int) -> Dict[str, tuple]:
+    """(timestamps, values) of every channel recorded in a session of a session_store.SessionStore."""
+    import numpy as np
+
+    cursor = sessions.db.cursor()
+    cursor.row_factory = None  # Plain tuples; sqlite3.Row costs more than the query
+    rows = cursor.execute("SELECT channel, t, value FROM samples WHERE session_id = ? ORDER BY channel, t",
+                          (session_id,)).fetchall()
+    table = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    bounds = np.searchsorted(table[:, 0], np.arange(len(telemetry.CHANNELS) + 1) - 0.5)
+    return {name: (table[bounds[index]:bounds[index + 1], 1], table[bounds[index]:bounds[index + 1], 2])
+            for index, name in enumerate(telemetry.CHANNELS) if bounds[index + 1] > bounds[index]}
+
+
+def estimate_offset(reference: tuple, other: tuple, max_offset: float = 30.0, step: float = 0.1) -> Optional[float]:
+    """
+    Offset to add to `other`'s timestamps so it lines up with `reference`.
+
+    Both series should measure the same thing (speed from a footpod and from
+    the treadmill, HR from two straps). They are interpolated onto a common
+    grid and the offset is the shift, within +/- max_offset, with the highest
+    correlation. None when the series overlap too little to tell.
+    """
+    import numpy as np
+
+    frame = align({"reference": reference, "other": other},
+                  [Stream("reference", LINEAR), Stream("other", LINEAR)], step)
+    a, b = frame.columns["reference"], frame.columns["other"]
+    lags = int(round(max_offset / step))
+    if np.count_nonzero(~np.isnan(a) & ~np.isnan(b)) < 2 * lags + 2:
+        return None
+    a = np.nan_to_num(a - np.nanmean(a))
+    b = np.nan_to_num(b - np.nanmean(b))
+    size = len(a)
+    scores = np.empty(2 * lags + 1)
+    for lag in range(-lags, lags + 1):
+        # other(t + lag) against reference(t)
+        x, y = (a[:size - lag], b[lag:]) if lag >= 0 else (a[-lag:], b[:size + lag])
+        scores[lag + lags] = np.dot(x, y) / (math.sqrt(np.dot(x, x) * np.dot(y, y)) or 1.0)
+    return -(int(np.argmax(scores)) - lags) * step
+
+
+def heart_rate_per_speed(hr, speed_kmh, min_speed: float = MIN_SPEED_KMH):
+    """Beats per minute per km/h, NaN below `min_speed`; works on aligned columns."""
+    import numpy as np
+
+    speed_kmh = np.asarray(speed_kmh, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(speed_kmh >= min_speed, np.asarray(hr, dtype=np.float64) / speed_kmh, np.nan)
+
+
+class _StreamState:
+    __slots__ = ("stream", "cursor", "times", "values", "index")
+
+    def __init__(self, stream: Stream):
+        self.stream = stream
+        self.cursor = 0
+        self.times: List[float] = []
+        self.values: List[float] = []
+        self.index = 0  # The last sample at or before the next grid time
+
+    def value_at(self, time: float) -> float:
+        times, index = self.times, self.index
+        size = len(times)
+        while index + 1 < size and times[index + 1] <= time:
+            index += 1
+        self.index = index
+        if not size or times[index] > time:
+            return math.nan
+        t0, v0 = times[index], self.values[index]
+        stream = self.stream
+        if stream.method == HOLD:
+            return v0 if time - t0 <= stream.max_gap else math.nan
+        if t0 == time:
+            return v0
+        if index + 1 < size and times[index + 1] - t0 <= stream.max_gap:
+            t1, v1 = times[index + 1], self.values[index + 1]
+            return v0 + (v1 - v0) * (time - t0) / (t1 - t0)
+        return math.nan
+
+    def trim(self) -> None:
+        if self.index > 256:
+            del self.times[:self.index], self.values[:self.index]
+            self.index = 0
+
+
+class StreamingAligner:
+    """
+    Live counterpart of align(): emits grid rows as soon as every stream has caught up.
+
+    pull() reads the samples appended to each channel since the previous
+    call. A row at time t is emitted once every stream has a sample at or
+    after t, or has been silent for longer than its max_gap behind the
+    newest stream (its value is NaN then), so one device dropping out never
+    stalls the others. The rows match align() over the same samples.
+    """
+
+    def __init__(self, streams: Sequence[Stream], step: float = DEFAULT_STEP_S):
+        _check(streams)
+        self.streams = list(streams)
+        self.step = step
+        self.states = [_StreamState(stream) for stream in self.streams]
+        self.next_slot = None
+        self.rows = 0
+
+    @property
+    def names(self) -> List[str]:
+        return [stream.name for stream in self.streams]
+
+    def pull(self, *channels: telemetry.Channel) -> List[Tuple[float, tuple]]:
+        """New (timestamp, values) rows; pass one channel per stream, in order."""
+        for state, channel in zip(self.states, channels):
+            count = channel.count
+            cursor = max(state.cursor, count - channel.capacity)
+            timestamps, values, capacity, offset = channel.timestamps, channel.values, channel.capacity, state.stream.offset
+            for index in range(cursor, count):
+                state.times.append(timestamps[index % capacity] + offset)
+                state.values.append(values[index % capacity])
+            state.cursor = count
+        latest = [state.times[-1] if state.times else None for state in self.states]
+        if all(time is None for time in latest):
+            return []
+        newest = max(time for time in latest if time is not None)
+        watermark = min(newest - state.stream.max_gap if time is None else max(time, newest - state.stream.max_gap)
+                        for state, time in zip(self.states, latest))
+        step = self.step
+        if self.next_slot is None:
+            self.next_slot = math.ceil(min(state.times[0] for state in self.states if state.times) / step)
+        rows = []
+        slot = self.next_slot
+        while slot * step <= watermark:
+            time = slot * step
+            rows.append((time, tuple(state.value_at(time) for state in self.states)))
+            slot += 1
+        self.next_slot = slot
+        for state in self.states:
+            state.trim()
+        self.rows += len(rows)
+        return rows
+
+
+class HeartRatePerSpeed:
+    """
+    Rolling mean of HR per km/h over HR and speed aligned on a 1 s grid.
+
+    Call with the HR and speed channels, e.g. as a derived.MetricGraph node;
+    returns None until a full second of running has been aligned.
+    """
+
+    def __init__(self, window: float = DEFAULT_EFFICIENCY_WINDOW_S, min_speed: float = MIN_SPEED_KMH,
+                 hr_offset: float = 0.0):
+        self.aligner = StreamingAligner([Stream(telemetry.HR, HOLD, hr_offset),
+                                         Stream(telemetry.SPEED, LINEAR)], 1.0)
+        self.window = window
+        self.min_speed = min_speed
+        self.recent = deque()
+        self.total = 0.0
+
+    def __call__(self, hr: telemetry.Channel, speed: telemetry.Channel) -> Optional[float]:
+        recent = self.recent
+        for time, (hr_value, speed_value) in self.aligner.pull(hr, speed):
+            # NaN fails the comparison, so dropouts are skipped
+            if speed_value >= self.min_speed and hr_value > 0:
+                ratio = hr_value / speed_value
+                recent.append((time, ratio))
+                self.total += ratio
+            while recent and recent[0][0] <= time - self.window:
+                self.total -= recent.popleft()[1]
+        if not recent:
+            return None
+        return round(self.total / len(recent), 1)
+
+
+def write_csv(frame: Frame, file) -> None:
+    import csv
+
+    writer = csv.writer(file)
+    names = list(frame.columns)
+    writer.writerow(["t", *names])
+    columns = [frame.columns[name].tolist() for name in names]
+    for row in zip(frame.timestamps.tolist(), *columns):
+        writer.writerow([f"{row[0]:.3f}", *("" if math.isnan(value) else f"{value:g}" for value in row[1:])])
+
+
+def benchmark() -> None:
+    import time
+
+    import numpy as np
+
+    # 3 hours: HR at ~1 Hz, RR at ~2.5 Hz, speed, cadence and distance at 10 Hz, incline at 1 Hz,
+    # each on its own jittered notification clock, the treadmill's 0.8 s behind the strap
+    rng = np.random.default_rng(7)
+    seconds = 3 * 3600
+
+    def clock(rate, offset=0.0):
+        intervals = rng.uniform(0.5, 1.5, int(seconds * rate)) / rate
+        return np.cumsum(intervals) + offset
+
+    def speed_at(t):
+        return 10 + 2 * np.sin(t / 600) + (np.floor(t / 240) % 3)
+
+    hr_t, speed_t = clock(1.0), clock(10.0, 0.8)
+    sources = {
+        telemetry.HR: (hr_t, 120 + 4 * speed_at(hr_t - 20) + rng.normal(0, 1, len(hr_t))),
+        telemetry.RR: (t := clock(2.5), 60000 / (120 + 4 * speed_at(t))),
+        telemetry.SPEED: (speed_t, speed_at(speed_t - 0.8)),
+        telemetry.CADENCE: (speed_t, 150 + 2 * speed_at(speed_t - 0.8)),
+        telemetry.DISTANCE: (speed_t, np.cumsum(speed_at(speed_t) / 36)),
+        telemetry.INCLINE: (t := clock(1.0), np.floor(t / 300) % 4),
+    }
+    samples = sum(len(timestamps) for timestamps, _ in sources.values())
+    for step in (1.0, 0.1):
+        started = time.perf_counter()
+        frame = align(sources, step=step)
+        elapsed = time.perf_counter() - started
+        print(f"batch join, {step:g} s grid: {samples} samples from {len(sources)} streams into "
+              f"{len(frame.timestamps)} x {len(frame.columns)} in {elapsed * 1000:.0f} ms")
+    frame = align(sources)
+    print(f"mean HR per km/h over the session: {np.nanmean(heart_rate_per_speed(frame.columns[telemetry.HR], frame.columns[telemetry.SPEED])):.2f}")
+
+    started = time.perf_counter()
+    skew = estimate_offset(sources[telemetry.SPEED], (speed_t[::3] - 2.3, speed_at(speed_t[::3] - 0.8)))
+    print(f"estimated skew of a second speed source: {skew:+.1f} s (true +2.3 s) "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    # The same session live, pulled at 4 frames per second
+    store = telemetry.TelemetryStore()
+    streams = default_streams([telemetry.HR, telemetry.SPEED, telemetry.INCLINE])
+    aligner = StreamingAligner(streams)
+    efficiency = HeartRatePerSpeed()
+    events = sorted((t, name, value) for name in (telemetry.HR, telemetry.SPEED, telemetry.INCLINE)
+                    for t, value in zip(*(array.tolist() for array in sources[name])))
+    rows = []
+    elapsed = 0.0
+    frames = 0
+    position = 0
+    for frame_end in np.arange(0.25, seconds + 2 * MAX_GAP_S, 0.25).tolist():
+        while position < len(events) and events[position][0] < frame_end:
+            t, name, value = events[position]
+            store.append(name, value, t)
+            position += 1
+        started = time.perf_counter()
+        rows.extend(aligner.pull(*(store[stream.name] for stream in streams)))
+        ratio = efficiency(store[telemetry.HR], store[telemetry.SPEED])
+        elapsed += time.perf_counter() - started
+        frames += 1
+    batch = align({name: sources[name] for name in aligner.names}, streams)
+    live = np.array([values for _, values in rows])
+    same = np.allclose(live, np.column_stack(list(batch.columns.values()))[:len(live)], equal_nan=True)
+    print(f"streaming: {elapsed / frames * 1e6:.1f} us per frame for {len(rows)} rows "
+          f"({'matches' if same else 'DIFFERS from'} the batch join), last minute {ratio} bpm per km/h")
+
+
+def cli(argv=None):
+    import argparse
+    import sys
+
+    from session_store import DEFAULT_ATHLETE, SESSIONS_PATH, SessionStore
+
+    parser = argparse.ArgumentParser(description="Align a recorded session's channels onto one timebase as CSV.")
+    parser.add_argument("--session", type=int, help="Session id (default: the athlete's latest)")
+    parser.add_argument("--athlete", default=DEFAULT_ATHLETE)
+    parser.add_argument("--database", default=SESSIONS_PATH)
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP_S, help="Grid step in seconds")
+    parser.add_argument("--method", action="append", default=[], metavar="CHANNEL=METHOD",
+                        help=f"Resampling per channel, one of {', '.join(METHODS)}")
+    parser.add_argument("--offset", action="append", default=[], metavar="CHANNEL=SECONDS",
+                        help="Shift a channel's timestamps, e.g. hr=-20 for HR lagging effort")
+    parser.add_argument("--benchmark", action="store_true", help="Time the batch and streaming joins instead")
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark()
+        return
+
+    store = SessionStore(args.database)
+    try:
+        session_id = args.session
+        if session_id is None:
+            recent = store.recent(args.athlete, 1)
+            if not recent:
+                parser.error("No closed sessions yet.")
+            session_id = recent[0]["id"]
+        sources = session_sources(store, session_id)
+    finally:
+        store.close()
+    methods = dict(option.split("=", 1) for option in args.method)
+    for name, method in methods.items():
+        if method not in METHODS:
+            parser.error(f"Unknown resampling method {method!r} for {name}; use one of {', '.join(METHODS)}.")
+    offsets = {name: float(seconds) for name, seconds in (option.split("=", 1) for option in args.offset)}
+    streams = [Stream(name, methods.get(name, DEFAULT_METHODS.get(name, HOLD)), offsets.get(name, 0.0))
+               for name in sources]
+    write_csv(align(sources, streams, args.step), sys.stdout)
+
+
+if __name__ == "__main__":
+    cli()
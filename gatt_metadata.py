@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Set, Tuple
+
+from bt_uuids import normalize_uuid_str
+
+import bt_device_information
+import bt_user_data
+
+DEFAULT_TTL = 24 * 60 * 60
+METADATA_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".treadmill-app", "metadata.json")
+
+# asyncio only keeps weak references to tasks; background reads are held here until they finish
+_background: Set[asyncio.Task] = set()
+
+
+class MetadataField(NamedTuple):
+    service: str
+    name: str
+    uuid: str
+    parse: Callable[[bytes], Any]
+    unit: str = ""
+    cacheable: bool = True  # False for values that change between connections
+
+
+DEVICE_INFORMATION_FIELDS = tuple(
+    MetadataField("Device Information", name, normalize_uuid_str(uuid),
+                  bt_device_information.parse_system_id if name == "System ID" else bt_device_information.parse_string)
+    for name, uuid in bt_device_information.CHARACTERISTIC_UUIDS.items()
+) + (MetadataField("Battery Service", "Battery Level", bt_device_information.battery_level_uuid(),
+                   bt_device_information.parse_battery_level, "%", cacheable=False),)
+
+USER_DATA_FIELDS = (
+    MetadataField("User Data", "Age", bt_user_data.age_uuid(), bt_user_data.parse_age_data),
+    MetadataField("User Data", "Weight", bt_user_data.weight_uuid(), bt_user_data.parse_weight, " kg"),
+    MetadataField("User Data", "Gender", bt_user_data.gender_uuid(), bt_user_data.parse_gender),
+)
+
+
+class MetadataCache:
+    """Per-address metadata values persisted as JSON, valid for `ttl` seconds."""
+
+    def __init__(self, path: str = METADATA_CACHE_PATH, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path) as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, address: str, fields: Iterable[MetadataField]) -> Dict[str, Any]:
+        """Cached values among `fields`; possibly only some of them, and none when the entry is stale."""
+        entry = self.entries.get(address)
+        if entry is None or time.time() - entry["fetched_at"] > self.ttl:
+            return {}
+        values = entry["values"]
+        return {field.name: values[field.name] for field in fields
+                if field.cacheable and values.get(field.name) is not None}
+
+    def put(self, address: str, values: Dict[str, Any]) -> None:
+        entry = self.entries.get(address)
+        if entry is None or time.time() - entry["fetched_at"] > self.ttl:
+            entry = self.entries[address] = {"fetched_at": time.time(), "values": {}}
+        entry["values"].update(values)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(temporary, self.path)
+
+
+async def read_fields(client, fields: Iterable[MetadataField]) -> Dict[str, Any]:
+    """Read every field the device exposes concurrently; unreadable or malformed fields are skipped."""
+    services = client.services
+    present = [field for field in fields if services.get_characteristic(field.uuid) is not None]
+    results = await asyncio.gather(*(client.read_gatt_char(field.uuid) for field in present), return_exceptions=True)
+    values = {}
+    for field, value in zip(present, results):
+        if isinstance(value, Exception):
+            continue
+        try:
+            values[field.name] = field.parse(value)
+        except Exception:
+            pass  # e.g. an empty Battery Level; the other fields still count
+    return values
+
+
+async def read_metadata(client, address: str, fields: Iterable[MetadataField],
+                        cache: MetadataCache = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    Return (values, from_cache) for `fields`, reading only what the cache lacks.
+
+    Only values actually read are cached, so a failed read is retried on the
+    next connect instead of hiding the field for the whole TTL. Fields that
+    are not cacheable (battery level) are read every time; from_cache is True
+    when every cacheable field came from the cache.
+    """
+    fields = tuple(fields)
+    cached = cache.get(address, fields) if cache is not None else {}
+    missing = [field for field in fields if field.name not in cached]
+    read = await read_fields(client, missing) if missing else {}
+    if cache is not None:
+        fresh = {field.name: read[field.name] for field in missing
+                 if field.cacheable and read.get(field.name) is not None}
+        if fresh:
+            cache.put(address, fresh)
+    values = {field.name: cached[field.name] if field.name in cached else read.get(field.name) for field in fields}
+    return values, all(field.name in cached for field in fields if field.cacheable)
+
+
+def print_error(error: BaseException) -> None:
+    print(f"Background read failed: {error!r}")
+
+
+def run_in_background(coroutine: Awaitable, on_error: Callable[[BaseException], None] = print_error) -> asyncio.Task:
+    """Start `coroutine` as a task that is kept alive until it finishes; a failure is passed to `on_error`."""
+    task = asyncio.create_task(coroutine)
+    _background.add(task)
+
+    def done(task: asyncio.Task) -> None:
+        _background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            on_error(task.exception())
+
+    task.add_done_callback(done)
+    return task
+
+
+def fetch_in_background(client, address: str, fields: Iterable[MetadataField], cache: MetadataCache,
+                        callback: Callable[[Dict[str, Any], bool], None],
+                        on_error: Callable[[BaseException], None] = print_error) -> asyncio.Task:
+    """Start read_metadata() as a task and hand the result to `callback`, so notifications are not delayed."""
+    async def fetch():
+        values, cached = await read_metadata(client, address, fields, cache)
+        callback(values, cached)
+        return values
+
+    return run_in_background(fetch(), on_error)
+
+
+def group_by_service(fields: Iterable[MetadataField], values: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+    """Display strings (value and unit) per service, skipping fields without a value."""
+    groups: Dict[str, Dict[str, str]] = {}
+    for field in fields:
+        if values.get(field.name) is not None:
+            groups.setdefault(field.service, {})[field.name] = f"{values[field.name]}{field.unit}"
+    return groups
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    import bt_heart_rate
+    import fake_ble
+
+    class Strap(fake_ble.HeartRateStrap):
+        """A strap exposing all of Device Information, like a Polar H10, notifying at 20 Hz."""
+        services = {**fake_ble.HeartRateStrap.services,
+                    bt_device_information.SERVICE_UUID: tuple(bt_device_information.CHARACTERISTIC_UUIDS.values())}
+
+    async def first_sample(backend, strategy, cache):
+        # Seconds from connect to the first heart rate notification
+        first = asyncio.get_running_loop().create_future()
+        client = backend.client_factory("F0:00:00:00:00:01")
+        started = time.perf_counter()
+        await client.connect()
+        if strategy == "before":
+            # The old connect: one read per characteristic, then subscribe
+            for field in DEVICE_INFORMATION_FIELDS:
+                if client.services.get_characteristic(field.uuid) is not None:
+                    await client.read_gatt_char(field.uuid)
+        await client.start_notify(bt_heart_rate.measurement_uuid(),
+                                  lambda sender, data: first.done() or first.set_result(time.perf_counter()))
+        if strategy != "before":
+            fetch_in_background(client, "F0:00:00:00:00:01", DEVICE_INFORMATION_FIELDS, cache, lambda *_: None)
+        elapsed = await first - started
+        await asyncio.gather(*_background)
+        await client.disconnect()
+        return elapsed
+
+    async def main():
+        # 30 ms per read, one BLE round trip at a typical connection interval
+        backend = fake_ble.FakeBackend([Strap("F0:00:00:00:00:01", rate=20)], read_latency=0.03)
+        cache = MetadataCache(os.path.join(tempfile.mkdtemp(), "metadata.json"))
+        results = {"before": [], "after, cold cache": [], "after, warm cache": []}
+        for _ in range(5):
+            results["before"].append(await first_sample(backend, "before", None))
+            cache.entries.clear()
+            results["after, cold cache"].append(await first_sample(backend, "after", cache))
+            results["after, warm cache"].append(await first_sample(backend, "after", cache))
+        for name, times in results.items():
+            print(f"time to first sample, {name + ':':19} {min(times) * 1000:6.1f} ms")
+
+    asyncio.run(main())
@@ -0,0 +1,334 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import telemetry
+from shared_ring import DEFAULT_CAPACITY, SharedRing
+
+DEFAULT_DEVICES_PER_WORKER = 8
+# A worker that dies sooner than this after starting is restarted with growing backoff
+STABLE_AFTER = 5.0
+RESTART_BACKOFF_CAP = 30.0
+PARENT_CHECK_INTERVAL = 1.0
+
+
+class GymDevice(NamedTuple):
+    name: str
+    address: str
+    kind: str  # "hr", "rsc" or "treadmill"
+    ring: str  # Shared memory name of the device's sample ring
+
+
+class WorkerSpec(NamedTuple):
+    index: int
+    devices: Sequence[GymDevice]
+    adapter: Optional[str] = None
+    simulate: Optional[dict] = None  # FakeBackend.gym() arguments, for runs without hardware
+
+
+def ring_name(address: str) -> str:
+    return "treadmill-app-" + address.replace(":", "").lower()
+
+
+def sample_handlers(kind: str, ring: SharedRing) -> dict:
+    """Notification handlers that decode and write samples for one device into its ring."""
+    import bt_fitness_machine
+    import bt_heart_rate
+    import bt_running_speed_cadence
+
+    write = ring.write
+    clock = time.monotonic
+
+    def heart_rate_handler(sender, data):
+        now = clock()
+        measurement = bt_heart_rate.parse_hr_measurement(data)
+        write(now, telemetry.CHANNEL_IDS[telemetry.HR], measurement.hr)
+        for rr in measurement.rr_intervals:
+            write(now, telemetry.CHANNEL_IDS[telemetry.RR], rr)
+
+    def running_speed_and_cadence_handler(sender, data):
+        now = clock()
+        measurement = bt_running_speed_cadence.decode_rsc_measurement(data)
+        write(now, telemetry.CHANNEL_IDS[telemetry.SPEED], measurement.speed_kmh)
+        write(now, telemetry.CHANNEL_IDS[telemetry.CADENCE], measurement.cadence)
+        if measurement.total_distance_m is not None:
+            write(now, telemetry.CHANNEL_IDS[telemetry.DISTANCE], measurement.total_distance_m)
+
+    treadmill_decoder = bt_fitness_machine.TreadmillDataDecoder()
+
+    def treadmill_data_handler(sender, data):
+        result = treadmill_decoder.decode(data)
+        if result.inclination_pct is not None:
+            write(clock(), telemetry.CHANNEL_IDS[telemetry.INCLINE], result.inclination_pct)
+
+    if kind == "hr":
+        return {bt_heart_rate.measurement_uuid(): heart_rate_handler}
+    handlers = {bt_running_speed_cadence.measurement_uuid(): running_speed_and_cadence_handler}
+    if kind == "treadmill":
+        handlers[bt_fitness_machine.treadmill_data_uuid()] = treadmill_data_handler
+    return handlers
+
+
+async def run_worker(spec: WorkerSpec) -> None:
+    import ble_backend
+    from connection_manager import ConnectionManager, SensorLink
+
+    if spec.simulate is not None:
+        import fake_ble
+        ble_backend.use(fake_ble.FakeBackend.gym(**spec.simulate))
+    client_factory = ble_backend.client
+    if spec.adapter is not None:
+        client_factory = functools.partial(ble_backend.client, adapter=spec.adapter)
+
+    rings = [SharedRing.attach(device.ring) for device in spec.devices]
+    manager = ConnectionManager()
+    for device, ring in zip(spec.devices, rings):
+        manager.add(SensorLink(device.name, device.address, sample_handlers(device.kind, ring),
+                               client_factory=client_factory))
+    parent = os.getppid()
+    try:
+        # Exit with the supervisor, even if it was killed without cleaning up
+        while os.getppid() == parent:
+            await asyncio.sleep(PARENT_CHECK_INTERVAL)
+    finally:
+        await manager.close()
+        for ring in rings:
+            ring.close()
+
+
+def worker_main(spec: WorkerSpec) -> None:
+    try:
+        asyncio.run(run_worker(spec))
+    except KeyboardInterrupt:
+        pass
+
+
+class Worker:
+    """One worker process and its restart bookkeeping."""
+
+    def __init__(self, spec: WorkerSpec):
+        self.spec = spec
+        self.process: Optional[multiprocessing.Process] = None
+        self.started = 0.0
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at: Optional[float] = None
+
+
+class GymSupervisor:
+    """
+    Spreads device sessions across worker processes, one per adapter or per
+    `per_worker` devices, each with its own asyncio loop and GIL.
+
+    The supervisor owns one SharedRing per device, so a ring and the samples in
+    it outlive a crashed worker; the replacement worker attaches to the same
+    rings and carries on. Crashed workers are restarted, immediately if they
+    had been running for STABLE_AFTER seconds, with doubling backoff otherwise.
+
+    Args:
+        devices: Devices to run.
+        per_worker: Devices per worker process.
+        adapters: Bluetooth adapters (e.g. "hci0", "hci1"); workers are
+            assigned to them round-robin.
+        simulate: FakeBackend.gym() arguments; workers then run against
+            simulated devices instead of bleak.
+    """
+
+    def __init__(self, devices: Sequence[GymDevice], per_worker: int = DEFAULT_DEVICES_PER_WORKER,
+                 adapters: Sequence[str] = (), ring_capacity: int = DEFAULT_CAPACITY, simulate: dict = None):
+        self.devices = list(devices)
+        self.rings = {device.ring: SharedRing.create(device.ring, ring_capacity) for device in self.devices}
+        self.context = multiprocessing.get_context("spawn")
+        chunks = [self.devices[i:i + per_worker] for i in range(0, len(self.devices), per_worker)]
+        self.workers = [Worker(WorkerSpec(index, chunk, adapters[index % len(adapters)] if adapters else None,
+                                          simulate))
+                        for index, chunk in enumerate(chunks)]
+
+    def _start(self, worker: Worker) -> None:
+        worker.process = self.context.Process(target=worker_main, args=(worker.spec,),
+                                              name=f"gym-worker-{worker.spec.index}", daemon=True)
+        worker.process.start()
+        worker.started = time.monotonic()
+        worker.restart_at = None
+
+    def start(self) -> None:
+        for worker in self.workers:
+            self._start(worker)
+
+    def supervise(self, timeout: float) -> None:
+        """Wait up to `timeout` seconds for worker exits and restart crashed workers when due."""
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.restart_at is not None and now >= worker.restart_at:
+                worker.restarts += 1
+                self._start(worker)
+        running = {worker.process.sentinel: worker for worker in self.workers
+                   if worker.restart_at is None and worker.process is not None}
+        for sentinel in wait(list(running), timeout):
+            worker = running[sentinel]
+            worker.process.join()
+            now = time.monotonic()
+            if now - worker.started >= STABLE_AFTER:
+                worker.backoff = 0.0
+            else:
+                worker.backoff = min(RESTART_BACKOFF_CAP, worker.backoff * 2 or 0.5)
+            worker.restart_at = now + worker.backoff
+
+    def kill(self, index: int) -> None:
+        """Kill a worker as a crash would; it is restarted by supervise()."""
+        process = self.workers[index].process
+        if process is not None and process.is_alive():
+            process.kill()
+
+    @property
+    def restarts(self) -> int:
+        return sum(worker.restarts for worker in self.workers)
+
+    def stop(self) -> None:
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+        for ring in self.rings.values():
+            ring.close()
+
+
+class DeviceView:
+    __slots__ = ("device", "ring", "cursor", "latest", "samples", "lost")
+
+    def __init__(self, device: GymDevice, ring: SharedRing):
+        self.device = device
+        self.ring = ring
+        self.cursor = ring.written
+        self.latest: Dict[int, float] = {}
+        self.samples = 0
+        self.lost = 0
+
+
+class GymDashboard:
+    """
+    Reads every device ring and keeps the latest value per channel.
+
+    Runs in the supervisor or in any other process: rings are attached by
+    name and read in place.
+    """
+
+    def __init__(self, devices: Sequence[GymDevice]):
+        self.views = [DeviceView(device, SharedRing.attach(device.ring)) for device in devices]
+
+    def poll(self) -> int:
+        """Drain new samples from every ring; returns the number read."""
+        import numpy
+
+        total = 0
+        for view in self.views:
+            rows, view.cursor, lost = view.ring.read_array(view.cursor)
+            view.lost += lost
+            view.samples += len(rows)
+            total += len(rows)
+            if len(rows):
+                # First occurrence in the reversed channel column is each channel's latest sample
+                channels, last = numpy.unique(rows[::-1, 1], return_index=True)
+                view.latest.update(zip(channels.astype(int).tolist(), rows[len(rows) - 1 - last, 2].tolist()))
+        return total
+
+    def table(self):
+        from rich.table import Column, Table
+
+        table = Table("Kind", "HR", "Speed", "Cadence", "Incline", "Samples", "Lost")
+        table.columns.insert(0, Column("Device", no_wrap=True))
+        for view in self.views:
+            latest = view.latest.get
+            hr = latest(telemetry.CHANNEL_IDS[telemetry.HR])
+            speed = latest(telemetry.CHANNEL_IDS[telemetry.SPEED])
+            cadence = latest(telemetry.CHANNEL_IDS[telemetry.CADENCE])
+            incline = latest(telemetry.CHANNEL_IDS[telemetry.INCLINE])
+            table.add_row(view.device.name, view.device.kind,
+                          f"{hr:.0f}" if hr is not None else "---",
+                          f"{speed:.2f}" if speed is not None else "---",
+                          f"{cadence:.0f}" if cadence is not None else "---",
+                          f"{incline:.1f}" if incline is not None else "---",
+                          f"{view.samples}", f"{view.lost}")
+        return table
+
+    def close(self) -> None:
+        for view in self.views:
+            view.ring.close()
+
+
+def simulated_devices(simulate: dict) -> List[GymDevice]:
+    import fake_ble
+
+    kinds = {fake_ble.HeartRateStrap: "hr", fake_ble.RSCPod: "rsc", fake_ble.FTMSTreadmill: "treadmill"}
+    return [GymDevice(peripheral.name, address, kinds[type(peripheral)], ring_name(address))
+            for address, peripheral in fake_ble.FakeBackend.gym(**simulate).peripherals.items()]
+
+
+def cli(argv=None):
+    import argparse
+    import random
+
+    from rich.console import Console
+    from rich.live import Live
+
+    parser = argparse.ArgumentParser(description="Run a floor of treadmills and HR straps across worker processes.")
+    parser.add_argument("--device", action="append", default=[], metavar="KIND=ADDRESS",
+                        help="Device to run, e.g. hr=AA:BB:CC:DD:EE:FF (kinds: hr, rsc, treadmill)")
+    parser.add_argument("--adapter", action="append", default=[], help="Bluetooth adapter, e.g. hci0; repeatable")
+    parser.add_argument("--per-worker", type=int, default=DEFAULT_DEVICES_PER_WORKER)
+    parser.add_argument("--simulate", action="store_true", help="Run simulated devices instead of real ones")
+    parser.add_argument("--straps", type=int, default=20)
+    parser.add_argument("--treadmills", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=4, help="Simulated notifications per second")
+    parser.add_argument("--chaos", type=float, default=None, metavar="SECONDS",
+                        help="Kill a random worker every SECONDS to exercise restarts")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after SECONDS")
+    args = parser.parse_args(argv)
+
+    simulate = dict(straps=args.straps, treadmills=args.treadmills, rate=args.rate) if args.simulate else None
+    if simulate is not None:
+        devices = simulated_devices(simulate)
+    else:
+        devices = []
+        for entry in args.device:
+            kind, address = entry.split("=", 1)
+            devices.append(GymDevice(f"{kind} {address[-5:]}", address, kind, ring_name(address)))
+        if not devices:
+            parser.error("pass --device KIND=ADDRESS at least once, or --simulate")
+
+    console = Console()
+    supervisor = GymSupervisor(devices, args.per_worker, args.adapter, simulate=simulate)
+    supervisor.start()
+    dashboard = GymDashboard(devices)
+    started = time.monotonic()
+    next_kill = started + args.chaos if args.chaos else None
+    read = 0
+    try:
+        with Live(dashboard.table(), console=console, refresh_per_second=2) as live:
+            while args.seconds is None or time.monotonic() - started < args.seconds:
+                supervisor.supervise(0.5)
+                read += dashboard.poll()
+                live.update(dashboard.table())
+                if next_kill is not None and time.monotonic() >= next_kill:
+                    supervisor.kill(random.randrange(len(supervisor.workers)))
+                    next_kill += args.chaos
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.monotonic() - started
+        dashboard.close()
+        supervisor.stop()
+    console.log(f"{len(devices)} devices on {len(supervisor.workers)} workers: {read} samples in {elapsed:.1f} s "
+                f"({read / elapsed:.0f}/s), {supervisor.restarts} worker restarts")
+
+
+if __name__ == "__main__":
+    cli()
@@ -2,16 +2,39 @@ from textual.app import ComposeResult
 from textual.containers import HorizontalGroup
 from textual.reactive import reactive
 from textual.widgets import Digits, Label
+from telemetry import Channel
 
 
 class HeartRateTile(HorizontalGroup):
     """A HR tile widget."""
     hr: reactive[int] = reactive(0)
+    zone: reactive[int] = reactive(0)
+    calories: reactive[int] = reactive(0)
+
+    def __init__(self, channel: Channel = None, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
 
     def compose(self) -> ComposeResult:
-        yield Digits("---")
-        yield Label("bpm")
+        self.digits = Digits("---")
+        self.unit = Label("bpm")
+        yield self.digits
+        yield self.unit
 
     def watch_hr(self, hr: int) -> None:
         """Called when the hr attribute changes."""
-        self.query_one(Digits).update(f"{hr}" if hr > 0 else "---")
\ No newline at end of file
+        self.digits.update(f"{hr}" if hr > 0 else "---")
+        self.update_unit()
+
+    def watch_zone(self, zone: int) -> None:
+        self.update_unit()
+
+    def watch_calories(self, calories: int) -> None:
+        self.update_unit()
+
+    def update_unit(self) -> None:
+        average = self.channel.mean(60) if self.channel is not None and self.hr > 0 else None
+        if average is None:
+            self.unit.update("bpm")
+            return
+        self.unit.update(f"bpm\n[dim]avg {average:.0f}\nZ{self.zone} {self.calories} kcal[/]")
\ No newline at end of file
@@ -1,90 +1,102 @@
+import argparse
 import asyncio
-import string
-from bleak import BleakScanner, BleakClient
+import time
 from rich.console import Console
 from rich.tree import Tree
 from rich import print
 from rich.panel import Panel
 from rich.live import Live
+import ble_backend
+import bt_heart_rate
+import gatt_metadata
+import instrumentation
+import recorder
+from discovery import KnownDeviceCache, connect_target, find_device
 
 
-BATTERY_SERVICE_UUID = "0000180f-0000-1000-8000-00805f9b34fb"
-BATTERY_LEVEL_CHARACTERISTIC_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
-DEVICE_INFORMATION_SERVICE_UUID = "0000180a-0000-1000-8000-00805f9b34fb"
-HEART_RATE_SERVICE_UUID = "0000180d-0000-1000-8000-00805f9b34fb"
-HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
-CHARACTERISTIC_UUIDS = {
-    "Manufacturer Name": "00002a29-0000-1000-8000-00805f9b34fb",
-    "Model Number": "00002a24-0000-1000-8000-00805f9b34fb",
-    "Serial Number": "00002a25-0000-1000-8000-00805f9b34fb",
-    "Hardware Revision": "00002a27-0000-1000-8000-00805f9b34fb",
-    "Firmware Revision": "00002a26-0000-1000-8000-00805f9b34fb",
-    "Software Revision": "00002a28-0000-1000-8000-00805f9b34fb",
-    "System ID": "00002a23-0000-1000-8000-00805f9b34fb"
-}
-
 console = Console()
+known_devices = KnownDeviceCache()
+metadata_cache = gatt_metadata.MetadataCache()
+stats = instrumentation.registry
+parse_hr_data = stats.timed("hr.decode", bt_heart_rate.parse_hr_data)
 
 
 async def discover_devices():
-    found_device = None
-    discovered_devices = []
-
-    async def detection_callback(device, advertisement_data):
-        nonlocal found_device
-        nonlocal discovered_devices
+    def device_discovered(entry):
+        console.print(f"[{entry.index}] [dim]Device:[/] [bold magenta]{entry.name}[/] [dim]RSSI:[/] [bold green]{entry.rssi:.0f}[/] [dim]Address:[/] {entry.address}")
 
-        if device.address not in [d.address for d in discovered_devices]:
-            console.print(f"[{len(discovered_devices)}] [dim]Device:[/] [bold magenta]{device.name}[/] [dim]RSSI:[/] [bold green]{advertisement_data.rssi}[/] [dim]Address:[/] {device.address}")
-            discovered_devices.append(device)
+    with console.status("[bold green]Scanning for HR Devices...") as status:
+        found_device = await find_device(bt_heart_rate.service_uuid(), known_devices, device_discovered)
 
-        found_device = device
-        await scanner.stop()
+    try:
+        await connect(found_device)
+    except ble_backend.device_not_found_error():
+        console.print(f"[dim]Last device {found_device.address} not found, scanning...[/]")
+        known_devices.forget(bt_heart_rate.service_uuid())
+        await discover_devices()
 
-    scanner = BleakScanner(detection_callback, [HEART_RATE_SERVICE_UUID])
 
-    with console.status("[bold green]Scanning for HR Devices...") as status:
-        await scanner.start()
-        while not found_device:
-            await asyncio.sleep(1)
-
-    async with BleakClient(found_device) as client:
-
-        services = client.services
-        services_tree = Tree(f"Sensor: {found_device.name}")
-        for service in services:
-            if service.uuid in [BATTERY_SERVICE_UUID, DEVICE_INFORMATION_SERVICE_UUID, HEART_RATE_SERVICE_UUID]:
-                child_tree = services_tree.add(f"Service: {service.description}")
-                for characteristic in service.characteristics:
-                    characteristic_node = child_tree.add(f"Characteristic: {characteristic.uuid}")
-                    if service.uuid == BATTERY_SERVICE_UUID and characteristic.uuid == BATTERY_LEVEL_CHARACTERISTIC_UUID:
-                        battery_level = await client.read_gatt_char(characteristic)
-                        characteristic_node.add(f"  Battery Level: {int(battery_level[0])}%")
-                    elif service.uuid == DEVICE_INFORMATION_SERVICE_UUID and characteristic.uuid in CHARACTERISTIC_UUIDS.values():
-                        value = await client.read_gatt_char(characteristic)
-                        for name, uuid in CHARACTERISTIC_UUIDS.items():
-                            if characteristic.uuid == uuid and uuid != CHARACTERISTIC_UUIDS["System ID"]:
-                                printable_value = ''.join(filter(lambda x: x in string.printable, value.decode('utf-8')))
-                                characteristic_node.add(f"  {name}: {printable_value}")
-                            elif characteristic.uuid == uuid and uuid == CHARACTERISTIC_UUIDS["System ID"]:
-                                characteristic_node.add(f"  {name}: {'-'.join(value.hex()[i:i+2] for i in range(0, len(value.hex()), 2))}")
-        print(services_tree)
+async def connect(found_device):
+    connect_started = time.monotonic()
+    async with ble_backend.client(connect_target(found_device)) as client:
 
         panel = Panel(f"\n  [red]---[/] bpm", title=f"{found_device.name}", width=15, height=5)
 
+        log = recorder.session_recorder("hr")
+        first_sample = None
+
         def heart_rate_handler(sender, data):
-            heart_rate = int(data[1])
+            nonlocal first_sample
+            if first_sample is None:
+                first_sample = time.monotonic() - connect_started
+                console.log(f"Time to first sample: {first_sample:.2f} s")
+            log.record(found_device.address, bt_heart_rate.measurement_uuid(), data)
+            heart_rate = parse_hr_data(data)
             panel.renderable = f"\n  [red]{heart_rate}[/] bpm"
 
-        with Live(panel, refresh_per_second=4):
-            await client.start_notify(HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID, heart_rate_handler)
+        def metadata_ready(values, cached):
+            services_tree = Tree(f"Sensor: {found_device.name}")
+            for service, items in gatt_metadata.group_by_service(gatt_metadata.DEVICE_INFORMATION_FIELDS, values).items():
+                child_tree = services_tree.add(f"Service: {service}")
+                for name, value in items.items():
+                    child_tree.add(f"{name}: {value}")
+            console.print(services_tree)
+            console.log(f"Metadata {'from cache' if cached else 'read'} after {time.monotonic() - connect_started:.2f} s")
+
+        with Live(panel, refresh_per_second=4, console=console):
+            await client.start_notify(bt_heart_rate.measurement_uuid(), stats.handler("hr", heart_rate_handler))
+            gatt_metadata.fetch_in_background(client, found_device.address, gatt_metadata.DEVICE_INFORMATION_FIELDS,
+                                              metadata_cache, metadata_ready,
+                                              lambda error: console.log(f"[red]Metadata read failed:[/] {error!r}"))
             await asyncio.sleep(30)  # Keep receiving notifications for 30 seconds
+        log.close()
         try:
-            await client.stop_notify(characteristic)
+            await client.stop_notify(bt_heart_rate.measurement_uuid())
         except Exception as e:
             print(f"Error stopping notifications: {e}")
 
 
-if __name__ == "__main__":
+async def main():
+    loop_watch = asyncio.create_task(stats.watch_loop())
+    try:
+        await discover_devices()
+    finally:
+        loop_watch.cancel()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Show heart rate from a BLE HR monitor.")
+    parser.add_argument("--stats", metavar="FILE", help="Write handler, jitter and loop lag stats as JSON on exit; "
+                             "set TREADMILL_DECODE_TIMING=1 to include decode times")
+    args = parser.parse_args(argv)
     console.log("HR Monitor Started")
-    asyncio.run(discover_devices())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        if args.stats:
+            stats.dump(args.stats)
+            console.log(f"Stats written to {args.stats}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,228 @@
+import math
+from collections import deque
+from typing import Iterable, NamedTuple, Optional
+
+DEFAULT_WINDOW = 300  # beats, roughly five minutes at rest
+# RR intervals outside this range (ms) are artifacts: 30-200 bpm
+MIN_RR_MS = 300.0
+MAX_RR_MS = 2000.0
+# An RR interval differing from the previous one by more than this fraction is an artifact (ectopic or missed beat)
+MAX_RR_CHANGE = 0.2
+NN50_MS = 50.0
+
+
+class HRV(NamedTuple):
+    rmssd: Optional[float]
+    sdnn: Optional[float]
+    pnn50: Optional[float]
+
+
+class HRVSeries(NamedTuple):
+    """Batch HRV: metrics as they stood after each input RR interval (NaN until defined)."""
+    accepted: "numpy.ndarray"
+    rmssd: "numpy.ndarray"
+    sdnn: "numpy.ndarray"
+    pnn50: "numpy.ndarray"
+
+
+class HRVStream:
+    """
+    RMSSD, SDNN and pNN50 over a sliding window of beats, updated in O(1) per RR interval.
+
+    An RR interval is rejected as an artifact when it lies outside
+    MIN_RR_MS..MAX_RR_MS or differs from the previous interval (accepted or
+    not) by more than MAX_RR_CHANGE. SDNN covers the last `window` accepted
+    intervals; RMSSD and pNN50 cover the last `window` successive differences
+    between two consecutive accepted intervals.
+
+    Sums are kept over intervals shifted by the first accepted interval, which
+    keeps the running sum of squares small enough that adding and removing
+    beats for hours does not lose precision.
+    """
+    __slots__ = ("window", "previous", "previous_accepted", "shift", "intervals", "interval_sum",
+                 "interval_squares", "differences", "difference_squares", "nn50", "accepted", "rejected")
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        if window < 2:
+            raise ValueError("HRV window must hold at least 2 beats.")
+        self.window = window
+        self.previous = None
+        self.previous_accepted = False
+        self.shift = None
+        self.intervals = deque()
+        self.interval_sum = 0.0
+        self.interval_squares = 0.0
+        self.differences = deque()
+        self.difference_squares = 0.0
+        self.nn50 = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def add(self, rr: float) -> bool:
+        """Add one RR interval in ms; returns False if it was rejected as an artifact."""
+        previous = self.previous
+        self.previous = rr
+        if not MIN_RR_MS <= rr <= MAX_RR_MS or (previous is not None and abs(rr - previous) > MAX_RR_CHANGE * previous):
+            self.previous_accepted = False
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        if self.shift is None:
+            self.shift = rr
+        shifted = rr - self.shift
+        intervals = self.intervals
+        if len(intervals) == self.window:
+            old = intervals.popleft()
+            self.interval_sum -= old
+            self.interval_squares -= old * old
+        intervals.append(shifted)
+        self.interval_sum += shifted
+        self.interval_squares += shifted * shifted
+
+        if self.previous_accepted:
+            difference = rr - previous
+            differences = self.differences
+            if len(differences) == self.window:
+                old = differences.popleft()
+                self.difference_squares -= old * old
+                if abs(old) > NN50_MS:
+                    self.nn50 -= 1
+            differences.append(difference)
+            self.difference_squares += difference * difference
+            if abs(difference) > NN50_MS:
+                self.nn50 += 1
+        self.previous_accepted = True
+        return True
+
+    def reset(self) -> None:
+        """Forget every beat, e.g. when a new strap is connected."""
+        self.__init__(self.window)
+
+    def extend(self, rr_intervals: Iterable[float]) -> None:
+        for rr in rr_intervals:
+            self.add(rr)
+
+    @property
+    def rmssd(self) -> Optional[float]:
+        count = len(self.differences)
+        return math.sqrt(max(self.difference_squares, 0.0) / count) if count else None
+
+    @property
+    def sdnn(self) -> Optional[float]:
+        count = len(self.intervals)
+        if count < 2:
+            return None
+        return math.sqrt(max(self.interval_squares - self.interval_sum * self.interval_sum / count, 0.0) / (count - 1))
+
+    @property
+    def pnn50(self) -> Optional[float]:
+        count = len(self.differences)
+        return 100.0 * self.nn50 / count if count else None
+
+    def snapshot(self) -> HRV:
+        return HRV(self.rmssd, self.sdnn, self.pnn50)
+
+
+def hrv_series(rr_intervals, window: int = DEFAULT_WINDOW) -> HRVSeries:
+    """
+    Vectorized HRVStream over a whole session: same artifact rule, same
+    windows, computed from cumulative sums instead of beat by beat.
+
+    Args:
+        rr_intervals: RR intervals in ms, e.g. HeartRateBatch.rr_ms.
+        window: Beats per window, as for HRVStream.
+
+    Returns:
+        HRVSeries: Per input interval, whether it was accepted and the metrics
+            after it, matching HRVStream after the same add() calls.
+    """
+    import numpy as np
+
+    rr = np.asarray(rr_intervals, dtype=np.float64)
+    count = len(rr)
+    nan = np.full(count, np.nan)
+    if count == 0:
+        return HRVSeries(np.zeros(0, dtype=bool), nan, nan.copy(), nan.copy())
+
+    previous = np.empty(count)
+    previous[0] = np.nan
+    previous[1:] = rr[:-1]
+    with np.errstate(invalid="ignore"):
+        accepted = (rr >= MIN_RR_MS) & (rr <= MAX_RR_MS) & ~(np.abs(rr - previous) > MAX_RR_CHANGE * previous)
+
+    def windowed(values):
+        # Sum of the last `window` values ending at each position, with the count in the window
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        ends = np.arange(1, len(values) + 1)
+        starts = np.maximum(ends - window, 0)
+        return cumulative[ends] - cumulative[starts], ends - starts
+
+    def per_input(metric, mask):
+        # Forward-fill per-beat metrics to every input interval, NaN before the first one
+        index = np.cumsum(mask) - 1
+        return np.where(index >= 0, metric[np.maximum(index, 0)] if len(metric) else np.nan, np.nan)
+
+    shifted = rr[accepted] - rr[accepted][0] if accepted.any() else np.zeros(0)
+    interval_sum, interval_count = windowed(shifted)
+    interval_squares, _ = windowed(shifted * shifted)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sdnn = np.sqrt(np.maximum(interval_squares - interval_sum * interval_sum / interval_count, 0.0)
+                       / (interval_count - 1))
+    sdnn[interval_count < 2] = np.nan
+
+    consecutive = np.zeros(count, dtype=bool)
+    consecutive[1:] = accepted[1:] & accepted[:-1]
+    differences = (rr - previous)[consecutive]
+    difference_squares, difference_count = windowed(differences * differences)
+    nn50, _ = windowed((np.abs(differences) > NN50_MS).astype(np.float64))
+    rmssd = np.sqrt(np.maximum(difference_squares, 0.0) / np.maximum(difference_count, 1))
+    pnn50 = 100.0 * nn50 / np.maximum(difference_count, 1)
+
+    return HRVSeries(accepted, per_input(rmssd, consecutive), per_input(sdnn, accepted), per_input(pnn50, consecutive))
+
+
+if __name__ == "__main__":
+    import sys
+    import timeit
+
+    import numpy as np
+
+    rng = np.random.default_rng(7)
+    session = 850 + 60 * np.sin(np.arange(20_000) / 40) + rng.normal(0, 25, 20_000)
+    session[rng.integers(0, len(session), 100)] *= rng.choice([0.5, 2.0], 100)  # ectopic and missed beats
+
+    # Streaming and batch paths agree
+    stream = HRVStream(DEFAULT_WINDOW)
+    streamed = np.array([(stream.add(rr), *(np.nan if v is None else v for v in stream.snapshot()))
+                         for rr in session])
+    batch = hrv_series(session, DEFAULT_WINDOW)
+    assert np.array_equal(streamed[:, 0].astype(bool), batch.accepted)
+    for column, values in zip((1, 2, 3), (batch.rmssd, batch.sdnn, batch.pnn50)):
+        assert np.allclose(streamed[:, column], values, rtol=1e-9, atol=1e-9, equal_nan=True)
+    print(f"streaming and batch agree over {len(session)} beats, {stream.rejected} artifacts rejected: "
+          f"RMSSD {stream.rmssd:.1f} ms, SDNN {stream.sdnn:.1f} ms, pNN50 {stream.pnn50:.1f} %")
+
+    # Per-beat cost does not depend on the window
+    beats = session.tolist()
+    for window in (30, 300, 3000, 30000):
+        def stream_session():
+            s = HRVStream(window)
+            for rr in beats:
+                s.add(rr)
+        per_beat = min(timeit.repeat(stream_session, number=1, repeat=3)) / len(beats)
+        print(f"window {window:>6} beats: {per_beat * 1e6:6.3f} us/beat")
+    batch_time = min(timeit.repeat(lambda: hrv_series(session), number=1, repeat=3))
+    print(f"batch: {batch_time / len(session) * 1e6:6.3f} us/beat")
+
+    if len(sys.argv) > 1:
+        import bt_heart_rate
+        from recorder import Reader
+
+        # HRV for a recorded session: python hrv.py recordings/polar-....trlog
+        with Reader(sys.argv[1]) as reader:
+            packets = [bytes(frame.data) for frame in reader
+                       if frame.uuid == bt_heart_rate.measurement_uuid()]
+        rr_ms = bt_heart_rate.decode_hr_batch(packets).rr_ms
+        series = hrv_series(rr_ms)
+        print(f"{sys.argv[1]}: {len(rr_ms)} RR intervals, {int((~series.accepted).sum())} rejected, "
+              f"final RMSSD {series.rmssd[-1]:.1f} ms, SDNN {series.sdnn[-1]:.1f} ms, pNN50 {series.pnn50[-1]:.1f} %")
@@ -0,0 +1,28 @@
+from textual.app import ComposeResult
+from textual.containers import HorizontalGroup
+from textual.reactive import reactive
+from textual.widgets import Digits, Label
+from hrv import HRVStream
+
+
+class HRVTile(HorizontalGroup):
+    """An HRV tile widget: RMSSD, with SDNN and pNN50 below the unit."""
+    rmssd: reactive[int] = reactive(0)
+
+    def __init__(self, stream: HRVStream = None, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream
+
+    def compose(self) -> ComposeResult:
+        self.digits = Digits("---")
+        self.unit = Label("ms")
+        yield self.digits
+        yield self.unit
+
+    def watch_rmssd(self, rmssd: int) -> None:
+        """Called when the rmssd attribute changes."""
+        self.digits.update(f"{rmssd}" if rmssd > 0 else "---")
+        if self.stream is None or rmssd <= 0 or self.stream.sdnn is None:
+            self.unit.update("ms\n[dim]RMSSD[/]")
+            return
+        self.unit.update(f"ms\n[dim]SDNN {self.stream.sdnn:.0f}\npNN50 {self.stream.pnn50:.0f}%[/]")
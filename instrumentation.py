@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import time
+from array import array
+from typing import Callable, Dict
+
+# Histogram buckets are powers of two of nanoseconds: bucket i holds samples below 2**i ns
+BUCKETS = 64
+
+# An interval longer than GAP_NUMERATOR / GAP_DENOMINATOR times the expected one counts as a gap
+GAP_NUMERATOR, GAP_DENOMINATOR = 9, 5
+# Each new interval moves the expected interval estimate by 1 / 2**INTERVAL_SMOOTHING_SHIFT
+INTERVAL_SMOOTHING_SHIFT = 4
+# Consecutive gaps after which the sensor is taken to have changed rate
+RELEARN_GAPS = 3
+# Arrival times kept between gap analyses; a power of two
+ARRIVAL_RING = 1024
+ARRIVAL_MASK = ARRIVAL_RING - 1
+DEFAULT_LOOP_LAG_INTERVAL = 0.1
+# Set to 1 to time decoders as well as handlers; it costs two clock reads per decode
+DECODE_TIMING_ENVIRONMENT_VARIABLE = "TREADMILL_DECODE_TIMING"
+
+
+def bucket_bound_us(index: int) -> float:
+    """Upper bound of a histogram bucket in microseconds."""
+    return (1 << index) / 1000
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram over nanosecond samples.
+
+    The power-of-two buckets are allocated once and picked with int.bit_length(),
+    so record() is two integer updates and can stay enabled on the notification path.
+    """
+    __slots__ = ("name", "counts", "total")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+    def record(self, ns: int) -> None:
+        self.counts[ns.bit_length()] += 1
+        self.total += ns
+
+    def reset(self) -> None:
+        self.counts = [0] * BUCKETS
+        self.total = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def mean_us(self) -> float:
+        count = self.count
+        return self.total / count / 1000 if count else 0.0
+
+    def percentile_us(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (0-100), in microseconds."""
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bucket_bound_us(i)
+        return 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_us": round(self.mean_us, 3),
+            "p50_us": self.percentile_us(50),
+            "p90_us": self.percentile_us(90),
+            "p99_us": self.percentile_us(99),
+            "max_us": self.percentile_us(100),
+            "buckets": {f"<{bucket_bound_us(i):g}": count for i, count in enumerate(self.counts) if count},
+        }
+
+
+class NotificationStats:
+    """
+    Per-characteristic handler time, inter-arrival jitter and gap detection.
+
+    BLE notifications carry no sequence number, so dropped samples are
+    inferred from the arrival times: an interval longer than 1.8 times the
+    smoothed interval is a gap, and the number of expected intervals it spans,
+    minus one, is counted as missed samples. RELEARN_GAPS gaps in a row mean
+    the sensor changed rate, so the expected interval restarts from the
+    latest one. All arithmetic is on integer nanoseconds.
+
+    The notification path only stores the arrival time in a ring; update()
+    runs the gap and jitter analysis over the arrivals since its last call.
+    Instrumentation.watch_loop() calls it every tick and snapshots call it
+    before reading the counters. Without a watcher, arrivals overwritten
+    before an update are skipped rather than counted as a gap.
+    """
+    __slots__ = ("name", "handler", "arrivals", "count", "cursor", "gaps", "missed", "last_arrival",
+                 "expected_interval", "jitter_total", "jitter_count", "gap_run")
+
+    def __init__(self, name: str, handler: Histogram):
+        self.name = name
+        self.handler = handler
+        self.arrivals = array("q", bytes(8 * ARRIVAL_RING))
+        self.count = 0
+        self.cursor = 0
+        self.gaps = 0
+        self.missed = 0
+        self.last_arrival = 0
+        self.expected_interval = 0
+        self.jitter_total = 0
+        self.jitter_count = 0
+        self.gap_run = 0
+
+    @property
+    def samples(self) -> int:
+        return self.count
+
+    @property
+    def jitter_mean_us(self) -> float:
+        return self.jitter_total / self.jitter_count / 1000 if self.jitter_count else 0.0
+
+    def update(self) -> None:
+        """Analyse the arrivals recorded since the last call."""
+        arrivals, count = self.arrivals, self.count
+        arrived = self.arrived
+        cursor = self.cursor
+        if cursor < count - ARRIVAL_RING:
+            cursor = count - ARRIVAL_RING
+            self.last_arrival = 0
+        for index in range(cursor, count):
+            arrived(arrivals[index & ARRIVAL_MASK])
+        self.cursor = count
+
+    def arrived(self, now: int) -> None:
+        last = self.last_arrival
+        self.last_arrival = now
+        if not last:
+            return
+        interval = now - last
+        expected = self.expected_interval
+        if not expected:
+            self.expected_interval = interval
+            return
+        if interval * GAP_DENOMINATOR > expected * GAP_NUMERATOR:
+            self.gaps += 1
+            self.missed += (interval + expected // 2) // expected - 1
+            self.gap_run += 1
+            if self.gap_run >= RELEARN_GAPS:
+                self.expected_interval = interval
+                self.gap_run = 0
+            return
+        self.gap_run = 0
+        deviation = interval - expected
+        self.jitter_total += deviation if deviation >= 0 else -deviation
+        self.jitter_count += 1
+        self.expected_interval = expected + (deviation >> INTERVAL_SMOOTHING_SHIFT)
+
+    def reset(self) -> None:
+        self.count = self.cursor = self.gaps = self.missed = self.last_arrival = self.expected_interval = 0
+        self.jitter_total = self.jitter_count = self.gap_run = 0
+
+    def snapshot(self) -> dict:
+        self.update()
+        return {
+            "samples": self.samples,
+            "gaps": self.gaps,
+            "missed": self.missed,
+            "expected_interval_ms": round(self.expected_interval / 1e6, 3),
+            "jitter_mean_us": round(self.jitter_mean_us, 3),
+        }
+
+
+class Instrumentation:
+    """
+    Named histograms and notification stats, dumpable as JSON.
+
+    Handler wrappers are always on. Decoder timing through timed() is opt-in,
+    via `decode_timing` or TREADMILL_DECODE_TIMING=1, because its two extra
+    clock reads would take the notification path over its 1 us budget; the
+    handler histogram already includes the decode.
+    """
+
+    def __init__(self, decode_timing: bool = None):
+        if decode_timing is None:
+            decode_timing = os.environ.get(DECODE_TIMING_ENVIRONMENT_VARIABLE, "") not in ("", "0")
+        self.decode_timing = decode_timing
+        self.histograms: Dict[str, Histogram] = {}
+        self.notifications: Dict[str, NotificationStats] = {}
+        self.started = time.time()
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(name)
+        return histogram
+
+    def notification(self, name: str) -> NotificationStats:
+        stats = self.notifications.get(name)
+        if stats is None:
+            stats = self.notifications[name] = NotificationStats(name, self.histogram(f"{name}.handler"))
+        return stats
+
+    def handler(self, name: str, handler: Callable) -> Callable:
+        """Wrap a notification handler(sender, data) to record its arrivals and run time."""
+        stats = self.notification(name)
+        arrivals = stats.arrivals
+        record = stats.handler.record
+        clock = time.perf_counter_ns
+
+        def instrumented_handler(sender, data):
+            started = clock()
+            count = stats.count
+            arrivals[count & ARRIVAL_MASK] = started
+            stats.count = count + 1
+            try:
+                return handler(sender, data)
+            finally:
+                record(clock() - started)
+        return instrumented_handler
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        """
+        Wrap a single-argument parser to record its run time, e.g. timed("hr.decode", parse_hr_measurement).
+        Returns the parser itself unless decode timing is enabled.
+        """
+        if not self.decode_timing:
+            return function
+        record = self.histogram(name).record
+        clock = time.perf_counter_ns
+
+        def timed_function(data):
+            started = clock()
+            try:
+                return function(data)
+            finally:
+                record(clock() - started)
+        return timed_function
+
+    async def watch_loop(self, interval: float = DEFAULT_LOOP_LAG_INTERVAL, name: str = "loop.lag") -> None:
+        """
+        Record how late the event loop wakes a sleeper, and analyse the
+        notifications that arrived since the last tick; run as a task until
+        cancelled.
+        """
+        record = self.histogram(name).record
+        clock = time.perf_counter_ns
+        interval_ns = int(interval * 1e9)
+        while True:
+            started = clock()
+            await asyncio.sleep(interval)
+            record(max(clock() - started - interval_ns, 0))
+            for stats in self.notifications.values():
+                stats.update()
+
+    def reset(self) -> None:
+        for histogram in self.histograms.values():
+            histogram.reset()
+        for stats in self.notifications.values():
+            stats.reset()
+        self.started = time.time()
+
+    def snapshot(self) -> dict:
+        return {
+            "started": self.started,
+            "uptime_s": round(time.time() - self.started, 3),
+            "notifications": {name: stats.snapshot() for name, stats in self.notifications.items()},
+            "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+# Process-wide instance used by the app, the CLIs and the UI scheduler
+registry = Instrumentation()
+
+
+if __name__ == "__main__":
+    import timeit
+
+    import bt_heart_rate
+
+    packet = bytes([0x16, 72, 0x00, 0x04])
+    stats = Instrumentation(decode_timing=True)
+    decode = stats.timed("hr.decode", bt_heart_rate.parse_hr_measurement)
+
+    def bare_handler(sender, data):
+        bt_heart_rate.parse_hr_measurement(data)
+
+    def decoding_handler(sender, data):
+        decode(data)
+
+    # Per notification: arrival time and handler time, plus the decoder's own timing. Rounds are
+    # interleaved and the fastest kept, so a noisy machine does not charge its noise to one variant.
+    wrapped_only = stats.handler("hr", bare_handler)
+    fully = stats.handler("hr.decoded", decoding_handler)
+    record = stats.histogram("record").record
+    variants = {"bare": lambda: bare_handler(None, packet), "wrapper": lambda: wrapped_only(None, packet),
+                "full": lambda: fully(None, packet), "record": lambda: record(1234)}
+    n = 20_000
+    best = dict.fromkeys(variants, float("inf"))
+    for _ in range(40):
+        for name, run in variants.items():
+            best[name] = min(best[name], timeit.timeit(run, number=n) / n)
+    bare, handler_only, full, single = best["bare"], best["wrapper"], best["full"], best["record"]
+    print(f"bare handler:             {bare * 1e6:6.3f} us/notification")
+    print(f"handler wrapper:          {handler_only * 1e6:6.3f} us/notification (+{(handler_only - bare) * 1e6:.3f} us)")
+    print(f"wrapper and timed decode: {full * 1e6:6.3f} us/notification (+{(full - bare) * 1e6:.3f} us, "
+          f"opt-in with {DECODE_TIMING_ENVIRONMENT_VARIABLE}=1)")
+    print(f"Histogram.record:         {single * 1e6:6.3f} us/sample")
+    # The gap and jitter analysis the loop watcher runs over the arrivals
+    analysed = stats.notifications["hr.decoded"]
+    arrivals = analysed.count
+    analysed.cursor = 0
+    analysed.count = min(arrivals, ARRIVAL_RING)
+    started = time.perf_counter_ns()
+    analysed.update()
+    per_arrival = (time.perf_counter_ns() - started) / analysed.count / 1000
+    analysed.count = arrivals
+    analysed.cursor = arrivals
+    print(f"gap and jitter analysis:  {per_arrival:6.3f} us/notification, off the notification path")
+    overhead = (handler_only - bare) * 1e6
+    print(f"default notification path overhead {overhead:.3f} us: "
+          f"{'within' if overhead < 1 else 'OVER'} the 1 us budget")
+    print(json.dumps(stats.snapshot()["histograms"]["hr.decode"], indent=2))
@@ -1,72 +1,102 @@
+import argparse
 import asyncio
-from bleak import BleakScanner, BleakClient
-import string
-
-BATTERY_SERVICE_UUID = "0000180f-0000-1000-8000-00805f9b34fb"
-BATTERY_LEVEL_CHARACTERISTIC_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
-DEVICE_INFORMATION_SERVICE_UUID = "0000180a-0000-1000-8000-00805f9b34fb"
-HEART_RATE_SERVICE_UUID = "0000180d-0000-1000-8000-00805f9b34fb"
-HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
-CHARACTERISTIC_UUIDS = {
-    "Manufacturer Name": "00002a29-0000-1000-8000-00805f9b34fb",
-    "Model Number": "00002a24-0000-1000-8000-00805f9b34fb",
-    "Serial Number": "00002a25-0000-1000-8000-00805f9b34fb",
-    "Hardware Revision": "00002a27-0000-1000-8000-00805f9b34fb",
-    "Firmware Revision": "00002a26-0000-1000-8000-00805f9b34fb",
-    "Software Revision": "00002a28-0000-1000-8000-00805f9b34fb",
-    "System ID": "00002a23-0000-1000-8000-00805f9b34fb"
-}
+import time
+import ble_backend
+import bt_heart_rate
+import gatt_metadata
+import hrv
+import instrumentation
+import recorder
+from discovery import KnownDeviceCache, connect_target, find_device
+
+
+# Known-device cache key: the strap is matched by name, not by service
+POLAR_KEY = "Polar H10"
+
+known_devices = KnownDeviceCache()
+metadata_cache = gatt_metadata.MetadataCache()
+stats = instrumentation.registry
+parse_hr_measurement = stats.timed("hr.decode", bt_heart_rate.parse_hr_measurement)
 
 
 async def discover_devices():
-    found_device = None
-
-    async def detection_callback(device, advertisement_data):
-        nonlocal found_device
-        if device.name and device.name.startswith("Polar H10"):
-            print("Found Polar H10")
-            print(f"Device: {device.name}, Address: {device.address}")
-            print(f"Details: {device.details}")
-            print(f"Advertisement Data: {advertisement_data}")
-            found_device = device
-            await scanner.stop()
-
-    scanner = BleakScanner(detection_callback)
-    await scanner.start()
-    while not found_device:
-        await asyncio.sleep(1)
-
-    async with BleakClient(found_device) as client:
-        services = client.services
-        for service in services:
-            if service.uuid in [BATTERY_SERVICE_UUID, DEVICE_INFORMATION_SERVICE_UUID, HEART_RATE_SERVICE_UUID]:
-                print(f"Service: {service.uuid}")
-                print(f"Description: {service.description}")
-                for characteristic in service.characteristics:
-                    print(f"  Characteristic: {characteristic.uuid}")
-                    if service.uuid == BATTERY_SERVICE_UUID and characteristic.uuid == BATTERY_LEVEL_CHARACTERISTIC_UUID:
-                        battery_level = await client.read_gatt_char(characteristic)
-                        print(f"  Battery Level: {int(battery_level[0])}%")
-                    elif service.uuid == DEVICE_INFORMATION_SERVICE_UUID and characteristic.uuid in CHARACTERISTIC_UUIDS.values():
-                        value = await client.read_gatt_char(characteristic)
-                        for name, uuid in CHARACTERISTIC_UUIDS.items():
-                            if characteristic.uuid == uuid and uuid != CHARACTERISTIC_UUIDS["System ID"]:
-                                printable_value = ''.join(filter(lambda x: x in string.printable, value.decode('utf-8')))
-                                print(f"  {name}: {printable_value}")
-                            elif characteristic.uuid == uuid and uuid == CHARACTERISTIC_UUIDS["System ID"]:
-                                print(f"  {name}: {'-'.join(value.hex()[i:i+2] for i in range(0, len(value.hex()), 2))}")
+    def device_discovered(entry):
+        print(f"Found {entry.name}")
+        print(f"Device: {entry.name}, Address: {entry.address}")
+        print(f"Details: {entry.device.details}")
+
+    found_device = await find_device(bt_heart_rate.service_uuid(), known_devices, device_discovered,
+                                      match=lambda device: bool(device.name) and device.name.startswith(POLAR_KEY),
+                                      key=POLAR_KEY)
+
+    try:
+        await connect(found_device)
+    except ble_backend.device_not_found_error():
+        print(f"Last Polar H10 {found_device.address} not found, scanning...")
+        known_devices.forget(POLAR_KEY)
+        await discover_devices()
+
+
+async def connect(found_device):
+    connect_started = time.monotonic()
+    async with ble_backend.client(connect_target(found_device)) as client:
+        log = recorder.session_recorder("polar")
+        first_sample = None
+        variability = hrv.HRVStream()
 
         def heart_rate_handler(sender, data):
-            heart_rate = int(data[1])
-            print(f"Heart Rate: {heart_rate} bpm")
-        await client.start_notify(HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID, heart_rate_handler)
+            nonlocal first_sample
+            if first_sample is None:
+                first_sample = time.monotonic() - connect_started
+                print(f"Time to first sample: {first_sample:.2f} s")
+            log.record(found_device.address, bt_heart_rate.measurement_uuid(), data)
+            measurement = parse_hr_measurement(data)
+            rr = ", ".join(f"{interval:.0f}" for interval in measurement.rr_intervals)
+            variability.extend(measurement.rr_intervals)
+            rmssd = variability.rmssd
+            print(f"Heart Rate: {measurement.hr} bpm" + (f"  RR: {rr} ms" if rr else "") +
+                  (f"  RMSSD: {rmssd:.0f} ms" if rmssd is not None else ""))
+
+        def metadata_ready(values, cached):
+            for service, items in gatt_metadata.group_by_service(gatt_metadata.DEVICE_INFORMATION_FIELDS, values).items():
+                print(f"Service: {service}")
+                for name, value in items.items():
+                    print(f"  {name}: {value}")
+            print(f"Metadata {'from cache' if cached else 'read'} after {time.monotonic() - connect_started:.2f} s")
+
+        await client.start_notify(bt_heart_rate.measurement_uuid(), stats.handler("hr", heart_rate_handler))
+        gatt_metadata.fetch_in_background(client, found_device.address, gatt_metadata.DEVICE_INFORMATION_FIELDS,
+                                          metadata_cache, metadata_ready,
+                                          lambda error: print(f"Metadata read failed: {error!r}"))
         await asyncio.sleep(30)  # Keep receiving notifications for 30 seconds
+        log.close()
         try:
-            await client.stop_notify(characteristic)
+            await client.stop_notify(bt_heart_rate.measurement_uuid())
         except Exception as e:
             print(f"Error stopping notifications: {e}")
 
 
-if __name__ == "__main__":
+async def main():
+    loop_watch = asyncio.create_task(stats.watch_loop())
+    try:
+        await discover_devices()
+    finally:
+        loop_watch.cancel()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Print heart rate and RR intervals from a Polar H10.")
+    parser.add_argument("--stats", metavar="FILE", help="Write handler, jitter and loop lag stats as JSON on exit; "
+                             "set TREADMILL_DECODE_TIMING=1 to include decode times")
+    args = parser.parse_args(argv)
     print("Scanning for devices...")
-    asyncio.run(discover_devices())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        if args.stats:
+            stats.dump(args.stats)
+            print(f"Stats written to {args.stats}")
+
+
+if __name__ == "__main__":
+    cli()
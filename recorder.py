@@ -0,0 +1,309 @@
+import asyncio
+import mmap
+import os
+import struct
+import time
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+MAGIC = b"TRLOG\x01\n"
+# kind, monotonic timestamp, device index, characteristic index, payload length
+FRAME = struct.Struct("<BdHHH")
+FRAME_DATA = 0
+FRAME_DEVICE = 1
+FRAME_CHARACTERISTIC = 2
+
+DEFAULT_FLUSH_BYTES = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+RECORDINGS_DIR = "recordings"
+
+
+class Frame(NamedTuple):
+    timestamp: float
+    device: str
+    uuid: str
+    data: memoryview
+
+
+class Recorder:
+    """
+    Append-only log of raw notifications.
+
+    record() only appends to an in-memory buffer; the buffer is written out
+    when it grows past `flush_bytes` or `flush_interval` seconds after the
+    first unflushed frame, so the notification path never waits on the disk.
+    Devices and characteristic UUIDs are written once and then referenced by
+    index, keeping data frames at 15 bytes plus payload.
+    """
+
+    def __init__(self, path, flush_bytes=DEFAULT_FLUSH_BYTES, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.file = open(path, "wb")
+        self.buffer = bytearray(MAGIC)
+        self.devices = {}
+        self.characteristics = {}
+        self.frames = 0
+        self._timer = None
+
+    def _define(self, table, kind, name):
+        index = table[name] = len(table)
+        encoded = name.encode()
+        self.buffer += FRAME.pack(kind, 0.0, index, index, len(encoded))
+        self.buffer += encoded
+        return index
+
+    def record(self, device: str, uuid: str, data, timestamp: float = None) -> None:
+        if timestamp is None:
+            timestamp = time.monotonic()
+        device_index = self.devices.get(device)
+        if device_index is None:
+            device_index = self._define(self.devices, FRAME_DEVICE, device)
+        uuid_index = self.characteristics.get(uuid)
+        if uuid_index is None:
+            uuid_index = self._define(self.characteristics, FRAME_CHARACTERISTIC, uuid)
+        buffer = self.buffer
+        buffer += FRAME.pack(FRAME_DATA, timestamp, device_index, uuid_index, len(data))
+        buffer += data
+        self.frames += 1
+        if len(buffer) >= self.flush_bytes:
+            self.flush()
+        elif self._timer is None and self.flush_interval:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+            except RuntimeError:
+                pass
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.buffer and not self.file.closed:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def session_recorder(name: str, directory: str = RECORDINGS_DIR) -> Recorder:
+    """Open a new timestamped log for one session, e.g. recordings/hr-20260101-120000.trlog."""
+    os.makedirs(directory, exist_ok=True)
+    return Recorder(os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.trlog"))
+
+
+class Reader:
+    """
+    Memory-maps a log and yields frames whose payloads are memoryview slices
+    of the map. Copy a payload with bytes() to keep it past the handler call.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.view = memoryview(self.map)
+        if self.view[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a notification log.")
+
+    def __iter__(self) -> Iterator[Frame]:
+        view = self.view
+        unpack = FRAME.unpack_from
+        header = FRAME.size
+        end = len(view)
+        offset = len(MAGIC)
+        devices = []
+        characteristics = []
+        while offset + header <= end:
+            kind, timestamp, device, uuid, length = unpack(view, offset)
+            offset += header
+            if offset + length > end:
+                break  # Frame cut short by a crash mid-write
+            payload = view[offset:offset + length]
+            offset += length
+            if kind == FRAME_DATA:
+                yield Frame(timestamp, devices[device], characteristics[uuid], payload)
+            elif kind == FRAME_DEVICE:
+                devices.append(str(payload, "utf-8"))
+            elif kind == FRAME_CHARACTERISTIC:
+                characteristics.append(str(payload, "utf-8"))
+
+    def close(self) -> None:
+        self.view.release()
+        if isinstance(self.map, mmap.mmap):
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # A caller kept a payload view; the map is released with it
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def replay(path, handlers: Dict[str, Callable], speed: Optional[float] = 1.0, device: str = None,
+                 timestamps: bool = False) -> int:
+    """
+    Feed a log back through notification handlers.
+
+    Args:
+        path: Log written by Recorder.
+        handlers: Characteristic UUID -> handler(sender, data), as passed to start_notify.
+        speed: 1.0 for real time, N for N times faster, None or 0 for as fast as possible.
+        device: Only replay frames from this device when given.
+        timestamps: Call handler(sender, data, timestamp) with the recorded
+            arrival time, so stores keep the session's own timeline at any speed.
+
+    Returns:
+        int: Number of frames delivered.
+    """
+    loop = asyncio.get_running_loop()
+    delivered = 0
+    first = None
+    started = loop.time()
+    with Reader(path) as reader:
+        for frame in reader:
+            handler = handlers.get(frame.uuid)
+            if handler is None or (device is not None and frame.device != device):
+                continue
+            if speed:
+                if first is None:
+                    first = frame.timestamp
+                delay = started + (frame.timestamp - first) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if timestamps:
+                handler(frame.uuid, frame.data, frame.timestamp)
+            else:
+                handler(frame.uuid, frame.data)
+            delivered += 1
+            if not speed and delivered % 4096 == 0:
+                await asyncio.sleep(0)  # Let other tasks run during a flat-out replay
+    return delivered
+
+
+def telemetry_handlers(store) -> Dict[str, Callable]:
+    """
+    Handlers decoding the known measurement characteristics into a TelemetryStore.
+
+    They take an optional third argument, the arrival time, for replay(..., timestamps=True);
+    without it samples are stamped with time.monotonic() as they arrive.
+    """
+    import bt_fitness_machine
+    import bt_heart_rate
+    import bt_running_speed_cadence
+    import telemetry
+
+    treadmill_decoder = bt_fitness_machine.TreadmillDataDecoder()
+
+    def heart_rate_handler(sender, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        measurement = bt_heart_rate.parse_hr_measurement(data)
+        store.append(telemetry.HR, measurement.hr, timestamp)
+        store.extend(telemetry.RR, measurement.rr_intervals, timestamp)
+
+    def running_speed_and_cadence_handler(sender, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        result = bt_running_speed_cadence.decode_rsc_measurement(data)
+        store.append(telemetry.SPEED, result.speed_kmh, timestamp)
+        store.append(telemetry.CADENCE, result.cadence, timestamp)
+
+    def treadmill_data_handler(sender, data, timestamp=None):
+        result = treadmill_decoder.decode(data)
+        if result.inclination_pct is not None:
+            store.append(telemetry.INCLINE, result.inclination_pct, timestamp)
+
+    return {
+        bt_heart_rate.measurement_uuid(): heart_rate_handler,
+        bt_running_speed_cadence.measurement_uuid(): running_speed_and_cadence_handler,
+        bt_fitness_machine.treadmill_data_uuid(): treadmill_data_handler,
+    }
+
+
+async def record_sensors(log: Recorder, hr: bool = True, treadmill: bool = False, seconds: float = None) -> None:
+    """Record raw notifications from the HR strap and/or treadmill, without decoding them."""
+    import bt_fitness_machine
+    import bt_heart_rate
+    import bt_running_speed_cadence
+    from connection_manager import ConnectionManager, SensorLink
+    from discovery import KnownDeviceCache, connect_target, find_device
+
+    known_devices = KnownDeviceCache()
+    manager = ConnectionManager()
+
+    def handlers(address, uuids):
+        record = log.record
+        return {uuid: lambda sender, data, uuid=uuid: record(address, uuid, data) for uuid in uuids}
+
+    try:
+        if hr:
+            device = await find_device(bt_heart_rate.service_uuid(), known_devices)
+            manager.add(SensorLink("hr", connect_target(device),
+                                   handlers(device.address, [bt_heart_rate.measurement_uuid()])))
+        if treadmill:
+            device = await find_device(bt_fitness_machine.service_uuid(), known_devices)
+            manager.add(SensorLink("treadmill", connect_target(device),
+                                   handlers(device.address, [bt_running_speed_cadence.measurement_uuid(),
+                                                             bt_fitness_machine.treadmill_data_uuid(),
+                                                             bt_fitness_machine.status_uuid()])))
+        if seconds:
+            await asyncio.sleep(seconds)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await manager.close()
+
+
+def record_cli(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record raw notifications to a log for later replay.")
+    parser.add_argument("--hr", action="store_true", help="Record the HR strap")
+    parser.add_argument("--treadmill", action="store_true", help="Record the treadmill")
+    parser.add_argument("--seconds", type=float, default=None, help="Stop after SECONDS")
+    parser.add_argument("--directory", default=RECORDINGS_DIR)
+    args = parser.parse_args(argv)
+
+    log = session_recorder("session", args.directory)
+    print(f"Recording to {log.path}")
+    try:
+        asyncio.run(record_sensors(log, args.hr or not args.treadmill, args.treadmill, args.seconds))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+    print(f"Recorded {log.frames} notifications")
+
+
+def replay_cli(argv=None):
+    import argparse
+
+    from telemetry import TelemetryStore
+
+    parser = argparse.ArgumentParser(description="Replay a notification log through the decoders.")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=0, help="1 for real time, N for N times faster, 0 for flat out")
+    args = parser.parse_args(argv)
+
+    begin = time.perf_counter()
+    count = asyncio.run(replay(args.path, telemetry_handlers(TelemetryStore()), args.speed, timestamps=True))
+    elapsed = time.perf_counter() - begin
+    print(f"Replayed {count} notifications in {elapsed:.3f} s ({count / elapsed if elapsed else 0:.0f}/s)")
+
+
+if __name__ == "__main__":
+    replay_cli()
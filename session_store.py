@@ -0,0 +1,482 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import telemetry
+from derived import MAX_INTEGRATION_GAP_S, trapezoid_km_per_second
+
+SESSIONS_PATH = os.path.join(os.path.expanduser("~"), ".treadmill-app", "sessions.db")
+DEFAULT_ATHLETE = "default"
+ZONES = 5  # Below the first boundary, then one per DEFAULT_HR_ZONES boundary
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    athlete TEXT NOT NULL,
+    device TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    day TEXT NOT NULL,
+    ended_at REAL,
+    duration_s REAL,
+    samples INTEGER,
+    avg_hr REAL,
+    max_hr REAL,
+    distance_m REAL,
+    avg_speed_kmh REAL,
+    max_speed_kmh REAL,
+    pace_min_per_km REAL,
+    elevation_gain_m REAL,
+    {", ".join(f"zone{zone}_s REAL" for zone in range(ZONES))}
+);
+CREATE INDEX IF NOT EXISTS sessions_athlete ON sessions (athlete, started_at);
+CREATE INDEX IF NOT EXISTS sessions_device ON sessions (device, started_at);
+CREATE INDEX IF NOT EXISTS sessions_day ON sessions (day);
+CREATE TABLE IF NOT EXISTS samples (
+    session_id INTEGER NOT NULL,
+    t REAL NOT NULL,
+    channel INTEGER NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_session ON samples (session_id);
+CREATE TABLE IF NOT EXISTS minutes (
+    session_id INTEGER NOT NULL,
+    minute INTEGER NOT NULL,
+    avg_hr REAL,
+    max_hr REAL,
+    distance_m REAL,
+    avg_speed_kmh REAL,
+    max_speed_kmh REAL,
+    elevation_gain_m REAL,
+    PRIMARY KEY (session_id, minute)
+) WITHOUT ROWID;
+"""
+
+MINUTE_COLUMNS = ("minute", "avg_hr", "max_hr", "distance_m", "avg_speed_kmh", "max_speed_kmh", "elevation_gain_m")
+SUMMARY_COLUMNS = ("ended_at", "duration_s", "samples", "avg_hr", "max_hr", "distance_m", "avg_speed_kmh",
+                   "max_speed_kmh", "pace_min_per_km", "elevation_gain_m") + tuple(f"zone{zone}_s" for zone in range(ZONES))
+
+
+class _Accumulator:
+    __slots__ = ("hr_total", "hr_count", "hr_max", "speed_total", "speed_count", "speed_max", "distance_m", "climb_m")
+
+    def __init__(self):
+        self.hr_total = self.speed_total = self.distance_m = self.climb_m = 0.0
+        self.hr_count = self.speed_count = 0
+        self.hr_max = self.speed_max = None
+
+    def hr(self, value):
+        self.hr_total += value
+        self.hr_count += 1
+        self.hr_max = value if self.hr_max is None else max(self.hr_max, value)
+
+    def speed(self, value):
+        self.speed_total += value
+        self.speed_count += 1
+        self.speed_max = value if self.speed_max is None else max(self.speed_max, value)
+
+    @property
+    def avg_hr(self):
+        return self.hr_total / self.hr_count if self.hr_count else None
+
+    @property
+    def avg_speed(self):
+        return self.speed_total / self.speed_count if self.speed_count else None
+
+
+def rollup(rows: Iterable[Sequence[float]], zones: Sequence[float] = telemetry.DEFAULT_HR_ZONES):
+    """
+    Per-minute and per-session summaries of one session's samples.
+
+    Distance comes from the reported total distance when the session has
+    one, from integrated speed otherwise. Elevation gain is integrated from
+    speed and positive incline. Time in zone follows Channel: each interval
+    up to MAX_ZONE_GAP_S is credited to the zone of the sample that starts it.
+
+    Args:
+        rows: (t, channel id, value) in time order, t in Unix seconds.
+        zones: HR zone boundaries in bpm.
+
+    Returns:
+        tuple: (minute rows as tuples in MINUTE_COLUMNS order,
+            dict of SUMMARY_COLUMNS values).
+    """
+    hr_id, speed_id = telemetry.CHANNEL_IDS[telemetry.HR], telemetry.CHANNEL_IDS[telemetry.SPEED]
+    distance_id, incline_id = telemetry.CHANNEL_IDS[telemetry.DISTANCE], telemetry.CHANNEL_IDS[telemetry.INCLINE]
+    minutes: Dict[int, _Accumulator] = {}
+    session = _Accumulator()
+    zone_seconds = [0.0] * ZONES
+    first = last = None
+    count = 0
+    last_hr = last_speed = last_distance = None
+    incline = 0.0
+    reported_distance = False
+
+    for t, channel, value in rows:
+        if first is None:
+            first = t
+        last = t
+        count += 1
+        minute = minutes.get(int((t - first) // 60))
+        if minute is None:
+            minute = minutes[int((t - first) // 60)] = _Accumulator()
+        if channel == hr_id:
+            if last_hr is not None and 0 < t - last_hr[0] <= telemetry.MAX_ZONE_GAP_S:
+                zone_seconds[bisect_right(zones, last_hr[1])] += t - last_hr[0]
+            last_hr = (t, value)
+            minute.hr(value)
+            session.hr(value)
+        elif channel == speed_id:
+            if last_speed is not None and 0 < t - last_speed[0] <= MAX_INTEGRATION_GAP_S:
+                elapsed = t - last_speed[0]
+                km = trapezoid_km_per_second(last_speed[1], value) * elapsed
+                if not reported_distance:
+                    minute.distance_m += km * 1000
+                    session.distance_m += km * 1000
+                if incline > 0:
+                    minute.climb_m += km * 1000 * incline / 100
+                    session.climb_m += km * 1000 * incline / 100
+            last_speed = (t, value)
+            minute.speed(value)
+            session.speed(value)
+        elif channel == distance_id:
+            if not reported_distance:
+                # The treadmill reports distance: drop what was integrated so far
+                reported_distance = True
+                session.distance_m = 0.0
+                for accumulator in minutes.values():
+                    accumulator.distance_m = 0.0
+            if last_distance is not None and value >= last_distance:
+                minute.distance_m += value - last_distance
+                session.distance_m += value - last_distance
+            last_distance = value
+        elif channel == incline_id:
+            incline = value
+
+    minute_rows = [(index, m.avg_hr, m.hr_max, m.distance_m, m.avg_speed, m.speed_max, m.climb_m)
+                   for index, m in sorted(minutes.items())]
+    duration = (last - first) if first is not None else 0.0
+    distance = session.distance_m
+    summary = dict(ended_at=last, duration_s=duration, samples=count, avg_hr=session.avg_hr, max_hr=session.hr_max,
+                   distance_m=distance, avg_speed_kmh=session.avg_speed, max_speed_kmh=session.speed_max,
+                   pace_min_per_km=duration / 60 / (distance / 1000) if distance > 0 else None,
+                   elevation_gain_m=session.climb_m)
+    summary.update((f"zone{zone}_s", seconds) for zone, seconds in enumerate(zone_seconds))
+    return minute_rows, summary
+
+
+class Session:
+    """
+    One workout being written to a SessionStore.
+
+    pull() copies the samples appended to a TelemetryStore since the last
+    call and hands them to the store's writer thread as one batch; nothing
+    on this side touches the database, so pulling once per UI frame (or
+    from a timer) never holds up the notification handlers.
+    """
+
+    def __init__(self, store: "SessionStore", session_id: int):
+        self.store = store
+        self.id = session_id
+        # Channels hold monotonic timestamps; the database keeps Unix time
+        self.clock_offset = time.time() - time.monotonic()
+        self.cursors: Dict[str, int] = {}
+        self.closed = False
+
+    def pull(self, telemetry_store: telemetry.TelemetryStore) -> int:
+        """Queue the samples appended since the last pull; returns how many."""
+        batch = []
+        session_id, offset = self.id, self.clock_offset
+        for name, channel in telemetry_store.channels.items():
+            count = channel.count
+            cursor = max(self.cursors.get(name, 0), count - channel.capacity)
+            if cursor == count:
+                continue
+            channel_id = telemetry.CHANNEL_IDS[name]
+            timestamps, values, capacity = channel.timestamps, channel.values, channel.capacity
+            batch.extend((session_id, timestamps[index % capacity] + offset, channel_id, values[index % capacity])
+                         for index in range(cursor, count))
+            self.cursors[name] = count
+        if batch:
+            self.store._queue.put(("samples", batch))
+        return len(batch)
+
+    def close(self, zones: Sequence[float] = telemetry.DEFAULT_HR_ZONES) -> None:
+        """Queue the rollups; samples pulled after this are ignored."""
+        if not self.closed:
+            self.closed = True
+            self.store._queue.put(("close", (self.id, tuple(zones))))
+
+
+class SessionStore:
+    """
+    Local SQLite database of workout sessions.
+
+    Raw samples are written by a background thread in one transaction per
+    batch. Closing a session computes its per-minute rows and per-session
+    summary once, so history queries read the small indexed `sessions` and
+    `minutes` tables and never scan raw samples.
+
+    Session ids are handed out from a counter read when the store opens, and
+    the session row itself is written by the writer thread, so start() never
+    waits on the database either. One process writes to a database at a time.
+    """
+
+    def __init__(self, path: str = SESSIONS_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = self._connect()
+        self.db.executescript(SCHEMA)
+        self._next_id = self.db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM sessions").fetchone()[0]
+        self.batches = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error: Optional[Exception] = None
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write, name="session-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.row_factory = sqlite3.Row
+        return db
+
+    def start(self, device: str, kind: str, athlete: str = DEFAULT_ATHLETE,
+              telemetry_store: telemetry.TelemetryStore = None, started: float = None) -> Session:
+        """
+        Open a session; with `telemetry_store`, samples already in it are not part of the session.
+        The row is queued like samples are: call sync() before querying it.
+        """
+        if started is None:
+            started = time.time()
+        session_id = self._next_id
+        self._next_id += 1
+        self._queue.put(("start", (session_id, athlete, device, kind, started,
+                                   time.strftime("%Y-%m-%d", time.localtime(started)))))
+        session = Session(self, session_id)
+        if telemetry_store is not None:
+            session.cursors = {name: channel.count for name, channel in telemetry_store.channels.items()}
+        return session
+
+    def _write(self) -> None:
+        db = self._connect()
+        while True:
+            kind, payload = self._queue.get()
+            if kind == "stop":
+                break
+            # Coalesce everything already queued into one transaction
+            work = [(kind, payload)]
+            while True:
+                try:
+                    work.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            synced = []
+            try:
+                with db:
+                    db.execute("BEGIN")
+                    for kind, payload in work:
+                        if kind == "samples":
+                            db.executemany("INSERT INTO samples VALUES (?, ?, ?, ?)", payload)
+                            self.written += len(payload)
+                        elif kind == "start":
+                            db.execute("INSERT INTO sessions (id, athlete, device, kind, started_at, day) "
+                                       "VALUES (?, ?, ?, ?, ?, ?)", payload)
+                        elif kind == "close":
+                            self._close_session(db, *payload)
+                        elif kind == "stop":
+                            stop = True
+                        elif kind == "sync":
+                            synced.append(payload)
+            except sqlite3.Error as e:
+                # Losing a batch beats stopping the writer for the rest of the workout
+                self.errors += 1
+                self.last_error = e
+            self.batches += 1
+            for done in synced:
+                done.set()
+            if stop:
+                break
+        db.close()
+
+    @staticmethod
+    def _close_session(db: sqlite3.Connection, session_id: int, zones: tuple) -> None:
+        rows = db.execute("SELECT t, channel, value FROM samples WHERE session_id = ? ORDER BY t", (session_id,))
+        minute_rows, summary = rollup(rows, zones)
+        db.executemany(f"INSERT OR REPLACE INTO minutes (session_id, {', '.join(MINUTE_COLUMNS)}) "
+                       f"VALUES (?, {', '.join('?' * len(MINUTE_COLUMNS))})",
+                       [(session_id, *row) for row in minute_rows])
+        db.execute(f"UPDATE sessions SET {', '.join(f'{column} = ?' for column in SUMMARY_COLUMNS)} WHERE id = ?",
+                   (*(summary[column] for column in SUMMARY_COLUMNS), session_id))
+
+    def sync(self, timeout: float = None) -> bool:
+        """Wait until everything queued so far is committed."""
+        done = threading.Event()
+        self._queue.put(("sync", done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        self._queue.put(("stop", None))
+        self._writer.join()
+        self.db.close()
+
+    def session(self, session_id: int) -> Optional[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+
+    def minutes(self, session_id: int) -> List[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM minutes WHERE session_id = ? ORDER BY minute", (session_id,)).fetchall()
+
+    def recent(self, athlete: str = DEFAULT_ATHLETE, limit: int = 10) -> List[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM sessions WHERE athlete = ? AND ended_at IS NOT NULL "
+                               "ORDER BY started_at DESC LIMIT ?", (athlete, limit)).fetchall()
+
+    def weekly_totals(self, athlete: str = DEFAULT_ATHLETE, weeks: int = 8) -> List[sqlite3.Row]:
+        """Sessions, time, distance and climb per ISO-ish week (Monday first), newest first."""
+        since = time.time() - weeks * 7 * 86400
+        return self.db.execute(
+            "SELECT strftime('%Y-%W', started_at, 'unixepoch', 'localtime') AS week, COUNT(*) AS sessions, "
+            "SUM(duration_s) AS duration_s, SUM(distance_m) AS distance_m, "
+            "SUM(elevation_gain_m) AS elevation_gain_m, MAX(max_hr) AS max_hr "
+            "FROM sessions WHERE athlete = ? AND started_at >= ? AND ended_at IS NOT NULL "
+            "GROUP BY week ORDER BY week DESC", (athlete, since)).fetchall()
+
+    def personal_bests(self, athlete: str = DEFAULT_ATHLETE, min_distance_m: float = 1000.0) -> Dict[str, Optional[sqlite3.Row]]:
+        """The athlete's longest, farthest, fastest-paced and biggest-climb sessions, and fastest minute."""
+        db = self.db
+        where = "WHERE athlete = ? AND ended_at IS NOT NULL"
+        fastest_minute = ("SELECT minutes.*, sessions.started_at FROM sessions "
+                          "JOIN minutes ON minutes.session_id = sessions.id "
+                          "WHERE sessions.athlete = ? AND sessions.ended_at IS NOT NULL "
+                          "ORDER BY minutes.avg_speed_kmh DESC LIMIT 1")
+        bests = {
+            "longest": db.execute(f"SELECT * FROM sessions {where} ORDER BY duration_s DESC LIMIT 1", (athlete,)),
+            "farthest": db.execute(f"SELECT * FROM sessions {where} ORDER BY distance_m DESC LIMIT 1", (athlete,)),
+            "fastest_pace": db.execute(f"SELECT * FROM sessions {where} AND distance_m >= ? "
+                                       "ORDER BY pace_min_per_km LIMIT 1", (athlete, min_distance_m)),
+            "most_climb": db.execute(f"SELECT * FROM sessions {where} ORDER BY elevation_gain_m DESC LIMIT 1",
+                                     (athlete,)),
+            "fastest_minute": db.execute(fastest_minute, (athlete,)),
+        }
+        return {name: cursor.fetchone() for name, cursor in bests.items()}
+
+    def previous(self, session_id: int) -> Optional[sqlite3.Row]:
+        """The same athlete's last finished session of the same kind before `session_id`."""
+        return self.db.execute(
+            "SELECT previous.* FROM sessions AS current JOIN sessions AS previous "
+            "ON previous.athlete = current.athlete AND previous.kind = current.kind "
+            "AND previous.started_at < current.started_at AND previous.ended_at IS NOT NULL "
+            "WHERE current.id = ? ORDER BY previous.started_at DESC LIMIT 1", (session_id,)).fetchone()
+
+
+def describe(row: sqlite3.Row) -> str:
+    text = f"#{row['id']} {time.strftime('%Y-%m-%d %H:%M', time.localtime(row['started_at']))} {row['kind']}"
+    if row["duration_s"]:
+        text += f" {row['duration_s'] / 60:.0f} min"
+    if row["distance_m"]:
+        text += f" {row['distance_m'] / 1000:.2f} km"
+    if row["pace_min_per_km"]:
+        text += f" {row['pace_min_per_km']:.2f} min/km"
+    if row["avg_hr"]:
+        text += f" HR {row['avg_hr']:.0f}/{row['max_hr']:.0f}"
+    if row["elevation_gain_m"]:
+        text += f" +{row['elevation_gain_m']:.0f} m"
+    return text
+
+
+def cli(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show recorded sessions, weekly totals and personal bests.")
+    parser.add_argument("--athlete", default=DEFAULT_ATHLETE)
+    parser.add_argument("--database", default=SESSIONS_PATH)
+    parser.add_argument("--weeks", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.database)
+    started = time.perf_counter()
+    recent = store.recent(args.athlete)
+    weeks = store.weekly_totals(args.athlete, args.weeks)
+    bests = store.personal_bests(args.athlete)
+    previous = store.previous(recent[0]["id"]) if recent else None
+    elapsed = time.perf_counter() - started
+    print("Recent sessions:")
+    for row in recent:
+        print(f"  {describe(row)}")
+    if previous is not None:
+        print(f"Last run compared with {describe(previous)}")
+    print("Weekly totals:")
+    for week in weeks:
+        print(f"  {week['week']}: {week['sessions']} sessions, {(week['duration_s'] or 0) / 3600:.1f} h, "
+              f"{(week['distance_m'] or 0) / 1000:.1f} km, +{week['elevation_gain_m'] or 0:.0f} m")
+    print("Personal bests:")
+    for name, row in bests.items():
+        if row is not None:
+            print(f"  {name.replace('_', ' ')}: " + (describe(row) if name != "fastest_minute" else
+                                                   f"{row['avg_speed_kmh']:.1f} km/h in minute {row['minute']} of "
+                                                   f"session #{row['session_id']}"))
+    print(f"Queried in {elapsed * 1000:.1f} ms")
+    store.close()
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    # 200 past 30-minute treadmill sessions at 2 Hz, then one live 1-hour session at 10 Hz
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    store = SessionStore(path)
+    rng = random.Random(3)
+    begin = time.perf_counter()
+    for day in range(200):
+        started = time.time() - (200 - day) * 86400
+        session = store.start("F0:00:00:00:00:03", "treadmill", started=started)
+        speed = rng.uniform(8, 13)
+        rows = []
+        for i in range(30 * 60 * 2):
+            t = started + i / 2
+            rows.append((session.id, t, telemetry.CHANNEL_IDS[telemetry.SPEED], speed + rng.uniform(-0.5, 0.5)))
+            rows.append((session.id, t, telemetry.CHANNEL_IDS[telemetry.HR], 120 + speed * 3 + rng.uniform(-5, 5)))
+            if i % 60 == 0:
+                rows.append((session.id, t, telemetry.CHANNEL_IDS[telemetry.INCLINE], rng.choice((0, 1, 2, 4))))
+        store._queue.put(("samples", rows))
+        session.close()
+    store.sync()
+    print(f"200 past sessions ({store.written} samples) written and rolled up in {time.perf_counter() - begin:.1f} s")
+
+    live = telemetry.TelemetryStore()
+    session = store.start("F0:00:00:00:00:03", "treadmill")
+    now = time.monotonic() - 3600
+    pull_time = 0.0
+    pulls = 0
+    for frame in range(3600 * 4):
+        for i in range(frame * 10 // 4, (frame + 1) * 10 // 4):
+            t = now + i / 10
+            live.append(telemetry.SPEED, 11 + (i % 100) / 100, t)
+            live.append(telemetry.HR, 150 + (i % 20), t)
+        started = time.perf_counter()
+        pulls += session.pull(live) > 0
+        pull_time += time.perf_counter() - started
+    begin = time.perf_counter()
+    session.close()
+    store.sync()
+    print(f"live hour: {pull_time / pulls * 1e6:.1f} us per pull on the UI side, "
+          f"{store.batches} writer transactions, close and rollup in {(time.perf_counter() - begin) * 1000:.0f} ms")
+
+    for name, query in (("weekly totals", lambda: store.weekly_totals(weeks=30)),
+                        ("personal bests", lambda: store.personal_bests()),
+                        ("compare with last run", lambda: store.previous(session.id)),
+                        ("session minutes", lambda: store.minutes(session.id))):
+        begin = time.perf_counter()
+        for _ in range(20):
+            query()
+        print(f"{name}: {(time.perf_counter() - begin) / 20 * 1000:.2f} ms")
+    print(describe(store.session(session.id)), "vs", describe(store.previous(session.id)))
+    store.close()
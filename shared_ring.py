@@ -0,0 +1,182 @@
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, NamedTuple, Tuple
+
+DEFAULT_CAPACITY = 4096
+
+# Header: records written (uint64), capacity (uint64)
+_HEADER = struct.Struct("<QQ")
+# Record: timestamp, channel, value as three doubles
+RECORD_FIELDS = 3
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    channel: int
+    value: float
+
+
+def _untrack(memory: shared_memory.SharedMemory) -> None:
+    # The creator unlinks explicitly; without this the resource tracker of
+    # whichever process exits first would unlink a ring other processes still map.
+    resource_tracker.unregister(memory._name, "shared_memory")
+
+
+class SharedRing:
+    """
+    Fixed-size ring of (timestamp, channel, value) samples in shared memory.
+
+    There is one writer per ring. Readers in any process attach by name and
+    read straight out of the mapping, so nothing is pickled or copied between
+    processes. The writer fills a slot, then publishes it by bumping the write
+    count in the header. A reader that falls more than `capacity` samples
+    behind skips ahead and counts the overrun. A slot overwritten while it was
+    being read is detected by re-reading the count and is dropped.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        self.header = memory.buf[:_HEADER.size].cast("Q")
+        self.capacity = self.header[1]
+        self.values = memory.buf[_HEADER.size:_HEADER.size + self.capacity * RECORD_FIELDS * 8].cast("d")
+        self.count = self.header[0]
+        self._slots = None  # array(), kept for read_array()
+
+    @classmethod
+    def create(cls, name: str, capacity: int = DEFAULT_CAPACITY) -> "SharedRing":
+        try:
+            stale = shared_memory.SharedMemory(name)
+        except FileNotFoundError:
+            pass
+        else:
+            stale.close()
+            stale.unlink()
+        memory = shared_memory.SharedMemory(name, create=True, size=_HEADER.size + capacity * RECORD_FIELDS * 8)
+        _untrack(memory)
+        _HEADER.pack_into(memory.buf, 0, 0, capacity)
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRing":
+        memory = shared_memory.SharedMemory(name)
+        _untrack(memory)
+        return cls(memory, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def written(self) -> int:
+        return self.header[0]
+
+    def write(self, timestamp: float, channel: int, value: float) -> None:
+        count = self.count
+        i = count % self.capacity * RECORD_FIELDS
+        values = self.values
+        values[i] = timestamp
+        values[i + 1] = channel
+        values[i + 2] = value
+        self.count = self.header[0] = count + 1
+
+    def read(self, cursor: int) -> Tuple[List[Sample], int, int]:
+        """
+        Samples written since `cursor` as tuples; returns (samples, new cursor, samples lost to overrun).
+        A convenience for a few samples at a time: readers draining rings use read_array().
+        """
+        written = self.header[0]
+        capacity = self.capacity
+        lost = 0
+        if written - cursor > capacity:
+            lost = written - capacity - cursor
+            cursor = written - capacity
+        values = self.values
+        samples = []
+        for count in range(cursor, written):
+            i = count % capacity * RECORD_FIELDS
+            samples.append(Sample(values[i], int(values[i + 1]), values[i + 2]))
+        overwritten = self.header[0] - capacity - cursor
+        if overwritten > 0:
+            lost += min(overwritten, len(samples))
+            samples = samples[overwritten:]
+        return samples, written, lost
+
+    def read_array(self, cursor: int) -> Tuple["numpy.ndarray", int, int]:
+        """
+        Samples written since `cursor` as an (n, 3) array of (timestamp, channel, value) rows.
+
+        The rows are copied out of array() in at most two slices, one either
+        side of the wrap, and checked for overrun after the copy as in read().
+
+        Returns:
+            tuple: (rows, new cursor, samples lost to overrun).
+        """
+        import numpy
+
+        written = self.header[0]
+        capacity = self.capacity
+        lost = 0
+        if written - cursor > capacity:
+            lost = written - capacity - cursor
+            cursor = written - capacity
+        slots = self._slots
+        if slots is None:
+            slots = self._slots = self.array()
+        first = cursor % capacity
+        end = first + written - cursor
+        if end <= capacity:
+            rows = slots[first:end].copy()
+        else:
+            rows = numpy.concatenate((slots[first:], slots[:end - capacity]))
+        overwritten = self.header[0] - capacity - cursor
+        if overwritten > 0:
+            lost += min(overwritten, len(rows))
+            rows = rows[overwritten:]
+        return rows, written, lost
+
+    def array(self):
+        """The slots as a (capacity, 3) numpy view over the shared mapping (no copy), in slot order."""
+        import numpy
+        return numpy.frombuffer(self.memory.buf, dtype=numpy.float64, count=self.capacity * RECORD_FIELDS,
+                                offset=_HEADER.size).reshape(self.capacity, RECORD_FIELDS)
+
+    def close(self) -> None:
+        self._slots = None
+        self.values.release()
+        self.header.release()
+        try:
+            self.memory.close()
+        except BufferError:
+            # A numpy view from array() is still alive; the mapping goes with the process
+            pass
+        if self.owner:
+            # unlink() unregisters from the resource tracker; balance the registration dropped in create()
+            resource_tracker.register(self.memory._name, "shared_memory")
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import timeit
+
+    ring = SharedRing.create("treadmill-app-ring-benchmark", capacity=DEFAULT_CAPACITY)
+    reader = SharedRing.attach(ring.name)
+    n = 200_000
+    per_write = min(timeit.repeat(lambda: ring.write(1.0, 0, 72.0), number=n, repeat=3)) / n
+    samples, cursor, lost = reader.read(ring.written - 1000)
+    per_read = min(timeit.repeat(lambda: reader.read(ring.written - 1000), number=100, repeat=3)) / 100 / 1000
+    per_array = min(timeit.repeat(lambda: reader.read_array(ring.written - 1000), number=100, repeat=3)) / 100 / 1000
+    print(f"write:      {per_write * 1e6:.3f} us/sample")
+    print(f"read:       {per_read * 1e6:.3f} us/sample, {len(samples)} samples, {lost} lost")
+    print(f"read_array: {per_array * 1e6:.3f} us/sample")
+    reader.close()
+    ring.close()
@@ -0,0 +1,32 @@
+from rich.table import Table
+from textual.widgets import Static
+
+from instrumentation import Instrumentation, registry
+
+
+class StatsPanel(Static):
+    """Live view of an Instrumentation registry, refreshed once a second while visible."""
+
+    def __init__(self, stats: Instrumentation = registry, interval: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+        self.interval = interval
+
+    def on_mount(self) -> None:
+        self.set_interval(self.interval, self.refresh_stats)
+
+    def refresh_stats(self) -> None:
+        if not self.display:
+            return
+        table = Table("Metric", "Count", "Mean µs", "p50", "p99", "Max", box=None, padding=(0, 1))
+        for name, histogram in sorted(self.stats.histograms.items()):
+            count = histogram.count
+            if count:
+                table.add_row(name, f"{count}", f"{histogram.mean_us:.1f}", f"{histogram.percentile_us(50):g}",
+                              f"{histogram.percentile_us(99):g}", f"{histogram.percentile_us(100):g}")
+        for name, notification in sorted(self.stats.notifications.items()):
+            notification.update()
+            table.add_row(f"{name}.gaps", f"{notification.gaps}")
+            table.add_row(f"{name}.missed", f"{notification.missed}")
+            table.add_row(f"{name}.jitter", "", f"{notification.jitter_mean_us:.1f}")
+        self.update(table)
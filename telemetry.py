@@ -0,0 +1,191 @@
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+HR = "hr"
+RR = "rr"
+SPEED = "speed"
+CADENCE = "cadence"
+DISTANCE = "distance"
+INCLINE = "incline"
+CHANNELS = (HR, RR, SPEED, CADENCE, DISTANCE, INCLINE)
+# Channel ids for binary formats (shared-memory rings, the telemetry socket)
+CHANNEL_IDS = {name: index for index, name in enumerate(CHANNELS)}
+
+DEFAULT_CAPACITY = 8192
+DEFAULT_WINDOWS = (10, 60, 300)
+# 60/70/80/90% of a 190 bpm maximum; replaced once the user profile is known
+DEFAULT_HR_ZONES = (114, 133, 152, 171)
+# Gaps longer than this (dropped link, paused sensor) are not credited to any zone
+MAX_ZONE_GAP_S = 5.0
+
+
+class RollingWindow:
+    """Mean, min and max over the last `seconds`, maintained as samples arrive."""
+    __slots__ = ("seconds", "start", "total", "minima", "maxima")
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = 0
+        self.total = 0.0
+        self.minima = deque()
+        self.maxima = deque()
+
+    def _add(self, index, value, values, capacity):
+        self.total += value
+        minima, maxima = self.minima, self.maxima
+        while minima and values[minima[-1] % capacity] >= value:
+            minima.pop()
+        minima.append(index)
+        while maxima and values[maxima[-1] % capacity] <= value:
+            maxima.pop()
+        maxima.append(index)
+
+    def _evict(self, count, now, timestamps, values, capacity):
+        start = self.start
+        oldest = now - self.seconds
+        # Samples about to be overwritten by the ring leave the window too;
+        # the incoming sample (index count - 1) is never evicted.
+        floor = count - capacity
+        while start < count - 1 and (start < floor or timestamps[start % capacity] < oldest):
+            self.total -= values[start % capacity]
+            start += 1
+        self.start = start
+        minima, maxima = self.minima, self.maxima
+        while minima and minima[0] < start:
+            minima.popleft()
+        while maxima and maxima[0] < start:
+            maxima.popleft()
+
+    def size(self, count):
+        return count - self.start
+
+
+class Channel:
+    """
+    Fixed-capacity ring buffer of (monotonic timestamp, value) samples.
+
+    Appending is O(1) (amortized for min/max) and keeps every rolling window
+    and the time-in-zone totals up to date, so readers never scan history.
+    """
+
+    def __init__(self, name, capacity=DEFAULT_CAPACITY, windows=DEFAULT_WINDOWS, zones=None):
+        self.name = name
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.count = 0
+        self.windows = {seconds: RollingWindow(seconds) for seconds in windows}
+        self.zones = tuple(zones) if zones else None
+        self.zone_seconds = array('d', bytes(8 * (len(self.zones) + 1))) if self.zones else None
+
+    def append(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        capacity = self.capacity
+        count = self.count
+        if self.zones and count:
+            previous = (count - 1) % capacity
+            elapsed = timestamp - self.timestamps[previous]
+            if 0 < elapsed <= MAX_ZONE_GAP_S:
+                self.zone_seconds[bisect_right(self.zones, self.values[previous])] += elapsed
+
+        for window in self.windows.values():
+            window._evict(count + 1, timestamp, self.timestamps, self.values, capacity)
+        slot = count % capacity
+        self.timestamps[slot] = timestamp
+        self.values[slot] = value
+        for window in self.windows.values():
+            window._add(count, value, self.values, capacity)
+        self.count = count + 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def latest(self):
+        return self.values[(self.count - 1) % self.capacity] if self.count else None
+
+    @property
+    def latest_timestamp(self):
+        return self.timestamps[(self.count - 1) % self.capacity] if self.count else None
+
+    def mean(self, seconds):
+        window = self.windows[seconds]
+        size = window.size(self.count)
+        return window.total / size if size else None
+
+    def min(self, seconds):
+        window = self.windows[seconds]
+        return self.values[window.minima[0] % self.capacity] if window.minima else None
+
+    def max(self, seconds):
+        window = self.windows[seconds]
+        return self.values[window.maxima[0] % self.capacity] if window.maxima else None
+
+    def time_in_zone(self):
+        """Seconds spent in each zone; zone 0 is below the first boundary."""
+        return list(self.zone_seconds) if self.zones else []
+
+    def set_zones(self, zones):
+        """Replace the zone boundaries and restart the time-in-zone totals."""
+        self.zones = tuple(zones)
+        self.zone_seconds = array('d', bytes(8 * (len(self.zones) + 1)))
+
+    def history(self, seconds=None):
+        """Return (timestamps, values) in arrival order as NumPy arrays."""
+        import numpy as np
+
+        size = len(self)
+        indices = np.arange(self.count - size, self.count) % self.capacity
+        timestamps = np.frombuffer(self.timestamps, dtype=np.float64)[indices]
+        values = np.frombuffer(self.values, dtype=np.float64)[indices]
+        if seconds is not None and size:
+            skip = int(np.searchsorted(timestamps, timestamps[-1] - seconds, side="left"))
+            timestamps, values = timestamps[skip:], values[skip:]
+        return timestamps, values
+
+
+class TelemetryStore:
+    """One preallocated Channel per telemetry stream."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, windows=DEFAULT_WINDOWS, hr_zones=DEFAULT_HR_ZONES):
+        self.channels = {name: Channel(name, capacity, windows, hr_zones if name == HR else None)
+                         for name in CHANNELS}
+
+    def __getitem__(self, name) -> Channel:
+        return self.channels[name]
+
+    def append(self, name, value, timestamp=None):
+        self.channels[name].append(value, timestamp)
+
+    def extend(self, name, values, timestamp=None):
+        """Append several values sharing one timestamp, e.g. an RR interval burst."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        channel = self.channels[name]
+        for value in values:
+            channel.append(value, timestamp)
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    # 3 hours of 10 Hz samples, reported per 30 minutes of session
+    rate = 10
+    chunk = 30 * 60 * rate
+
+    def session(report):
+        channel = TelemetryStore()[HR]
+        for part in range(6):
+            begin = time.perf_counter()
+            for i in range(part * chunk, (part + 1) * chunk):
+                channel.append(120 + (i % 600) / 10, i / rate)
+            report(part, time.perf_counter() - begin, channel)
+
+    session(lambda part, elapsed, channel: print(
+        f"{(part + 1) * 30:4d} min: {elapsed / chunk * 1e9:6.0f} ns/append, 5 min mean {channel.mean(300):.1f}"))
+    tracemalloc.start()
+    session(lambda part, elapsed, channel: print(
+        f"{(part + 1) * 30:4d} min: traced memory {tracemalloc.get_traced_memory()[0] / 1024:6.1f} KiB"))
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import struct
+import time
+from collections import deque
+from typing import AsyncIterator, List, NamedTuple, Optional, Sequence
+
+import telemetry
+
+MAGIC = b"TRTEL\x01\r\n"
+# Sent once after MAGIC: byte length of the newline-separated device names
+HELLO = struct.Struct("<H")
+# Every sample frame: monotonic timestamp, device index, channel id, padding, value
+FRAME = struct.Struct("<dHBxf")
+DEFAULT_QUEUE_FRAMES = 4096
+DEFAULT_SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".treadmill-app", "telemetry.sock")
+READ_SIZE = 64 * 1024
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    device: int
+    channel: str
+    value: float
+
+
+class Subscriber:
+    """
+    One connected client: a bounded frame queue drained by its own writer task.
+
+    The queue drops its oldest frames when full, so a client that reads slowly
+    loses history instead of stalling publish() or the other clients.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, queue_frames: int):
+        self.writer = writer
+        self.queue = deque(maxlen=queue_frames)
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def put(self, frame: bytes) -> None:
+        queue = self.queue
+        if len(queue) == queue.maxlen:
+            self.dropped += 1
+        queue.append(frame)
+        self.ready.set()
+
+    async def run(self) -> None:
+        queue = self.queue
+        writer = self.writer
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                count = len(queue)
+                frames = [queue.popleft() for _ in range(count)]
+                writer.write(b"".join(frames))
+                self.sent += count
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Runs on cancellation too, which then propagates to whoever cancelled
+            writer.close()
+
+
+class TelemetryServer:
+    """
+    Serves decoded samples to any number of local clients as fixed-size frames.
+
+    publish() packs a sample once and appends the same bytes to every
+    subscriber's queue; it never awaits, so ingestion from the BLE handlers
+    runs at full speed whatever the clients do.
+
+    Args:
+        devices: Device names, indexed by the device field of each frame.
+        queue_frames: Frames buffered per subscriber before the oldest are dropped.
+    """
+
+    def __init__(self, devices: Sequence[str], queue_frames: int = DEFAULT_QUEUE_FRAMES):
+        self.devices = list(devices)
+        self.queue_frames = queue_frames
+        self.subscribers: List[Subscriber] = []
+        self.servers = []
+        self.published = 0
+        names = "\n".join(self.devices).encode("utf-8")
+        self.hello = MAGIC + HELLO.pack(len(names)) + names
+
+    async def _connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(self.hello)
+        subscriber = Subscriber(writer, self.queue_frames)
+        self.subscribers.append(subscriber)
+        # Its own task rather than the connection callback's, whose cancellation asyncio (3.11) reports as an error
+        subscriber.task = asyncio.create_task(subscriber.run())
+        subscriber.task.add_done_callback(lambda task: self.subscribers.remove(subscriber))
+
+    async def listen_unix(self, path: str = DEFAULT_SOCKET_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.servers.append(await asyncio.start_unix_server(self._connected, path))
+
+    async def listen_tcp(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self.servers.append(await asyncio.start_server(self._connected, host, port))
+
+    def publish(self, device: int, channel: str, value: float, timestamp: float = None) -> None:
+        frame = FRAME.pack(time.monotonic() if timestamp is None else timestamp, device,
+                           telemetry.CHANNEL_IDS[channel], value)
+        self.published += 1
+        for subscriber in self.subscribers:
+            subscriber.put(frame)
+
+    @property
+    def dropped(self) -> int:
+        return sum(subscriber.dropped for subscriber in self.subscribers)
+
+    async def close(self) -> None:
+        for server in self.servers:
+            server.close()
+        tasks = [subscriber.task for subscriber in self.subscribers if subscriber.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+
+
+class TelemetryClient:
+    """
+    Reads samples from a TelemetryServer.
+
+    Use `async for sample in client` after connect(); `devices` holds the
+    device names announced by the server.
+    """
+
+    def __init__(self, path: str = None, host: str = None, port: int = None):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.devices: List[str] = []
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self) -> None:
+        if self.host is not None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        else:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path or DEFAULT_SOCKET_PATH)
+        if await self.reader.readexactly(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a telemetry server.")
+        length, = HELLO.unpack(await self.reader.readexactly(HELLO.size))
+        names = (await self.reader.readexactly(length)).decode("utf-8")
+        self.devices = names.split("\n") if names else []
+
+    async def __aiter__(self) -> AsyncIterator[Sample]:
+        reader = self.reader
+        pending = b""
+        size = FRAME.size
+        channels = telemetry.CHANNELS
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                return
+            data = pending + data if pending else data
+            whole = len(data) - len(data) % size
+            for timestamp, device, channel, value in FRAME.iter_unpack(memoryview(data)[:whole]):
+                yield Sample(timestamp, device, channels[channel], value)
+            pending = data[whole:]
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve_sensors(server: TelemetryServer, hr: bool, treadmill: bool) -> None:
+    """Headless pipeline: connect the sensors and publish every decoded sample."""
+    import bt_fitness_machine
+    import bt_heart_rate
+    import bt_running_speed_cadence
+    from connection_manager import ConnectionManager, SensorLink
+    from discovery import KnownDeviceCache, connect_target, find_device
+
+    known_devices = KnownDeviceCache()
+    manager = ConnectionManager()
+    publish = server.publish
+
+    def heart_rate_handler(sender, data):
+        now = time.monotonic()
+        measurement = bt_heart_rate.parse_hr_measurement(data)
+        publish(0, telemetry.HR, measurement.hr, now)
+        for rr in measurement.rr_intervals:
+            publish(0, telemetry.RR, rr, now)
+
+    def running_speed_and_cadence_handler(sender, data):
+        now = time.monotonic()
+        measurement = bt_running_speed_cadence.decode_rsc_measurement(data)
+        publish(1, telemetry.SPEED, measurement.speed_kmh, now)
+        publish(1, telemetry.CADENCE, measurement.cadence, now)
+        if measurement.total_distance_m is not None:
+            publish(1, telemetry.DISTANCE, measurement.total_distance_m, now)
+
+    treadmill_decoder = bt_fitness_machine.TreadmillDataDecoder()
+
+    def treadmill_data_handler(sender, data):
+        result = treadmill_decoder.decode(data)
+        if result.inclination_pct is not None:
+            publish(1, telemetry.INCLINE, result.inclination_pct)
+
+    try:
+        if hr:
+            device = await find_device(bt_heart_rate.service_uuid(), known_devices)
+            manager.add(SensorLink("hr", connect_target(device),
+                                   {bt_heart_rate.measurement_uuid(): heart_rate_handler}))
+        if treadmill:
+            device = await find_device(bt_fitness_machine.service_uuid(), known_devices)
+            manager.add(SensorLink("treadmill", connect_target(device),
+                                   {bt_running_speed_cadence.measurement_uuid(): running_speed_and_cadence_handler,
+                                    bt_fitness_machine.treadmill_data_uuid(): treadmill_data_handler}))
+        await asyncio.Event().wait()
+    finally:
+        await manager.close()
+
+
+async def benchmark(subscribers: int, samples: int, slow: int) -> None:
+    """Publish `samples` through a Unix socket to `subscribers` clients, `slow` of which never read."""
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "telemetry.sock")
+    server = TelemetryServer(["bench"], queue_frames=DEFAULT_QUEUE_FRAMES)
+    await server.listen_unix(path)
+    received = [0] * subscribers
+    clients = [TelemetryClient(path) for _ in range(subscribers)]
+    for client in clients:
+        await client.connect()
+
+    async def consume(i, client):
+        async for _ in client:
+            received[i] += 1
+            if received[i] == samples:
+                return
+
+    readers = [asyncio.create_task(consume(i, client)) for i, client in enumerate(clients[slow:], slow)]
+    while len(server.subscribers) < subscribers:
+        await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    publish_time = 0.0
+    for batch in range(0, samples, 100):
+        begin = time.perf_counter()
+        for i in range(batch, min(batch + 100, samples)):
+            server.publish(0, telemetry.HR, 60 + i % 120, float(i))
+        publish_time += time.perf_counter() - begin
+        await asyncio.sleep(0)  # Let the writer tasks run, as between BLE notifications
+    await asyncio.wait_for(asyncio.gather(*readers), 60)
+    elapsed = time.perf_counter() - started
+    print(f"{subscribers} subscribers ({slow} never reading), {samples} samples: "
+          f"publish {publish_time / samples * 1e6:.2f} us/sample, "
+          f"{samples * (subscribers - slow) / elapsed:,.0f} frames/s delivered, "
+          f"{server.dropped} frames dropped for slow subscribers")
+    for client in clients:
+        await client.close()
+    await server.close()
+
+
+def cli(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the sensor pipeline headless and serve samples over a socket.")
+    parser.add_argument("--unix", metavar="PATH", default=None, help=f"Unix socket path (default {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="Also listen on TCP, e.g. 127.0.0.1:8765")
+    parser.add_argument("--hr", action="store_true", help="Connect the HR strap")
+    parser.add_argument("--treadmill", action="store_true", help="Connect the treadmill")
+    parser.add_argument("--benchmark", type=int, metavar="SUBSCRIBERS", help="Benchmark fan-out instead")
+    parser.add_argument("--samples", type=int, default=100_000)
+    parser.add_argument("--slow", type=int, default=1, help="Benchmark subscribers that never read")
+    args = parser.parse_args(argv)
+
+    async def main():
+        if args.benchmark:
+            await benchmark(args.benchmark, args.samples, args.slow)
+            return
+        server = TelemetryServer(["hr", "treadmill"])
+        await server.listen_unix(args.unix or DEFAULT_SOCKET_PATH)
+        if args.tcp:
+            host, port = args.tcp.rsplit(":", 1)
+            await server.listen_tcp(host, int(port))
+        try:
+            await serve_sensors(server, args.hr or not args.treadmill, args.treadmill)
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    cli()
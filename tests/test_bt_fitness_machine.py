@@ -0,0 +1,18 @@
+import pytest
+
+from bt_fitness_machine import parse_machine_status
+
+
+def test_targeted_distance_is_uint24():
+    status = parse_machine_status(bytes([0x0D, 0x40, 0x42, 0x0F]))  # 1 000 000 m
+    assert status.name == "Targeted Distance Changed"
+    assert status.value == 1_000_000
+
+
+def test_targeted_distance_missing_parameter():
+    with pytest.raises(ValueError):
+        parse_machine_status(bytes([0x0D, 0x40, 0x42]))
+
+
+def test_target_speed_changed():
+    assert parse_machine_status(bytes([0x05, 0xE8, 0x03])).value == pytest.approx(10.0)
@@ -0,0 +1,16 @@
+import pytest
+
+from bt_heart_rate import FLAG_HR_UINT16, parse_hr_data, parse_hr_measurement
+
+
+def test_parse_hr_data_matches_the_full_parser():
+    for packet in (bytes([0x00, 72]), bytes([FLAG_HR_UINT16, 0x2C, 0x01]), bytes([0x16, 150, 0x00, 0x04])):
+        assert parse_hr_data(packet) == parse_hr_measurement(packet).hr
+
+
+@pytest.mark.parametrize("packet", [b"", bytes([0x00]), bytes([FLAG_HR_UINT16, 0x2C])])
+def test_short_packets_are_rejected(packet):
+    with pytest.raises(ValueError):
+        parse_hr_data(packet)
+    with pytest.raises(ValueError):
+        parse_hr_measurement(packet)
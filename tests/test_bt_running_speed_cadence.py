@@ -0,0 +1,28 @@
+import math
+
+import pytest
+
+from bt_running_speed_cadence import RSCColumns, decode_many, decode_rsc_measurement, parse_rsc_measurement
+from fake_ble import encode_rsc_measurement
+
+
+def test_round_trip_through_the_simulator_encoder():
+    packet = encode_rsc_measurement(3.0, 170, stride_length_m=1.05, total_distance_m=1000.0)
+    measurement = decode_rsc_measurement(packet)
+    assert measurement.speed_m_per_s == pytest.approx(3.0, abs=1 / 256)
+    assert measurement.cadence == 170
+    assert measurement.stride_length_m == pytest.approx(1.05)
+    assert measurement.total_distance_m == pytest.approx(1000.0)
+    assert parse_rsc_measurement(packet)["total_distance_m"] == pytest.approx(1000.0)
+    columns = decode_many([packet])
+    assert columns.total_distance_m[0] == pytest.approx(1000.0)
+    assert columns.stride_length_m[0] == pytest.approx(1.05)
+
+
+def test_reused_columns_clear_absent_fields():
+    columns = RSCColumns.allocate(2)
+    decode_many([encode_rsc_measurement(3.0, 170, 1.2, 1.0)] * 2, columns)
+    decode_many([encode_rsc_measurement(3.0, 170), encode_rsc_measurement(3.0, 170, total_distance_m=5.0)], columns)
+    assert math.isnan(columns.stride_length_m[0]) and math.isnan(columns.stride_length_m[1])
+    assert math.isnan(columns.total_distance_m[0])
+    assert columns.total_distance_m[1] == pytest.approx(5.0)
@@ -0,0 +1,31 @@
+import asyncio
+from types import SimpleNamespace
+
+from discovery import DiscoveryService
+
+
+class Scanner:
+    def __init__(self, callback, service_uuids):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+def test_find_after_every_device_was_evicted():
+    now = [0.0]
+
+    async def main():
+        discovery = DiscoveryService(scanner_factory=Scanner, clock=lambda: now[0], max_age=30)
+        strap = SimpleNamespace(address="F0:00:00:00:00:01", name="Polar H10")
+        discovery.detection_callback(strap, SimpleNamespace(rssi=-60))
+        assert (await discovery.find(0.1)).address == strap.address
+        now[0] = 60.0
+        discovery.evict()
+        assert not discovery.devices
+        return await discovery.find(0.05)
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,49 @@
+import asyncio
+
+import bt_fitness_machine
+from ftms_control import ControlPoint
+
+
+class Client:
+    """Acknowledges every Control Point write with Success; the first `failures` writes raise OSError."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+        self.indicate = None
+
+    async def start_notify(self, uuid, callback):
+        self.indicate = callback
+
+    async def stop_notify(self, uuid):
+        pass
+
+    async def write_gatt_char(self, uuid, payload, response=True):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("link lost")
+        self.written.append(bytes(payload))
+        asyncio.get_running_loop().call_soon(
+            self.indicate, None, bytes([bt_fitness_machine.CONTROL_RESPONSE_CODE, payload[0],
+                                        bt_fitness_machine.RESULT_SUCCESS]))
+
+
+def test_failed_write_does_not_stop_the_sender():
+    async def main():
+        client = Client(failures=1)
+        control = ControlPoint(client, timeout=0.2)
+        await control.start()
+        control.has_control = True
+        control.set_target_speed(10.0)
+        control.set_target_incline(2.0)
+        await control.settled()
+        assert isinstance(control.last_error, OSError)
+        assert control._pending is None
+        assert control.sent_targets == {bt_fitness_machine.CONTROL_SET_TARGET_INCLINATION: 2.0}
+        await control.request_control()  # Later commands still go through
+        await control.close()
+        return client
+
+    client = asyncio.run(main())
+    assert [payload[0] for payload in client.written] == [bt_fitness_machine.CONTROL_SET_TARGET_INCLINATION,
+                                                         bt_fitness_machine.CONTROL_REQUEST_CONTROL]
@@ -0,0 +1,68 @@
+import math
+import random
+
+import pytest
+
+import telemetry
+from fusion import HOLD, LINEAR, Stream, StreamingAligner, align, resample
+
+np = pytest.importorskip("numpy")
+
+
+def test_resample_empty_stream():
+    assert np.isnan(resample([], [], np.arange(3.0), HOLD)).all()
+    assert np.isnan(resample([], [], np.arange(3.0), LINEAR)).all()
+
+
+def test_hold_edges():
+    grid = np.array([0.0, 1.0, 1.5, 3.0, 6.0, 6.5])
+    held = resample([1.0, 1.0, 3.0], [10.0, 11.0, 30.0], grid, HOLD, max_gap=3.0)
+    # Before the first sample: NaN. Ties keep the last. A hold of exactly max_gap still counts.
+    assert np.array_equal(held, [np.nan, 11.0, 11.0, 30.0, 30.0, np.nan], equal_nan=True)
+
+
+def test_linear_edges():
+    grid = np.array([0.0, 1.0, 2.0, 3.0, 4.0, 10.0, 12.0, 13.0])
+    values = resample([1.0, 3.0, 10.0], [10.0, 30.0, 100.0], grid, LINEAR, max_gap=5.0)
+    # Exact hits keep their sample even beside a gap wider than max_gap, and nothing is extrapolated
+    assert np.array_equal(values, [np.nan, 10.0, 20.0, 30.0, np.nan, 100.0, np.nan, np.nan], equal_nan=True)
+
+
+def test_align_grid_and_missing_streams():
+    frame = align({telemetry.HR: ([0.4, 1.0, 2.7], [100.0, 101.0, 102.0])},
+                  [Stream(telemetry.HR, HOLD, offset=1.0), Stream(telemetry.SPEED, LINEAR)], step=0.5)
+    assert frame.timestamps.tolist() == [1.5, 2.0, 2.5, 3.0, 3.5]
+    assert frame.columns[telemetry.HR].tolist() == [100.0, 101.0, 101.0, 101.0, 101.0]  # 3.7 s is past the grid
+    assert np.isnan(frame.columns[telemetry.SPEED]).all()
+    empty = align({}, [Stream(telemetry.HR)])
+    assert len(empty.timestamps) == 0 and len(empty.columns[telemetry.HR]) == 0
+    with pytest.raises(ValueError):
+        align({}, [Stream(telemetry.HR, "cubic")])
+
+
+def test_streaming_aligner_matches_align():
+    rng = random.Random(20)
+    streams = [Stream(telemetry.HR, HOLD, offset=-0.3), Stream(telemetry.SPEED, LINEAR)]
+    hr = telemetry.Channel(telemetry.HR, capacity=64)
+    speed = telemetry.Channel(telemetry.SPEED, capacity=64)
+    aligner = StreamingAligner(streams, step=1.0)
+    events = [(1000.0 + i + rng.uniform(-0.2, 0.2), hr, 120 + i % 40) for i in range(300)
+              if not 100 <= i < 110]  # The strap drops out for ten seconds
+    events += [(1000.5 + i / 4, speed, 8 + 4 * math.sin(i / 50)) for i in range(1200)]
+    events.sort(key=lambda event: event[0])
+    rows = []
+    for start in range(0, len(events), 7):  # Pull every few notifications, as the UI does
+        for t, channel, value in events[start:start + 7]:
+            channel.append(value, t)
+        rows += aligner.pull(hr, speed)
+
+    sources = {telemetry.HR: ([t for t, c, _ in events if c is hr], [v for _, c, v in events if c is hr]),
+               telemetry.SPEED: ([t for t, c, _ in events if c is speed], [v for _, c, v in events if c is speed])}
+    frame = align(sources, streams, step=1.0)
+    assert len(rows) > 250
+    times = np.array([t for t, _ in rows])
+    assert np.array_equal(times, frame.timestamps[:len(rows)])
+    for column, stream in enumerate(streams):
+        streamed = np.array([values[column] for _, values in rows])
+        assert np.allclose(streamed, frame.columns[stream.name][:len(rows)], equal_nan=True)
+    assert np.isnan(np.array([values[0] for _, values in rows])[(times > 1106) & (times < 1109)]).all()
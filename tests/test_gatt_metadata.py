@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import gatt_metadata
+
+from gatt_metadata import DEVICE_INFORMATION_FIELDS, MetadataCache, read_metadata
+
+ADDRESS = "F0:00:00:00:00:01"
+FIELDS = {field.name: field for field in DEVICE_INFORMATION_FIELDS}
+
+
+class Client:
+    """Exposes Manufacturer Name, Model Number and Battery Level; fails reads listed in `failing`."""
+
+    def __init__(self, battery=80, failing=()):
+        self.values = {FIELDS["Manufacturer Name"].uuid: b"Polar",
+                       FIELDS["Model Number"].uuid: b"H10",
+                       FIELDS["Battery Level"].uuid: bytes([battery])}
+        self.failing = {FIELDS[name].uuid for name in failing}
+        self.reads = []
+        self.services = SimpleNamespace(get_characteristic=lambda uuid: uuid if uuid in self.values else None)
+
+    async def read_gatt_char(self, uuid):
+        self.reads.append(uuid)
+        if uuid in self.failing:
+            raise OSError("read failed")
+        return self.values[uuid]
+
+
+def read(client, cache):
+    return asyncio.run(read_metadata(client, ADDRESS, DEVICE_INFORMATION_FIELDS, cache))
+
+
+def test_failed_read_is_retried_on_the_next_connect(tmp_path):
+    cache = MetadataCache(str(tmp_path / "metadata.json"))
+    values, cached = read(Client(failing=["Model Number"]), cache)
+    assert values["Manufacturer Name"] == "Polar" and values["Model Number"] is None
+    assert not cached
+
+    client = Client()
+    values, cached = read(client, cache)
+    assert values["Model Number"] == "H10"
+    assert FIELDS["Model Number"].uuid in client.reads
+    assert FIELDS["Manufacturer Name"].uuid not in client.reads
+
+
+def test_battery_level_is_read_every_connect(tmp_path):
+    cache = MetadataCache(str(tmp_path / "metadata.json"))
+    read(Client(battery=80), cache)
+    client = Client(battery=55)
+    values, cached = read(client, cache)
+    assert values["Battery Level"] == 55
+    assert client.reads == [FIELDS["Battery Level"].uuid]
+    assert "Battery Level" not in MetadataCache(cache.path).entries[ADDRESS]["values"]
+
+
+def test_background_failures_are_reported():
+    errors = []
+
+    async def fail():
+        raise OSError("disconnected")
+
+    async def main():
+        task = gatt_metadata.run_in_background(fail(), errors.append)
+        assert task in gatt_metadata._background
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert task not in gatt_metadata._background
+
+    asyncio.run(main())
+    assert [type(error) for error in errors] == [OSError]
+
+
+def test_malformed_field_does_not_lose_the_others(tmp_path):
+    client = Client()
+    client.values[FIELDS["Battery Level"].uuid] = b""  # parse_battery_level raises IndexError
+    values, _ = read(client, MetadataCache(str(tmp_path / "metadata.json")))
+    assert values["Manufacturer Name"] == "Polar" and values["Model Number"] == "H10"
+    assert values["Battery Level"] is None
@@ -0,0 +1,52 @@
+import math
+import random
+
+import pytest
+
+from hrv import HRVStream, hrv_series
+
+
+def test_metrics_by_hand():
+    stream = HRVStream(window=10)
+    stream.extend([800, 850, 800, 900])
+    differences = [50, -50, 100]
+    assert stream.rmssd == pytest.approx(math.sqrt(sum(d * d for d in differences) / 3))
+    assert stream.pnn50 == pytest.approx(100 / 3)  # Only |100| is over 50 ms
+    mean = sum([800, 850, 800, 900]) / 4
+    assert stream.sdnn == pytest.approx(math.sqrt(sum((rr - mean) ** 2 for rr in [800, 850, 800, 900]) / 3))
+
+
+def test_artifacts_break_the_difference_chain():
+    stream = HRVStream(window=10)
+    assert stream.add(800)
+    assert not stream.add(1600)  # Missed beat
+    assert not stream.add(800)   # Too far from the rejected interval before it
+    assert stream.add(820)
+    assert (stream.accepted, stream.rejected) == (2, 2)
+    assert stream.rmssd is None  # 800 and 820 were not consecutive beats
+
+
+def test_streaming_matches_batch():
+    np = pytest.importorskip("numpy")
+    rng = random.Random(13)
+    rr = [850 + 60 * math.sin(i / 40) + rng.gauss(0, 25) for i in range(3000)]
+    for i in rng.sample(range(len(rr)), 30):
+        rr[i] *= rng.choice((0.5, 2.0))  # Ectopic and missed beats
+    for window in (2, 25, 300):
+        stream = HRVStream(window)
+        streamed = []
+        for value in rr:
+            accepted = stream.add(value)
+            streamed.append((accepted, *(np.nan if v is None else v for v in stream.snapshot())))
+        streamed = np.array(streamed)
+        batch = hrv_series(rr, window)
+        assert np.array_equal(streamed[:, 0].astype(bool), batch.accepted)
+        # Tiny SDNNs over two beats come from cancelling sums of squares; a nanosecond is plenty
+        for column, values in zip((1, 2, 3), (batch.rmssd, batch.sdnn, batch.pnn50)):
+            assert np.allclose(streamed[:, column], values, rtol=1e-9, atol=1e-6, equal_nan=True)
+
+
+def test_batch_of_nothing():
+    pytest.importorskip("numpy")
+    series = hrv_series([])
+    assert len(series.accepted) == len(series.rmssd) == 0
@@ -0,0 +1,46 @@
+from instrumentation import RELEARN_GAPS, Instrumentation
+
+
+def test_rate_change_is_relearned():
+    stats = Instrumentation().notification("rsc")
+    now = 1_000_000_000
+    for _ in range(50):  # 10 Hz
+        now += 100_000_000
+        stats.arrived(now)
+    for _ in range(20):  # Then 4 Hz for good
+        now += 250_000_000
+        stats.arrived(now)
+    assert stats.gaps == RELEARN_GAPS
+    assert stats.missed == 2 * RELEARN_GAPS
+    assert stats.expected_interval == 250_000_000
+
+
+def test_isolated_gap_keeps_the_interval():
+    stats = Instrumentation().notification("hr")
+    now = 1_000_000_000
+    for i in range(30):
+        now += 1_000_000_000 * (3 if i == 15 else 1)
+        stats.arrived(now)
+    assert (stats.gaps, stats.missed) == (1, 2)
+    assert stats.expected_interval == 1_000_000_000
+
+
+def test_handler_arrivals_are_analysed_on_snapshot():
+    registry = Instrumentation()
+    handler = registry.handler("hr", lambda sender, data: None)
+    for _ in range(5):
+        handler(None, b"")
+    snapshot = registry.snapshot()["notifications"]["hr"]
+    assert snapshot["samples"] == 5
+    assert registry.notifications["hr"].cursor == 5
+
+
+def test_decode_timing_is_opt_in():
+    def parse(data):
+        return len(data)
+
+    assert Instrumentation(decode_timing=False).timed("hr.decode", parse) is parse
+    registry = Instrumentation(decode_timing=True)
+    timed = registry.timed("hr.decode", parse)
+    assert timed(b"\x00\x48") == 2
+    assert registry.histograms["hr.decode"].count == 1
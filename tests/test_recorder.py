@@ -0,0 +1,27 @@
+import asyncio
+
+import bt_heart_rate
+import telemetry
+from fake_ble import encode_hr_measurement
+from recorder import Recorder, replay, telemetry_handlers
+
+
+def test_flat_out_replay_keeps_recorded_timestamps(tmp_path):
+    path = str(tmp_path / "session.trlog")
+    log = Recorder(path)
+    for i in range(600):  # Ten minutes at 1 Hz
+        log.record("F0:00:00:00:00:01", bt_heart_rate.measurement_uuid(),
+                   encode_hr_measurement(120 + i % 30, rr_intervals_ms=[500]), 1000.0 + i)
+    log.close()
+
+    store = telemetry.TelemetryStore()
+    count = asyncio.run(replay(path, telemetry_handlers(store), speed=0, timestamps=True))
+    hr = store[telemetry.HR]
+    timestamps, values = hr.history()
+    assert count == 600
+    assert timestamps[0] == 1000.0 and timestamps[-1] == 1599.0
+    assert values[0] == 120
+    assert store[telemetry.RR].latest_timestamp == 1599.0
+    # Rolling windows and zone time follow the recorded timeline, not the replay's
+    assert hr.windows[60].size(hr.count) == 61
+    assert abs(sum(hr.time_in_zone()) - 599.0) < 1e-9
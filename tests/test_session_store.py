@@ -0,0 +1,78 @@
+import pytest
+
+import telemetry
+from session_store import MINUTE_COLUMNS, SessionStore, rollup
+
+HR = telemetry.CHANNEL_IDS[telemetry.HR]
+SPEED = telemetry.CHANNEL_IDS[telemetry.SPEED]
+DISTANCE = telemetry.CHANNEL_IDS[telemetry.DISTANCE]
+INCLINE = telemetry.CHANNEL_IDS[telemetry.INCLINE]
+START = 1_800_000_000.0
+
+
+def test_distance_and_climb_are_integrated_from_speed():
+    rows = [(START, INCLINE, 5.0)] + [(START + i, SPEED, 12.0) for i in range(120)]
+    minutes, summary = rollup(rows)
+    # 119 one-second intervals at 12 km/h; each is credited to the minute it ends in
+    assert summary["distance_m"] == pytest.approx(119 * 12 / 3.6)
+    assert summary["elevation_gain_m"] == pytest.approx(summary["distance_m"] * 0.05)
+    distance = MINUTE_COLUMNS.index("distance_m")
+    assert [row[distance] for row in minutes] == pytest.approx([59 * 12 / 3.6, 60 * 12 / 3.6])
+    assert summary["duration_s"] == 119
+    assert summary["pace_min_per_km"] == pytest.approx(119 / 60 / (summary["distance_m"] / 1000))
+
+
+def test_reported_distance_replaces_integrated_distance():
+    rows = []
+    for i in range(120):
+        rows.append((START + i, SPEED, 12.0))
+        if i >= 30:  # The treadmill starts reporting half a minute in, 3 m/s
+            rows.append((START + i, DISTANCE, 500.0 + 3 * (i - 30)))
+    minutes, summary = rollup(rows)
+    assert summary["distance_m"] == pytest.approx(3 * 89)
+    distance = MINUTE_COLUMNS.index("distance_m")
+    assert [row[distance] for row in minutes] == pytest.approx([3 * 29, 3 * 60])
+
+
+def test_reported_distance_reset_is_not_counted_backwards():
+    rows = [(START + i, DISTANCE, value) for i, value in enumerate([100.0, 110.0, 0.0, 10.0])]
+    assert rollup(rows)[1]["distance_m"] == 20.0
+
+
+def test_zone_time_skips_gaps():
+    zones = (120, 150)
+    hr = [(0, 100), (1, 100), (2, 130), (3, 130), (4, 160), (4 + telemetry.MAX_ZONE_GAP_S + 1, 100), (13, 100)]
+    _, summary = rollup([(START + t, HR, value) for t, value in hr], zones)
+    # The interval after 160 bpm is a dropped link: no zone gets it
+    assert [summary[f"zone{zone}_s"] for zone in range(3)] == [2 + 3, 2, 0]
+    assert summary["max_hr"] == 160
+
+
+def test_empty_session():
+    minutes, summary = rollup([])
+    assert minutes == []
+    assert summary["duration_s"] == 0.0 and summary["distance_m"] == 0.0
+    assert summary["pace_min_per_km"] is None
+
+
+def test_sessions_are_written_by_the_writer_thread(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    live = telemetry.TelemetryStore()
+    first = store.start("F0:00:00:00:00:03", "treadmill", started=START)
+    second = store.start("F0:00:00:00:00:01", "hr", started=START + 60)
+    assert (first.id, second.id) == (1, 2)
+    for i in range(10):
+        live.append(telemetry.SPEED, 12.0, 100.0 + i)
+    first.pull(live)
+    first.close()
+    assert store.sync(5)
+    assert store.errors == 0
+    row = store.session(first.id)
+    assert (row["kind"], row["started_at"], row["samples"]) == ("treadmill", START, 10)
+    assert store.session(second.id)["ended_at"] is None
+    store.close()
+
+    reopened = SessionStore(path)
+    assert reopened.start("F0:00:00:00:00:03", "treadmill").id == 3
+    reopened.close()
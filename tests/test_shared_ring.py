@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from shared_ring import SharedRing
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRing.create(f"treadmill-app-test-{os.getpid()}", capacity=8)
+    yield ring
+    ring.close()
+
+
+def test_read_array_matches_read_across_wrap_and_overrun(ring):
+    reader = SharedRing.attach(ring.name)
+    cursor = 0
+    for batch in (3, 5, 7, 20):  # 20 overruns the 8-slot ring
+        for _ in range(batch):
+            ring.write(float(ring.written), ring.written % 3, ring.written * 10.0)
+        samples, expected_cursor, expected_lost = reader.read(cursor)
+        rows, cursor, lost = reader.read_array(cursor)
+        assert (cursor, lost) == (expected_cursor, expected_lost)
+        assert rows.tolist() == [list(sample) for sample in samples]
+    assert lost == 12
+    reader.close()
+
+
+def test_dashboard_keeps_the_latest_value_per_channel(ring):
+    from gym import GymDashboard, GymDevice
+
+    dashboard = GymDashboard([GymDevice("Treadmill", "F2:00:00:00:00:00", "treadmill", ring.name)])
+    for t, channel, value in [(1.0, 2, 10.0), (1.0, 3, 170.0), (2.0, 2, 10.5), (3.0, 5, 1.0), (4.0, 2, 11.0)]:
+        ring.write(t, channel, value)
+    assert dashboard.poll() == 5
+    assert dashboard.views[0].latest == {2: 11.0, 3: 170.0, 5: 1.0}
+    assert dashboard.poll() == 0
+    dashboard.close()
@@ -0,0 +1,45 @@
+import random
+from bisect import bisect_right
+
+from telemetry import MAX_ZONE_GAP_S, Channel
+
+
+def test_window_stats_match_a_scan_across_ring_wrap():
+    rng = random.Random(4)
+    capacity = 16
+    channel = Channel("hr", capacity=capacity, windows=(5, 60))
+    samples = []
+    t = 0.0
+    for _ in range(10 * capacity):  # The ring wraps ten times; the 60 s window is capped by the ring
+        t += rng.choice((0.5, 1.0, 1.0, 2.0))
+        value = rng.randint(90, 190)
+        channel.append(value, t)
+        samples.append((t, value))
+        kept = samples[-capacity:]
+        for seconds in (5, 60):
+            window = [v for ts, v in kept if ts >= t - seconds]
+            assert channel.min(seconds) == min(window)
+            assert channel.max(seconds) == max(window)
+            assert abs(channel.mean(seconds) - sum(window) / len(window)) < 1e-9
+    assert len(channel) == capacity
+    timestamps, values = channel.history()
+    assert list(values) == [v for _, v in samples[-capacity:]]
+    assert list(timestamps) == [ts for ts, _ in samples[-capacity:]]
+
+
+def test_time_in_zone_survives_ring_wrap_and_skips_gaps():
+    zones = (120, 150)
+    channel = Channel("hr", capacity=8, zones=zones)
+    expected = [0.0] * (len(zones) + 1)
+    t = 0.0
+    previous = None
+    for i in range(100):
+        step = MAX_ZONE_GAP_S + 1 if i % 25 == 24 else 1.0  # A dropped link now and then
+        t += step
+        value = (100, 130, 170)[i % 3]
+        if previous is not None and step <= MAX_ZONE_GAP_S:
+            expected[bisect_right(zones, previous)] += step
+        channel.append(value, t)
+        previous = value
+    assert channel.time_in_zone() == expected
+    assert sum(expected) == 99 - 4  # 99 intervals, four of them gaps
@@ -0,0 +1,25 @@
+import asyncio
+
+import telemetry
+from telemetry_server import TelemetryClient, TelemetryServer
+
+
+def test_close_cancels_subscriber_tasks(tmp_path):
+    async def main():
+        server = TelemetryServer(["hr"])
+        path = str(tmp_path / "telemetry.sock")
+        await server.listen_unix(path)
+        client = TelemetryClient(path)
+        await client.connect()
+        server.publish(0, telemetry.HR, 120.0, 1.0)
+        sample = await anext(aiter(client))
+        while not server.subscribers:
+            await asyncio.sleep(0)
+        task = server.subscribers[0].task
+        await server.close()
+        await client.close()
+        return sample, task
+
+    sample, task = asyncio.run(main())
+    assert sample.value == 120.0
+    assert task.cancelled()
@@ -1,87 +1,231 @@
+import argparse
 import asyncio
-from bleak import BleakScanner, BleakClient
-from bleak.uuids import normalize_uuid_str
+import functools
+import time
 from rich.console import Console
 from rich.tree import Tree
-from rich import print
 from rich.panel import Panel
 from rich.live import Live
+import ble_backend
+import bt_fitness_machine
 import bt_running_speed_cadence
-import bt_user_data
-
-FITNESS_MACHINE_SERVICE_UUID = "1826"
-FITNESS_MACHINE_FEATURE_CHARACTERISTIC_UUID = "2acc"
-FITNESS_MACHINE_TREADMILL_DATA_CHARACTERISTIC_UUID = "2acd"
-FITNESS_MACHINE_CONTROL_POINT_CHARACTERISTIC_UUID = "2ad9"
-FITNESS_MACHINE_STATUS_CHARACTERISTIC_UUID = "2ada"
-FITNESS_MACHINE_TRAINING_STATUS_CHARACTERISTIC_UUID = "2ad3"
-FITNESS_MACHINE_SUPPORTED_SPEED_RANGE_CHARACTERISTIC_UUID = "2ad4"
-FITNESS_MACHINE_SUPPORTED_INCLINATION_RANGE_CHARACTERISTIC_UUID = "2ad5"
+import derived
+import ftms_control
+import gatt_metadata
+import instrumentation
+import recorder
+import telemetry
+from discovery import KnownDeviceCache, connect_target, find_device
+from session_store import DEFAULT_ATHLETE, SessionStore, describe
+from trend import Trend, TrendCanvas
+from ui_scheduler import UpdateScheduler
 
 
 console = Console()
+known_devices = KnownDeviceCache()
+metadata_cache = gatt_metadata.MetadataCache()
+stats = instrumentation.registry
+decode_rsc_measurement = stats.timed("rsc.decode", bt_running_speed_cadence.decode_rsc_measurement)
 
 
-async def discover_devices():
-    found_device = None
-    discovered_devices = []
-
-    async def detection_callback(device, advertisement_data):
-        nonlocal found_device
-        nonlocal discovered_devices
-
-        if device.address not in [d.address for d in discovered_devices]:
-            console.print(
-                f"[{len(discovered_devices)}] [dim]Device:[/] [bold magenta]{device.name}[/] [dim]RSSI:[/] [bold green]{advertisement_data.rssi}[/] [dim]Address:[/] {device.address}")
-            discovered_devices.append(device)
-
-        found_device = device
-        await scanner.stop()
-
-    scanner = BleakScanner(detection_callback, [normalize_uuid_str(FITNESS_MACHINE_SERVICE_UUID)])
+async def discover_devices(workout=None, athlete=DEFAULT_ATHLETE):
+    def device_discovered(entry):
+        console.print(
+            f"[{entry.index}] [dim]Device:[/] [bold magenta]{entry.name}[/] [dim]RSSI:[/] [bold green]{entry.rssi:.0f}[/] [dim]Address:[/] {entry.address}")
 
     with console.status("[bold green]Scanning for Treadmill...") as status:
-        await scanner.start()
-        while not found_device:
-            await asyncio.sleep(1)
+        found_device = await find_device(bt_fitness_machine.service_uuid(), known_devices, device_discovered)
 
-    async with BleakClient(found_device) as client:
+    try:
+        await connect(found_device, workout, athlete)
+    except ble_backend.device_not_found_error():
+        console.print(f"[dim]Last treadmill {found_device.address} not found, scanning...[/]")
+        known_devices.forget(bt_fitness_machine.service_uuid())
+        await discover_devices(workout, athlete)
 
-        services = client.services
-        services_tree = Tree(f"Sensor: {found_device.name}")
-        for service in services:
-            if service.uuid == bt_user_data.service_uuid():
-                child_tree = services_tree.add(f"Service: {service.description}")
-                for characteristic in service.characteristics:
-                    value = await client.read_gatt_char(characteristic.uuid)
-                    display_value = ""
-                    if characteristic.uuid == bt_user_data.weight_uuid():
-                        display_value = f"{bt_user_data.parse_weight(value)} kg"
-                    elif characteristic.uuid == bt_user_data.age_uuid():
-                        display_value = bt_user_data.parse_age_data(value)
-                    elif characteristic.uuid == bt_user_data.gender_uuid():
-                        display_value = bt_user_data.parse_gender(value)
-                    child_tree.add(f"{characteristic.description}: {display_value}")
-
-        print(services_tree)
-
-        panel = Panel(f"\n  [cyan]---", title=f"Speed & Cadence", width=30, height=10)
 
-        def running_speed_and_cadence_handler(sender, data):
-            result = bt_running_speed_cadence.parse_rsc_measurement(data)
-
-            text = f"\n  Speed:    [cyan]{result['speed_kmh']:.2f}[/] km/h" + \
-                   f"\n  Pace:     [cyan]{result['pace']:.2f}[/] min/km" + \
-                   f"\n  Distance: [cyan]{result.get('total_distance_km', 0):.2f}[/] km"
+async def connect(found_device, workout=None, athlete=DEFAULT_ATHLETE):
+    connect_started = time.monotonic()
+    async with ble_backend.client(connect_target(found_device)) as client:
 
+        services = client.services
+        first_sample = None
+
+        def metadata_ready(values, cached):
+            services_tree = Tree(f"Sensor: {found_device.name}")
+            for service, items in gatt_metadata.group_by_service(gatt_metadata.USER_DATA_FIELDS, values).items():
+                child_tree = services_tree.add(f"Service: {service}")
+                for name, value in items.items():
+                    child_tree.add(f"{name}: {value}")
+            console.print(services_tree)
+            graph.set_profile(derived.UserProfile.from_metadata(values))
+            console.log(f"User data {'from cache' if cached else 'read'} after {time.monotonic() - connect_started:.2f} s")
+
+        panel = Panel(f"\n  [cyan]---", title=f"Speed & Cadence", width=30, height=14)
+        store = telemetry.TelemetryStore()
+        log = recorder.session_recorder("treadmill")
+        ui = UpdateScheduler(rate=4)
+        sessions = SessionStore()
+        session = sessions.start(found_device.address, "treadmill", athlete)
+        ui.before_flush(functools.partial(session.pull, store))
+
+        # Derived metrics are computed once per frame, and only those the panel shows
+        graph = derived.metric_graph(store)
+        graph.node("average_speed", (telemetry.SPEED,), lambda speed: speed.mean(60))
+        graph.node("distance_km", (telemetry.DISTANCE, derived.INTEGRATED_DISTANCE),
+                   lambda reported, integrated: reported.latest / 1000 if reported.count else integrated)
+        for metric in ("average_speed", derived.PACE, "distance_km"):
+            graph.subscribe(metric, functools.partial(ui.publish, metric))
+        ui.before_flush(graph.refresh)
+
+        # Speed over the last 5 minutes, one column per bucket
+        speed_trend = Trend(26, span=300)
+        speed_canvas = TrendCanvas(3, step=1)
+
+        def render(changed):
+            latest = ui.latest
+            text = ""
+            if speed_trend.pull(store[telemetry.SPEED]):
+                speed_canvas.draw(speed_trend)
+            if "speed" in latest:
+                text += f"\n  Speed:    [cyan]{latest['speed']:.2f}[/] km/h" + \
+                        f"\n  Avg 1m:   [cyan]{latest['average_speed']:.2f}[/] km/h" + \
+                        f"\n  Pace:     [cyan]{latest['pace']:.2f}[/] min/km" + \
+                        f"\n  Distance: [cyan]{latest['distance_km']:.2f}[/] km"
+            if "incline" in latest:
+                text += f"\n  Incline:  [cyan]{latest['incline']:.1f}[/] %"
+            if "climb" in latest:
+                text += f"\n  Climb:    [cyan]{latest['climb']:.1f}[/] m"
+            if speed_canvas.scale is not None:
+                text += "\n\n" + "\n".join(f"[cyan]{line}[/]" for line in speed_canvas.lines())
             panel.renderable = text
 
-        with Live(panel, refresh_per_second=4):
-            await client.start_notify(bt_running_speed_cadence.MEASUREMENT_CHARACTERISTIC_UUID,
-                                      running_speed_and_cadence_handler)
-            await asyncio.sleep(300)  # Keep receiving notifications for 30 seconds
+        ui.on_frame(render)
+
+        def running_speed_and_cadence_handler(sender, data):
+            nonlocal first_sample
+            now = time.monotonic()
+            if first_sample is None:
+                first_sample = now - connect_started
+                console.log(f"Time to first sample: {first_sample:.2f} s")
+            log.record(found_device.address, bt_running_speed_cadence.measurement_uuid(), data, now)
+            result = decode_rsc_measurement(data)
+            store.append(telemetry.SPEED, result.speed_kmh, now)
+            store.append(telemetry.CADENCE, result.cadence, now)
+            if result.total_distance_m is not None:
+                store.append(telemetry.DISTANCE, result.total_distance_m, now)
+
+            ui.publish("speed", result.speed_kmh)
+
+        def treadmill_data_handler(sender, data):
+            log.record(found_device.address, bt_fitness_machine.treadmill_data_uuid(), data)
+            result = decode_treadmill_data(data)
+            if result.inclination_pct is None:
+                return
+            store.append(telemetry.INCLINE, result.inclination_pct)
+
+            ui.publish("incline", result.inclination_pct)
+            if result.positive_elevation_gain_m is not None:
+                ui.publish("climb", result.positive_elevation_gain_m)
+
+        def machine_status_handler(sender, data):
+            log.record(found_device.address, bt_fitness_machine.status_uuid(), data)
+            status = bt_fitness_machine.parse_machine_status(data)
+            console.log(f"Machine status: {status.name}" + (f" ({status.value:g})" if status.value is not None else ""))
+
+        # Layouts are compiled on first sight until the feature bitmap arrives
+        treadmill_decoder = bt_fitness_machine.TreadmillDataDecoder()
+        decode_treadmill_data = stats.timed("treadmill.decode", lambda data: treadmill_decoder.decode(data))
+
+        async def read_feature():
+            nonlocal treadmill_decoder
+            treadmill_decoder = bt_fitness_machine.TreadmillDataDecoder.from_feature_data(
+                await client.read_gatt_char(bt_fitness_machine.feature_uuid()))
+
+        def workout_step(step, late):
+            targets = [f"{step.speed_kmh:g} km/h" if step.speed_kmh is not None else None,
+                       f"{step.inclination_pct:g} %" if step.inclination_pct is not None else None]
+            console.log(f"Workout {step.at:.0f} s: {', '.join(t for t in targets if t)} ({late * 1000:.0f} ms late)")
+
+        control = workout_task = None
+        ui_task = asyncio.create_task(ui.run())
+        try:
+            with Live(panel, refresh_per_second=4, console=console):
+                subscriptions = [client.start_notify(bt_running_speed_cadence.measurement_uuid(),
+                                                     stats.handler("rsc", running_speed_and_cadence_handler))]
+                if services.get_characteristic(bt_fitness_machine.treadmill_data_uuid()) is not None:
+                    subscriptions.append(client.start_notify(bt_fitness_machine.treadmill_data_uuid(),
+                                                             stats.handler("treadmill", treadmill_data_handler)))
+                    gatt_metadata.run_in_background(
+                        read_feature(), lambda error: console.log(f"[red]Treadmill feature read failed:[/] {error!r}"))
+                if services.get_characteristic(bt_fitness_machine.status_uuid()) is not None:
+                    subscriptions.append(client.start_notify(bt_fitness_machine.status_uuid(), machine_status_handler))
+                await asyncio.gather(*subscriptions)
+                gatt_metadata.fetch_in_background(client, found_device.address, gatt_metadata.USER_DATA_FIELDS,
+                                                  metadata_cache, metadata_ready,
+                                                  lambda error: console.log(f"[red]User data read failed:[/] {error!r}"))
+                if workout:
+                    control = ftms_control.ControlPoint(client)
+                    await control.start()
+                    workout_task = asyncio.create_task(ftms_control.run_workout(control, workout, on_step=workout_step))
+                await asyncio.sleep(300)  # Keep receiving notifications for 30 seconds
+        finally:
+            # Runs on Ctrl+C and link loss too, so the log, the session and the belt are always left in order
+            ui_task.cancel()
+            if workout_task is not None:
+                workout_task.cancel()
+            try:
+                if control is not None:
+                    await control.close()
+                    console.log(f"Control Point ack latency: mean {control.latency.mean * 1000:.0f} ms, "
+                                f"max {control.latency.maximum * 1000:.0f} ms over {control.latency.count} commands, "
+                                f"{control.superseded} targets coalesced, {control.timeouts} timeouts")
+            finally:
+                log.close()
+                try:
+                    session.pull(store)
+                    session.close()
+                    await asyncio.to_thread(sessions.sync)
+                    console.log(f"Session {describe(sessions.session(session.id))}")
+                    previous = sessions.previous(session.id)
+                    if previous is not None:
+                        console.log(f"Previous {describe(previous)}")
+                finally:
+                    sessions.close()
+                console.log(f"UI latency: mean {ui.latency.mean * 1000:.0f} ms, max {ui.latency.maximum * 1000:.0f} ms "
+                            f"over {ui.frames} frames")
+
+async def main(workout=None, athlete=DEFAULT_ATHLETE):
+    loop_watch = asyncio.create_task(stats.watch_loop())
+    try:
+        await discover_devices(workout, athlete)
+    finally:
+        loop_watch.cancel()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Show speed, cadence and incline from a treadmill.")
+    parser.add_argument("--stats", metavar="FILE", help="Write handler, jitter and loop lag stats as JSON on exit; "
+                             "set TREADMILL_DECODE_TIMING=1 to include decode times")
+    parser.add_argument("--workout", metavar="FILE", help="Drive the belt through a JSON workout plan")
+    parser.add_argument("--athlete", default=DEFAULT_ATHLETE, help="Athlete the session is stored under")
+    parser.add_argument("--intervals", metavar="WORK_KMH,REST_KMH,WORK_S,REST_S,REPEATS",
+                        help="Drive the belt through an interval workout, e.g. 14,8,60,90,6")
+    args = parser.parse_args(argv)
+    workout = None
+    if args.workout:
+        workout = ftms_control.load_workout(args.workout)
+    elif args.intervals:
+        work_kmh, rest_kmh, work_s, rest_s, repeats = args.intervals.split(",")
+        workout = ftms_control.intervals(float(work_kmh), float(rest_kmh), float(work_s), float(rest_s), int(repeats))
+    console.log("Treadmill Controller Started")
+    try:
+        asyncio.run(main(workout, args.athlete))
+    finally:
+        if args.stats:
+            stats.dump(args.stats)
+            console.log(f"Stats written to {args.stats}")
 
 
 if __name__ == "__main__":
-    console.log("Treadmill Controller Started")
-    asyncio.run(discover_devices())
+    cli()
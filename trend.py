@@ -0,0 +1,233 @@
+import math
+from typing import List, Optional, Set
+
+from telemetry import Channel
+
+# Bucket duration a whole-session trend starts with; it doubles whenever the session outgrows the width
+DEFAULT_RESOLUTION_S = 1.0
+EMPTY = (math.inf, -math.inf)
+# Quarter-height blocks would read better but are missing from many terminal fonts
+GLYPHS = {(False, False): " ", (True, False): "▀", (False, True): "▄", (True, True): "█"}
+
+
+class Trend:
+    """
+    Min/max decimation of a channel into a fixed number of columns.
+
+    Each column is a time bucket holding the lowest and highest sample that
+    fell into it, so spikes survive any amount of downsampling. With `span`
+    the trend scrolls over the last `span` seconds (buckets of span / width
+    seconds in a ring); without it the trend covers the whole session and
+    halves its resolution by merging neighbouring buckets whenever the
+    session outgrows the width. Either way a sample costs O(1) and the trend
+    holds `width` buckets however long the session runs.
+
+    Columns touched since the last take_dirty() are tracked so a renderer
+    only redraws those; `moved` is set when every column changed position
+    (the window scrolled or buckets were merged).
+    """
+    __slots__ = ("width", "span", "duration", "origin", "latest", "mins", "maxs", "dirty", "moved", "cursor")
+
+    def __init__(self, width: int, span: float = None, resolution: float = DEFAULT_RESOLUTION_S):
+        if width < 2:
+            raise ValueError("A trend needs at least 2 columns.")
+        self.width = width
+        self.span = span
+        self.duration = span / width if span else resolution
+        self.origin = None
+        self.latest = None
+        self.mins = [math.inf] * width
+        self.maxs = [-math.inf] * width
+        self.dirty: Set[int] = set()
+        self.moved = True
+        self.cursor = 0
+
+    def add(self, timestamp: float, value: float) -> None:
+        if self.span:
+            key = int(timestamp // self.duration)
+            latest = self.latest
+            if latest is None or key > latest:
+                if latest is not None:
+                    # Clear the buckets scrolling in; at most one full turn of the ring
+                    for skipped in range(max(latest + 1, key - self.width + 1), key + 1):
+                        self.mins[skipped % self.width], self.maxs[skipped % self.width] = EMPTY
+                self.latest = key
+                self.moved = True
+            elif key <= latest - self.width:
+                return  # Older than the window
+            slot = key % self.width
+        else:
+            if self.origin is None:
+                self.origin = timestamp
+            slot = int((timestamp - self.origin) // self.duration)
+            while slot >= self.width:
+                self._merge()
+                slot = int((timestamp - self.origin) // self.duration)
+            if slot < 0:
+                return
+            if self.latest is None or slot > self.latest:
+                self.latest = slot
+        if value < self.mins[slot]:
+            self.mins[slot] = value
+            self.dirty.add(slot)
+        if value > self.maxs[slot]:
+            self.maxs[slot] = value
+            self.dirty.add(slot)
+
+    def _merge(self) -> None:
+        """Halve the resolution of a whole-session trend: bucket j becomes buckets 2j and 2j+1."""
+        mins, maxs = self.mins, self.maxs
+        half = self.width // 2 + self.width % 2
+        for j in range(half):
+            pair = slice(2 * j, 2 * j + 2)
+            mins[j], maxs[j] = min(mins[pair]), max(maxs[pair])
+        for j in range(half, self.width):
+            mins[j], maxs[j] = EMPTY
+        self.duration *= 2
+        self.latest = None if self.latest is None else self.latest // 2
+        self.moved = True
+
+    def pull(self, channel: Channel) -> int:
+        """Add the channel's samples appended since the last pull; returns how many."""
+        count = channel.count
+        cursor = max(self.cursor, count - channel.capacity)
+        timestamps, values, capacity = channel.timestamps, channel.values, channel.capacity
+        add = self.add
+        for index in range(cursor, count):
+            add(timestamps[index % capacity], values[index % capacity])
+        self.cursor = count
+        return count - cursor
+
+    def column(self, slot: int) -> int:
+        """Screen column of a bucket slot: the newest bucket is rightmost when scrolling."""
+        if self.span and self.latest is not None:
+            return self.width - 1 - (self.latest - slot) % self.width
+        return slot
+
+    def bounds(self):
+        """(lowest, highest) sample over every column, or None while empty."""
+        low, high = min(self.mins), max(self.maxs)
+        return (low, high) if low <= high else None
+
+    def take_dirty(self) -> Optional[Set[int]]:
+        """Slots changed since the last call, or None if every column must be redrawn."""
+        if self.moved:
+            self.moved = False
+            self.dirty.clear()
+            return None
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
+    def resized(self, width: int) -> "Trend":
+        """The same history redistributed over `width` columns."""
+        trend = Trend(width, self.span, self.duration if not self.span else DEFAULT_RESOLUTION_S)
+        trend.cursor = self.cursor
+        if self.latest is None:
+            return trend
+        for slot in range(self.width):
+            if self.mins[slot] > self.maxs[slot]:
+                continue
+            if self.span:
+                start = (self.latest - (self.latest - slot) % self.width) * self.duration
+            else:
+                trend.origin = self.origin
+                start = self.origin + slot * self.duration
+            trend.add(start, self.mins[slot])
+            trend.add(start, self.maxs[slot])
+        return trend
+
+
+class TrendCanvas:
+    """
+    Text rendering of a Trend: one cell column per bucket, two vertical
+    steps per cell using half blocks.
+
+    draw() re-renders only the columns whose buckets changed, unless the
+    vertical scale changed or the trend moved. The scale snaps outwards to
+    multiples of `step`, so it only changes when a sample leaves the current
+    band.
+    """
+
+    def __init__(self, height: int, step: float = 1.0):
+        self.height = height
+        self.step = step
+        self.scale = None
+        self.rows: List[List[str]] = []
+
+    def _scale(self, trend: Trend):
+        bounds = trend.bounds()
+        if bounds is None:
+            return None
+        step = self.step
+        low = math.floor(bounds[0] / step) * step
+        high = math.ceil(bounds[1] / step) * step
+        return (low, high if high > low else low + step)
+
+    def draw(self, trend: Trend) -> Optional[Set[int]]:
+        """Update the rows; returns the changed screen columns, or None if all of them changed."""
+        dirty = trend.take_dirty()
+        scale = self._scale(trend)
+        if scale != self.scale or len(self.rows) != self.height or len(self.rows[0]) != trend.width:
+            self.scale = scale
+            dirty = None
+        if dirty is None:
+            self.rows = [[" "] * trend.width for _ in range(self.height)]
+            slots = range(trend.width)
+        else:
+            slots = dirty
+        changed = set()
+        for slot in slots:
+            x = trend.column(slot)
+            self._draw_column(x, trend.mins[slot], trend.maxs[slot])
+            changed.add(x)
+        return None if dirty is None else changed
+
+    def _draw_column(self, x: int, low: float, high: float) -> None:
+        rows, height = self.rows, self.height
+        if low > high or self.scale is None:
+            for row in rows:
+                row[x] = " "
+            return
+        bottom, top = self.scale
+        steps = 2 * height - 1
+        # Half-cell steps from the bottom of the canvas
+        first = min(max(round((low - bottom) / (top - bottom) * steps), 0), steps)
+        last = min(max(round((high - bottom) / (top - bottom) * steps), 0), steps)
+        for y in range(height):
+            lower = 2 * (height - 1 - y)
+            rows[y][x] = GLYPHS[first <= lower + 1 <= last, first <= lower <= last]
+
+    def lines(self) -> List[str]:
+        return ["".join(row) for row in self.rows]
+
+
+if __name__ == "__main__":
+    import timeit
+
+    import telemetry
+
+    # A 10 Hz channel drawn at 4 frames per second: frame cost after 30 s and after 3 hours
+    width, height = 120, 6
+    for span in (300, None):
+        channel = telemetry.Channel(telemetry.HR)
+        trend = Trend(width, span)
+        canvas = TrendCanvas(height, step=10)
+        elapsed = 0.0
+        cells = 0
+        frames = 0
+        for frame in range(4 * 3 * 3600):
+            for i in range(frame * 10 // 4, (frame + 1) * 10 // 4):
+                channel.append(120 + 40 * math.sin(i / 3000) + (i % 7), i / 10)
+            started = timeit.default_timer()
+            trend.pull(channel)
+            changed = canvas.draw(trend)
+            elapsed += timeit.default_timer() - started
+            cells += width * height if changed is None else len(changed) * height
+            frames += 1
+            if frame + 1 in (4 * 30, 4 * 3 * 3600):
+                label = "last 5 min" if span else "session"
+                print(f"{label:>10} after {(frame + 1) / 4 / 60:5.1f} min: {elapsed / frames * 1e6:6.1f} us/frame, "
+                      f"{cells / frames:5.1f} cells redrawn/frame")
+                elapsed, cells, frames = 0.0, 0, 0
+    print("\n".join(canvas.lines()))
@@ -0,0 +1,95 @@
+from typing import Optional
+
+from rich.segment import Segment
+from rich.style import Style
+from textual.events import Resize
+from textual.geometry import Region
+from textual.reactive import reactive
+from textual.strip import Strip
+from textual.widget import Widget
+from telemetry import Channel
+from trend import Trend, TrendCanvas
+
+AXIS_WIDTH = 6
+AXIS_STYLE = Style(dim=True)
+
+
+class TrendChart(Widget):
+    """
+    A scrolling trend of one channel: the last `span` seconds, or the whole session.
+
+    Both trends are kept from the start, so switching between them is
+    immediate. update_trend() pulls the samples appended since the previous
+    frame and repaints only the columns whose buckets changed. Nothing is
+    pulled until the chart has a size; the first pull reads the channel's
+    ring from the start.
+    """
+    session: reactive[bool] = reactive(False)
+
+    def __init__(self, channel: Channel, label: str, span: float = 300.0, step: float = 10.0, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+        self.label = label
+        self.span = span
+        self.window: Optional[Trend] = None
+        self.whole: Optional[Trend] = None
+        self.canvas = TrendCanvas(1, step)
+
+    @property
+    def trend(self) -> Trend:
+        return self.whole if self.session else self.window
+
+    def on_resize(self, event: Resize) -> None:
+        width = max(event.size.width - AXIS_WIDTH, 2)
+        if self.window is None:
+            self.window = Trend(width, self.span)
+            self.whole = Trend(width)
+        elif width != self.window.width:
+            self.window = self.window.resized(width)
+            self.whole = self.whole.resized(width)
+        self.canvas.height = max(event.size.height, 1)
+        self.update_trend(force=True)
+
+    def watch_session(self, session: bool) -> None:
+        self.update_trend(force=True)
+
+    def update_trend(self, force: bool = False) -> None:
+        """Pull new samples and repaint the changed columns; call once per UI frame."""
+        if self.window is None:
+            return
+        added = self.window.pull(self.channel) + self.whole.pull(self.channel)
+        if not added and not force:
+            return
+        trend = self.trend
+        if force:
+            trend.moved = True
+        changed = self.canvas.draw(trend)
+        if changed is None:
+            self.refresh()
+        elif changed:
+            left, right = min(changed), max(changed)
+            self.refresh(Region(AXIS_WIDTH + left, 0, right - left + 1, self.canvas.height))
+
+    def _axis(self, y: int) -> str:
+        scale = self.canvas.scale
+        last = self.canvas.height - 1
+        if y == last // 2:
+            text = self.label
+        elif scale is None:
+            text = ""
+        elif y == 0:
+            text = f"{scale[1]:g}"
+        elif y == last:
+            text = f"{scale[0]:g}"
+        else:
+            text = ""
+        return f"{text[:AXIS_WIDTH - 1]:>{AXIS_WIDTH - 1}} "
+
+    def render_line(self, y: int) -> Strip:
+        rows = self.canvas.rows
+        width = self.size.width
+        if y >= len(rows):
+            return Strip.blank(width, self.rich_style)
+        style = self.rich_style
+        return Strip([Segment(self._axis(y), style + AXIS_STYLE),
+                      Segment("".join(rows[y]), style)]).adjust_cell_length(width, style)
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List
+
+from instrumentation import Instrumentation, registry
+
+_UNSET = object()
+
+
+class LatencyStats:
+    """Running notify-to-paint latency in seconds."""
+    __slots__ = ("count", "total", "maximum", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.last = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        self.last = latency
+        if latency > self.maximum:
+            self.maximum = latency
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class UpdateScheduler:
+    """
+    Coalesces metric updates into at most one UI push per frame.
+
+    Notification handlers call publish(); only the latest value per metric is
+    kept. Every 1/rate seconds flush() hands subscribers the metrics whose value
+    actually changed since the last frame, then calls the frame callbacks once
+    with all of them, so a burst of packets costs one layout pass.
+
+    Args:
+        rate: Frames per second, e.g. 4, 10 or 30.
+        after_paint: Optional callable that runs a callback once the frame has
+            been painted (Textual's App.call_after_refresh); latency is measured
+            up to that point instead of up to the end of flush().
+        stats: Instrumentation receiving the "ui.flush" (time spent in flush())
+            and "ui.latency" (notify to paint) histograms.
+    """
+
+    def __init__(self, rate: float = 10, after_paint: Callable[[Callable], Any] = None, clock=time.monotonic,
+                 stats: Instrumentation = registry):
+        self.interval = 1 / rate
+        self.after_paint = after_paint
+        self.clock = clock
+        self.latest: Dict[str, Any] = {}
+        self.painted: Dict[str, Any] = {}
+        self.pending: Dict[str, float] = {}
+        self.subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+        self.frame_callbacks: List[Callable[[Dict[str, Any]], None]] = []
+        self.before_flush_callbacks: List[Callable[[], None]] = []
+        self.latency = LatencyStats()
+        self.flush_histogram = stats.histogram("ui.flush")
+        self.latency_histogram = stats.histogram("ui.latency")
+        self.frames = 0
+        self.skipped = 0
+
+    def publish(self, metric: str, value) -> None:
+        self.latest[metric] = value
+        if metric not in self.pending:
+            self.pending[metric] = self.clock()
+
+    def subscribe(self, metric: str, callback: Callable[[Any], None]) -> None:
+        self.subscribers.setdefault(metric, []).append(callback)
+
+    def on_frame(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self.frame_callbacks.append(callback)
+
+    def before_flush(self, callback: Callable[[], None]) -> None:
+        """Run callback at the start of every frame, e.g. to publish lazily derived metrics."""
+        self.before_flush_callbacks.append(callback)
+
+    def flush(self) -> int:
+        """Push changed metrics to subscribers; returns the number pushed."""
+        for callback in self.before_flush_callbacks:
+            callback()
+        if not self.pending:
+            return 0
+        started = time.perf_counter_ns()
+        pending = self.pending
+        self.pending = {}
+        changed = {}
+        oldest = None
+        for metric, since in pending.items():
+            value = self.latest[metric]
+            if self.painted.get(metric, _UNSET) == value:
+                self.skipped += 1
+                continue
+            self.painted[metric] = value
+            changed[metric] = value
+            for callback in self.subscribers.get(metric, ()):
+                callback(value)
+            if oldest is None or since < oldest:
+                oldest = since
+        if not changed:
+            return 0
+        for callback in self.frame_callbacks:
+            callback(changed)
+        self.frames += 1
+        self.flush_histogram.record(time.perf_counter_ns() - started)
+        if self.after_paint is not None:
+            self.after_paint(lambda: self._painted(oldest))
+        else:
+            self._painted(oldest)
+        return len(changed)
+
+    def _painted(self, oldest: float) -> None:
+        latency = self.clock() - oldest
+        self.latency.add(latency)
+        self.latency_histogram.record(int(latency * 1e9))
+
+    async def run(self) -> None:
+        """Flush once per frame until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()